@@ -31,6 +31,7 @@ from .client.api import (
     AppWidth,
     Attachment,
     BigNumber,
+    Client,
     Code,
     DataTable,
     Divider,
@@ -64,12 +65,17 @@ from .client.api import (
     builtins,
     by_datapane,
     cells_to_blocks,
+    disable_asset_cache,
+    enable_asset_cache,
     hello_world,
+    lazy_build,
     login,
     logout,
+    parallel_build,
     ping,
     save_report,
     serve,
+    serve_apps,
     template,
     upload,
 )
@@ -83,6 +89,7 @@ __all__ = [
     "HTML",
     "Attachment",
     "BigNumber",
+    "Client",
     "Code",
     "DataTable",
     "Divider",
@@ -117,6 +124,10 @@ __all__ = [
     "hello_world",
     "login",
     "logout",
+    "lazy_build",
+    "parallel_build",
+    "enable_asset_cache",
+    "disable_asset_cache",
     "ping",
     "template",
     "_setup_dp_logging",
@@ -126,6 +137,7 @@ __all__ = [
     "upload",
     "save_report",
     "serve",
+    "serve_apps",
     "build",
     "cells_to_blocks",
 ]
@@ -47,7 +47,8 @@ Additional API docs are found in `datapane.client.api.teams` that provide buildi
 import warnings
 
 from ..utils import IncompatibleVersionError
-from .common import HTTPError, Resource
+from .asset_cache import disable_asset_cache, enable_asset_cache
+from .common import Client, HTTPError, Resource
 from .dp_object import DPObjectRef
 from .ipython_utils import cells_to_blocks
 from .report.blocks import (
@@ -69,6 +70,8 @@ from .report.blocks import (
     Table,
     Text,
     Toggle,
+    lazy_build,
+    parallel_build,
 )
 from .report.core import (
     App,
@@ -81,7 +84,7 @@ from .report.core import (
     ReportWidth,
     TextAlignment,
 )
-from .report.processors import Processor, build, save_report, serve, upload
+from .report.processors import Processor, build, save_report, serve, serve_apps, upload
 from .runtime import Params, Result, _report, _reset_runtime, by_datapane
 from .teams import Environment, File, LegacyApp, Run, Schedule
 from .user import hello_world, login, logout, ping, template
@@ -97,6 +100,7 @@ __all__ = [
     "AppWidth",
     "IncompatibleVersionError",
     "builtins",
+    "Client",
     "HTTPError",
     "Resource",
     "DPObjectRef",
@@ -120,6 +124,10 @@ __all__ = [
     "Table",
     "Text",
     "Toggle",
+    "lazy_build",
+    "parallel_build",
+    "enable_asset_cache",
+    "disable_asset_cache",
     "FontChoice",
     "PageLayout",
     "Processor",
@@ -144,6 +152,7 @@ __all__ = [
     "upload",
     "save_report",
     "serve",
+    "serve_apps",
     "build",
     "cells_to_blocks",
 ]
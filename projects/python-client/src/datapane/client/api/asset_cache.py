@@ -0,0 +1,212 @@
+"""## Asset cache
+
+A persistent, content-addressed cache of the files serialised for blocks, e.g. the Arrow files for DataTables,
+so that unchanged objects aren't re-serialised each time a report script is re-run.
+
+..note:: This module is not used directly, use `dp.enable_asset_cache` instead
+"""
+import dataclasses as dc
+import hashlib
+import json
+import os
+import shutil
+import threading
+import typing as t
+from contextlib import contextmanager
+from functools import lru_cache, singledispatch
+from pathlib import Path
+from uuid import uuid4
+
+import altair as alt
+import pandas as pd
+import pyarrow as pa
+from altair.utils import SchemaBase
+
+from datapane import __version__
+from datapane.client import config as c
+from datapane.common import NPath, log
+
+from .common import DPTmpFile
+
+__all__ = ["AssetCache", "CacheStats", "enable_asset_cache", "disable_asset_cache"]
+
+T = t.TypeVar("T")
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024  # 1GB
+
+
+def default_cache_dir() -> Path:
+    """The cache directory, resolved when used so that changes to the config directory, or the env, apply"""
+    return Path(os.getenv("DATAPANE_ASSET_CACHE_DIR", c.APP_DIR / "asset-cache"))
+
+
+@lru_cache(maxsize=None)
+def lib_versions() -> str:
+    """The versions of the libraries that determine the serialised bytes of assets"""
+    return f"datapane={__version__},pandas={pd.__version__},pyarrow={pa.__version__},altair={alt.__version__}"
+
+
+################################################################################
+# Content hashing
+@singledispatch
+def content_hash(x: t.Any) -> t.Optional[str]:
+    """A fast hash of the contents of an object, or None if the object can't be cached"""
+    return None
+
+
+@content_hash.register(pd.DataFrame)
+def _(x: pd.DataFrame) -> t.Optional[str]:
+    try:
+        values = pd.util.hash_pandas_object(x, index=True).values
+    except TypeError:
+        # unhashable objects, e.g. lists, within the df
+        return None
+    h = hashlib.sha256(values.tobytes())
+    h.update(repr((list(x.columns), [str(d) for d in x.dtypes], list(x.index.names), str(x.index.dtype))).encode())
+    return h.hexdigest()
+
+
+@content_hash.register(SchemaBase)
+def _(x: SchemaBase) -> t.Optional[str]:
+    return hashlib.sha256(json.dumps(x.to_dict(), sort_keys=True).encode()).hexdigest()
+
+
+@content_hash.register(str)
+def _(x: str) -> t.Optional[str]:
+    return hashlib.sha256(x.encode()).hexdigest()
+
+
+################################################################################
+# Cache
+@dc.dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class AssetCache:
+    """
+    An on-disk cache of serialised assets, keyed by a hash of the source object and the writer used,
+    evicting the least-recently used files once over `max_size` bytes.
+    Entries are copied in and out of the cache, so changes to the files returned never affect it
+    """
+
+    def __init__(self, path: t.Optional[NPath] = None, max_size: int = DEFAULT_MAX_SIZE):
+        self.path = Path(path or default_cache_dir()).expanduser()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._size = sum(f.stat().st_size for f in self._entries())
+
+    def _entries(self) -> t.Iterator[Path]:
+        return (f for f in self.path.iterdir() if f.is_file() and not f.name.startswith("."))
+
+    @staticmethod
+    def key(x: t.Any, writer: t.Type) -> t.Optional[str]:
+        """The cache key for an object serialised by the given writer, or None if it can't be cached"""
+        x_hash = content_hash(x)
+        if x_hash is None:
+            return None
+        writer_id = f"{writer.__module__}.{writer.__qualname__}:{lib_versions()}"
+        return hashlib.sha256(f"{writer_id}:{x_hash}".encode()).hexdigest()
+
+    def get_or_write(self, key: str, ext: str, write: t.Callable[[], DPTmpFile]) -> DPTmpFile:
+        """Return a copy of the cached asset, writing and caching it first if missing"""
+        entry = self.path / f"{key}{ext}"
+        if entry.exists():
+            fn = DPTmpFile(ext)
+            try:
+                shutil.copyfile(entry, fn.file)
+                os.utime(entry)
+            except FileNotFoundError:
+                # evicted concurrently, rewrite it
+                pass
+            else:
+                with self._lock:
+                    self.stats.hits += 1
+                return fn
+
+        fn = write()
+        # write via a hidden tmp file so concurrent readers never see a partial entry
+        tmp_entry = self.path / f".{uuid4().hex}{ext}"
+        shutil.copyfile(fn.file, tmp_entry)
+        os.replace(tmp_entry, entry)
+        with self._lock:
+            self.stats.misses += 1
+            self._size += entry.stat().st_size
+            if self._size > self.max_size:
+                self._evict()
+        return fn
+
+    def _evict(self):
+        """Remove the least-recently used entries until under the max size"""
+        entries = sorted(((f, f.stat()) for f in self._entries()), key=lambda x: x[1].st_mtime)
+        self._size = sum(s.st_size for (_, s) in entries)
+        for (f, s) in entries:
+            if self._size <= self.max_size:
+                break
+            f.unlink()
+            self._size -= s.st_size
+            self.stats.evictions += 1
+        log.debug(f"Asset cache reduced to {self._size} bytes")
+
+    def clear(self):
+        """Remove all entries from the cache"""
+        with self._lock:
+            for f in self._entries():
+                f.unlink()
+            self._size = 0
+
+
+################################################################################
+# Global cache
+_asset_cache: t.Optional[AssetCache] = None
+
+
+def enable_asset_cache(path: t.Optional[NPath] = None, max_size: int = DEFAULT_MAX_SIZE) -> AssetCache:
+    """
+    Cache the files serialised for blocks on disk, so that unchanged dataframes and plots are reused
+    when a report is rebuilt, e.g. on re-running a script or notebook
+
+    Args:
+        path: The directory to store the cache in (optional, defaults to `$DATAPANE_ASSET_CACHE_DIR`, else within the datapane config directory)
+        max_size: The maximum size of the cache in bytes, evicting the least-recently used files when over (optional, defaults to 1GB)
+
+    Returns:
+        The asset cache, including its hit / miss `stats`
+    """
+    global _asset_cache
+    _asset_cache = AssetCache(path, max_size)
+    return _asset_cache
+
+
+def disable_asset_cache():
+    """Stop using the asset cache for blocks (any cached files are kept on disk)"""
+    global _asset_cache
+    _asset_cache = None
+
+
+@contextmanager
+def using_asset_cache(cache: t.Optional[AssetCache]) -> t.Iterator[t.Optional[AssetCache]]:
+    """Use the given asset cache within the context, restoring the previous one afterwards"""
+    global _asset_cache
+    prev, _asset_cache = _asset_cache, cache
+    try:
+        yield cache
+    finally:
+        _asset_cache = prev
+
+
+def cached_write(x: T, write: t.Callable[[T], DPTmpFile], writer: t.Type, ext: str) -> DPTmpFile:
+    """Serialise the object using `write`, via the asset cache if enabled"""
+    cache = _asset_cache
+    key = cache.key(x, writer) if cache else None
+    if key is None:
+        return write(x)
+    return cache.get_or_write(key, ext, lambda: write(x))
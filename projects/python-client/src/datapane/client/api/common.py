@@ -4,16 +4,22 @@ Common/shared objects and types used throughout the client API
 
 ..note:: This module is not used directly
 """
+import asyncio
 import atexit
+import dataclasses as dc
 import json
 import os
 import pprint
 import shutil
+import threading
 import time
 import typing as t
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from copy import copy
 from datetime import timedelta
+from functools import partial
 from pathlib import Path
 from tempfile import gettempdir, mkdtemp, mkstemp
 from urllib import parse as up
@@ -24,15 +30,22 @@ from furl import furl
 from munch import Munch, munchify
 from packaging.version import Version
 from requests import HTTPError, Response
-from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from datapane import _TEST_ENV, __version__
 from datapane.client import config as c
 from datapane.client.utils import IncompatibleVersionError, ReportTooLargeError, UnsupportedResourceError, failure_msg
 from datapane.common import JSON, MIME, SIZE_1_MB, NPath, guess_type
-from datapane.common.utils import compress_file, log
+from datapane.common.compression import DEFAULT_POLICY
+from datapane.common.utils import log
+
+from .download import RangedDownload
+from .upload import ChunkedUpload, MultipartStream, Part
 
 __all__ = [
+    "Client",
+    "DTOCache",
     "HTTPError",
     "Response",
 ]
@@ -140,6 +153,191 @@ def _process_res(r: Response, empty_ok: bool = False) -> t.Union[Munch, JSON]:
 
 
 FileList = t.Dict[str, t.List[Path]]
+T = t.TypeVar("T")
+
+# the connect and read timeouts of requests
+DEFAULT_TIMEOUT = (6.10, 54)
+# responses retried for idempotent requests, along with connection errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# PUTs aren't retried by the session, as chunked uploads retry their own
+RETRY_METHODS = frozenset(["HEAD", "GET", "OPTIONS", "DELETE", "TRACE"])
+
+
+def _retry(max_retries: int, backoff_factor: float) -> Retry:
+    # `method_whitelist` was renamed to `allowed_methods` in urllib3 1.26
+    methods_kwarg = "allowed_methods" if hasattr(Retry, "DEFAULT_ALLOWED_METHODS") else "method_whitelist"
+    kwargs: t.Dict[str, t.Any] = {methods_kwarg: RETRY_METHODS}
+    return Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+        **kwargs,
+    )
+
+
+@dc.dataclass(frozen=True)
+class CachedDTO:
+    data: Munch
+    etag: t.Optional[str]
+    fetched: float
+
+
+class DTOCache:
+    """
+    A thread-safe LRU cache of the DTOs fetched by a client, keyed by their url and params.
+    Entries are used as-is while fresh, else revalidated via their ETag, and invalidated by any change made via the client
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, CachedDTO]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url: str, params: t.Dict[str, t.Any]) -> str:
+        return f"{url}?{up.urlencode(sorted((k, v) for (k, v) in params.items() if v is not None))}"
+
+    def get(self, key: str) -> t.Optional[CachedDTO]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)
+            return entry
+
+    def count(self, hits: int = 0, revalidated: int = 0, misses: int = 0) -> None:
+        """Update the stats, under the lock as they're updated from many threads"""
+        with self._lock:
+            self.hits += hits
+            self.revalidated += revalidated
+            self.misses += misses
+
+    def put(self, key: str, data: Munch, etag: t.Optional[str]) -> None:
+        with self._lock:
+            self._entries[key] = CachedDTO(data, etag, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, url: str) -> None:
+        """Remove the entries for the url and any under it, along with any other entries for the object at the url"""
+        obj_id = url.rstrip("/").rsplit("/", 1)[-1]
+        with self._lock:
+            for (key, entry) in list(self._entries.items()):
+                if key.startswith(url) or str(entry.data.get("id")) == obj_id:
+                    del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class Client:
+    """
+    A connection to a Datapane Server, holding its own config and HTTP session, which can be shared across threads.
+
+    Connections to the server are pooled, with up to `pool_maxsize` kept open for reuse, e.g. set to the number
+    of threads making requests concurrently. Idempotent requests are retried with exponential backoff
+    on connection errors, and on 429 and 5xx responses, honouring any `Retry-After` header.
+
+    Async methods, e.g. `Resource.aget` and `File.aby_id`, run the blocking calls in a thread pool owned by the client,
+    so that many requests can be made concurrently from an event loop, up to `max_concurrency` at once.
+
+    Objects looked up via the client, e.g. with `File.get`, are cached for `dto_cache_ttl` seconds, and then revalidated
+    with the server via their ETag, so that unchanged objects aren't re-sent. Changes made via the client invalidate them.
+
+    Objects use the default client for the global config, see `get_client`, unless given their own
+    """
+
+    dto_cache_ttl: float
+
+    def __init__(
+        self,
+        config: t.Optional[c.Config] = None,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        timeout: t.Any = DEFAULT_TIMEOUT,
+        max_concurrency: int = 10,
+        dto_cache_ttl: float = 0.0,
+        dto_cache_size: int = 1024,
+    ):
+        self.config = config or c.check_get_config()
+        # no timeout by default when testing
+        self.timeout = None if timeout is DEFAULT_TIMEOUT and _TEST_ENV else timeout
+        self.max_concurrency = max_concurrency
+        self.dto_cache_ttl = dto_cache_ttl
+        self.dto_cache = DTOCache(dto_cache_size)
+        self._executor: t.Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=_retry(max_retries, backoff_factor),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # set once here, as the session is shared by all threads using the client
+        self.session.headers.update(
+            {"Authorization": f"Token {self.config.token}", "Datapane-API-Version": __version__}
+        )
+
+    @property
+    def server(self) -> str:
+        return self.config.server
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_concurrency, thread_name_prefix="dp-client")
+            return self._executor
+
+    async def arun(self, f: t.Callable[..., T], *args: t.Any, **kwargs: t.Any) -> T:
+        """Run the blocking call without blocking the event loop, with up to `max_concurrency` running at once"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(f, *args, **kwargs))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        self.session.close()
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):  # noqa: ANN001
+        self.close()
+
+    async def __aenter__(self) -> "Client":
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_traceback):  # noqa: ANN001
+        self.close()
+
+
+_client: t.Optional[Client] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> Client:
+    """The default client, for the global config, recreated whenever the config changes, e.g. on login"""
+    global _client
+    config = c.check_get_config()
+    with _client_lock:
+        if _client is None or _client.config is not config:
+            _client = Client(config)
+        return _client
 
 
 # TODO - make generic and return a dataclass from server?
@@ -148,24 +346,33 @@ FileList = t.Dict[str, t.List[Path]]
 class Resource:
     endpoint: str
     url: str
-    # keep session as classvar to share across all DP accesses - however will be
-    # tied to current instance config
-    session = requests.Session()
-    timeout = None if _TEST_ENV else (6.10, 54)  # type: ignore
-
-    def __init__(self, endpoint: str):
+    # set for servers supporting the chunked upload protocol, to upload files totalling over this size in chunks
+    #  beforehand, rather than within the request, e.g. 16MB
+    chunked_upload_threshold: t.Optional[int] = None
+    upload_chunk_size: int = 8 * SIZE_1_MB
+    upload_workers: int = 4
+    # content-encodings the server accepts for uploads, in order of preference, e.g. add "zstd" for faster compression
+    upload_encodings: t.Sequence[str] = ("gzip",)
+    # set for servers that accept the `compress_fields` of uploads as separate compressed fields, outside `json_data`
+    upload_compressed_fields: bool = False
+    # set for servers that accept chunked transfer-encoding, to send uploads as they're compressed,
+    # rather than compressing them beforehand to find their length
+    stream_uploads: bool = False
+
+    def __init__(self, endpoint: str, client: t.Optional[Client] = None):
         # drop /api if exists
         # TODO - use furl for paths here
         self.endpoint = endpoint.split("/api", maxsplit=1)[-1]
-        config = c.check_get_config()
-        self.url = up.urljoin(config.server, f"api{self.endpoint}")
+        self.client = client or get_client()
+        self.session = self.client.session
+        self.timeout = self.client.timeout
+        self.url = up.urljoin(self.client.server, f"api{self.endpoint}")
         # check if access to the resource is allowed
         self._check_endpoint(self.url)
-        self.session.headers.update({"Authorization": f"Token {config.token}", "Datapane-API-Version": __version__})
 
     def _check_endpoint(self, url: str):
         # raise exception if unavailable object is being accessed on the basic instance
-        basic_endpoints = ["files", "oembed", "reports", "settings", "users", "api-login-tokens"]
+        basic_endpoints = ["files", "oembed", "reports", "settings", "users", "api-login-tokens", "uploads"]
         parsed_url: furl = furl(url)
         url_parts = parsed_url.path.segments
         if (
@@ -180,77 +387,182 @@ class Resource:
         params = params or dict()
         extra_headers = {"Datapane-Object-Overwrite": "True"} if overwrite else {}
         r = self.session.post(self.url, headers=extra_headers, json=data, params=params, timeout=self.timeout)
+        self.client.dto_cache.invalidate(self.url)
         return _process_res(r)
 
-    def post_files(self, files: FileList, overwrite: bool = False, **data: JSON) -> Munch:
-        # upload files using custom json-data protocol
-        # build the fields
-        file_header = {"Content-Encoding": "gzip"}
-
-        def _mk_file_fields(field_name: str, f: Path):
-            # compress the file, in-place
-            # TODO - disable compression where unneeded, e.g. .gz, .zip, .png, etc
-            with compress_file(f) as f_gz:
-                return (
-                    field_name,
-                    (f.name, open(f_gz, "rb"), guess_type(f), file_header),
+    def post_files(
+        self, files: FileList, overwrite: bool = False, compress_fields: t.Sequence[str] = (), **data: JSON
+    ) -> Munch:
+        """
+        Upload files using custom json-data protocol, with `data` sent as JSON in the `json_data` field,
+        apart from any `compress_fields`, e.g. large documents, which are sent as separate compressed fields
+        if the server supports it, see `upload_compressed_fields`.
+        Large files are uploaded in chunks first, if enabled via `chunked_upload_threshold`,
+        and referenced by their upload ids in the `uploads` field of `json_data`
+        """
+        max_size = 25 if self.client.config.is_public else 100
+
+        def check_size(n_bytes: int):
+            if n_bytes > max_size * SIZE_1_MB:
+                raise ReportTooLargeError(
+                    f"Report and attachments over {max_size} MB after compression - please reduce the size of your charts/plots"
                 )
 
-        fields = [_mk_file_fields(k, x) for (k, v) in files.items() for x in v]
-        fields.append(("json_data", json.dumps(data)))
-
-        e = MultipartEncoder(fields=fields)
+        files_size = sum(f.stat().st_size for v in files.values() for f in v)
+        if self.chunked_upload_threshold is not None and files_size > self.chunked_upload_threshold:
+            # chunks are sent uncompressed
+            check_size(files_size)
+            try:
+                uploads = self.upload_chunked(files)
+            except HTTPError as err:
+                # the server doesn't support chunked uploads, so send the files within the request
+                if err.response is None or err.response.status_code not in (404, 405):
+                    raise
+                log.debug(f"Chunked uploads unsupported, uploading within the request - {err}")
+            else:
+                data["uploads"] = t.cast(JSON, uploads)
+                files = {}
+
+        # compress each file as it's streamed, where worthwhile
+        parts = []
+        for (k, v) in files.items():
+            for f in v:
+                (encoding, level) = DEFAULT_POLICY.choose_file(f, self.upload_encodings) or (None, None)
+                parts.append(Part(k, f, filename=f.name, content_type=guess_type(f), encoding=encoding, level=level))
+        for k in compress_fields if self.upload_compressed_fields else ():
+            x = data.pop(k)
+            x_bytes = x.encode() if isinstance(x, str) else json.dumps(x).encode()
+            (encoding, level) = DEFAULT_POLICY.choose_data(x_bytes, self.upload_encodings) or (None, None)
+            # sent as a file, so it's received as binary
+            parts.append(Part(k, x_bytes, filename=k, encoding=encoding, level=level))
+        parts.append(Part("json_data", json.dumps(data).encode()))
+
+        size = sum(p.size for p in parts)
+        log.debug(f"Report size before compression ~{size/SIZE_1_MB:.1f} MB")
+
+        # fail early if the parts that aren't compressed are already too large
+        check_size(sum(p.size for p in parts if not p.encoding))
+
+        e = MultipartStream(parts)
+        # sent with a Content-Length, found by compressing the parts beforehand, unless streamed
+        body: t.Iterable[bytes] = iter(e) if self.stream_uploads else e
+        # the uncompressed size is an upper bound, so the compressed body is only checked beforehand if that's too large,
+        # as otherwise it's checked as it's sent
+        if size > max_size * SIZE_1_MB and not self.stream_uploads:
+            check_size(len(e))
         extra_headers = {"Content-Type": f"{e.content_type}; dp-files=True"}
         if overwrite:
             extra_headers["Datapane-Object-Overwrite"] = "True"
 
-        max_size = 25 if c.config.is_public else 100
-        log.debug(f"Report size ~{e.len/SIZE_1_MB:.1f} MB")
-        if e.len > max_size * SIZE_1_MB:
-            raise ReportTooLargeError(
-                f"Report and attachments over {max_size} MB after compression (~{e.len/SIZE_1_MB:.1f} MB) - please reduce the size of your charts/plots"
-            )
-        elif e.len > SIZE_1_MB:
+        if size > SIZE_1_MB:
             log.debug("Using upload monitor")
             fill_char = click.style("=", fg="yellow")
             with click.progressbar(
-                length=e.len,
+                length=size,
                 width=0,
                 show_eta=True,
                 label="Uploading files",
                 fill_char=fill_char,
             ) as bar:
 
-                def f(m: MultipartEncoderMonitor):
+                def on_progress(m: MultipartStream):
+                    check_size(m.bytes_sent)
                     # update every 100KB
-                    m.buf_bytes_read += m.bytes_read - m.prev_bytes_read
-                    m.prev_bytes_read = m.bytes_read
-                    if m.buf_bytes_read >= 1e5:
-                        # print(f"{m.buf_bytes_read=}, {m.prev_bytes_read=}")
-                        bar.update(m.buf_bytes_read)
-                        m.buf_bytes_read = 0
-
-                m = MultipartEncoderMonitor(e, callback=f)
-                m.buf_bytes_read = 0
-                m.prev_bytes_read = 0
-                r = self.session.post(self.url, data=m, headers=extra_headers, timeout=self.timeout)
+                    if m.bytes_read - bar.pos >= 1e5:
+                        bar.update(m.bytes_read - bar.pos)
+
+                e.on_progress = on_progress
+                r = self.session.post(self.url, data=body, headers=extra_headers, timeout=self.timeout)
         else:
-            r = self.session.post(self.url, data=e, headers=extra_headers, timeout=self.timeout)
+            e.on_progress = lambda m: check_size(m.bytes_sent)
+            r = self.session.post(self.url, data=body, headers=extra_headers, timeout=self.timeout)
+        self.client.dto_cache.invalidate(self.url)
+        log.debug(f"Uploaded {e.bytes_sent/SIZE_1_MB:.1f} MB")
         return _process_res(r)
 
-    def get(self, empty_ok: bool = False, **params) -> Munch:
-        r = self.session.get(self.url, params=params, timeout=self.timeout)
-        return _process_res(r, empty_ok=empty_ok)
+    def upload_chunked(self, files: FileList) -> t.Dict[str, t.List[str]]:
+        """
+        Upload the files via the chunked upload protocol, uploading the chunks of each in parallel,
+        retrying failed chunks and resuming any interrupted uploads, returning the upload id of each file
+        """
+        uploads_url = up.urljoin(self.client.server, "api/uploads/")
+        state_dir = c.APP_DIR / "uploads"
+        size = sum(f.stat().st_size for v in files.values() for f in v)
+        with click.progressbar(length=size, width=0, show_eta=True, label="Uploading files") as bar:
+            return {
+                k: [
+                    ChunkedUpload(
+                        self.session,
+                        uploads_url,
+                        f,
+                        state_dir,
+                        content_type=guess_type(f),
+                        chunk_size=self.upload_chunk_size,
+                        max_workers=self.upload_workers,
+                        timeout=self.timeout,
+                        on_progress=bar.update,
+                    ).run()
+                    for f in v
+                ]
+                for (k, v) in files.items()
+            }
+
+    def get(self, empty_ok: bool = False, max_age: t.Optional[float] = None, **params) -> Munch:
+        """
+        GET the resource, via the client's DTO cache if `max_age` is given,
+        using the cached response if fetched within `max_age` seconds, else revalidating it via its ETag
+        """
+        if max_age is None:
+            r = self.session.get(self.url, params=params, timeout=self.timeout)
+            return _process_res(r, empty_ok=empty_ok)
+
+        cache = self.client.dto_cache
+        key = cache.key(self.url, params)
+        entry = cache.get(key)
+        extra_headers = {}
+        if entry:
+            if time.monotonic() - entry.fetched <= max_age:
+                cache.count(hits=1)
+                return munchify(entry.data)
+            if entry.etag:
+                extra_headers["If-None-Match"] = entry.etag
+
+        r = self.session.get(self.url, params=params, headers=extra_headers, timeout=self.timeout)
+        if entry and r.status_code == 304:
+            cache.count(revalidated=1)
+            cache.put(key, entry.data, entry.etag)
+            return munchify(entry.data)
+        cache.count(misses=1)
+        res = _process_res(r, empty_ok=empty_ok)
+        if isinstance(res, dict):
+            # store a copy, so the cached entry isn't changed via the result
+            cache.put(key, munchify(res), r.headers.get("ETag"))
+        return res
 
     def patch(self, params: t.Dict = None, **data: JSON) -> JSON:
         params = params or dict()
         r = self.session.patch(self.url, json=data, params=params, timeout=self.timeout)
+        self.client.dto_cache.invalidate(self.url)
         return _process_res(r)
 
     def delete(self) -> None:
         r = self.session.delete(self.url, timeout=self.timeout)
+        self.client.dto_cache.invalidate(self.url)
         _process_res(r, empty_ok=True)
 
+    # async versions, run via the client
+    async def apost(self, params: t.Dict = None, overwrite: bool = False, **data: JSON) -> JSON:
+        return await self.client.arun(self.post, params, overwrite, **data)
+
+    async def aget(self, empty_ok: bool = False, max_age: t.Optional[float] = None, **params) -> Munch:
+        return await self.client.arun(self.get, empty_ok, max_age, **params)
+
+    async def apatch(self, params: t.Dict = None, **data: JSON) -> JSON:
+        return await self.client.arun(self.patch, params, **data)
+
+    async def adelete(self) -> None:
+        await self.client.arun(self.delete)
+
     @contextmanager
     def nest_endpoint(self, endpoint: str) -> t.Generator["Resource", None, None]:
         """Returns a context manager allowing recursive nesting in endpoints"""
@@ -261,8 +573,20 @@ class Resource:
         log.debug(f"Unnesting endpoint {endpoint}")
 
 
-def do_download_file(download_url: t.Union[str, furl], fn: t.Optional[NPath] = None) -> NPath:
-    """Download a file to `cwd`, using `fn` if provided, else Content-Disposition, else tmpfile"""
+def do_download_file(
+    download_url: t.Union[str, furl],
+    fn: t.Optional[NPath] = None,
+    sha256: t.Optional[str] = None,
+    max_workers: int = 4,
+    chunk_size: int = 8 * SIZE_1_MB,
+    on_progress: t.Optional[t.Callable[[int], None]] = None,
+) -> NPath:
+    """
+    Download a file to `cwd`, using `fn` if provided, else Content-Disposition, else tmpfile.
+    The file is downloaded in parallel chunks where the server supports ranges, resuming any interrupted download
+    to the same file, and verified against its size and any checksum, either `sha256` or sent by the server.
+    `on_progress` is called with the number of bytes received, else a progress bar is shown for large files
+    """
     if isinstance(download_url, str):
         download_url: furl = furl(download_url)  # type: ignore [no-redef]
 
@@ -272,19 +596,37 @@ def do_download_file(download_url: t.Union[str, furl], fn: t.Optional[NPath] = N
         # assume the url is relative to the dp server
         download_url.origin = c.config.server
 
-    with requests.get(str(download_url.url), stream=True) as r:
-        r.raise_for_status()
-        x = r.headers.get("Content-Disposition")
+    # a separate session, without the client's credentials, as files may be downloaded from external storage
+    with requests.Session() as session:
+        adapter = HTTPAdapter(pool_maxsize=max_workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        d = RangedDownload(
+            session,
+            str(download_url.url),
+            chunk_size=chunk_size,
+            max_workers=max_workers,
+            sha256=sha256,
+            on_progress=on_progress,
+        ).probe()
         if not fn:
-            if x and "filename" in x:
-                # 'attachment; filename="datapane-test_test_dp_1588192318-1588192318-py3-none-any.whl"'
-                y = x.split("filename=", maxsplit=1)[1].strip('"')
-                fn = str(Path.cwd() / y)
+            if d.filename:
+                fn = str(Path.cwd() / d.filename)
             else:
                 f, fn = mkstemp()
                 os.close(f)
-        with open(fn, "wb") as ffile:
-            # shutil.copyfileobj(r.raw, f)
-            for chunk in r.iter_content(chunk_size=1024 * 1024):  # 1MB chunks
-                ffile.write(chunk)
+
+        if on_progress is None and d.size and d.size > 16 * SIZE_1_MB:
+            with click.progressbar(length=d.size, width=0, show_eta=True, label="Downloading file") as bar:
+                d.on_progress = bar.update
+                d.run(Path(fn))
+        else:
+            d.run(Path(fn))
     return fn
+
+
+async def ado_download_file(
+    download_url: t.Union[str, furl], fn: t.Optional[NPath] = None, client: t.Optional[Client] = None, **kwargs: t.Any
+) -> NPath:
+    """Async version of `do_download_file`, run via the client"""
+    return await (client or get_client()).arun(do_download_file, download_url, fn, **kwargs)
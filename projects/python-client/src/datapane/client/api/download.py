@@ -0,0 +1,221 @@
+"""
+Parallel and resumable downloads
+
+Downloads files in chunks via HTTP range requests, fetching the chunks in parallel and retrying each on failure,
+- a `GET` of the first byte finds the file's size, and whether the server supports ranges, along with its validator
+  (a strong `ETag`, else `Last-Modified`) and any checksum in a `Digest` header
+- `GET` with `Range: bytes=<start>-<end>` for each chunk, written in place into a `<file>.part` file,
+  with `If-Range` so that the server sends the whole file, rather than mixing versions, if it changes meanwhile,
+  and checking the `Content-Range` of each matches the chunk and size of the file
+- the chunks received are saved alongside in `<file>.part.json`, so an interrupted download of the same file,
+  e.g. in a new process, only fetches the missing chunks
+- once complete the file's size and checksum are verified before it's moved into place
+
+Servers that don't support ranges are downloaded with a single streamed `GET`.
+
+..note:: This module is not used directly
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import requests
+
+from datapane.client.utils import DownloadError
+from datapane.common import log
+
+from .upload import retry_request
+
+# the checksums of `Digest` headers that are verified, as per RFC 3230
+DIGEST_ALGORITHMS = {"sha-256": "sha256", "md5": "md5"}
+
+
+class RangedDownload:
+    """
+    Downloads a file in chunks via HTTP range requests, fetching chunks in parallel and retrying each on failure.
+    `probe` fetches the file's metadata, e.g. to choose where to save it, and `run` downloads it,
+    resuming any previous, interrupted, download to the same destination
+    """
+
+    backoff: float = 1.0
+
+    def __init__(
+        self,
+        session: requests.Session,
+        url: str,
+        chunk_size: int = 8 * 1024 * 1024,
+        max_workers: int = 4,
+        max_retries: int = 5,
+        timeout: t.Any = None,
+        sha256: t.Optional[str] = None,
+        on_progress: t.Optional[t.Callable[[int], None]] = None,
+    ):
+        self.session = session
+        self.url = url
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.on_progress = on_progress
+        # expected checksums, by hashlib algorithm
+        self.checksums: t.Dict[str, str] = {"sha256": sha256.lower()} if sha256 else {}
+        self.size: t.Optional[int] = None
+        self.ranges = False
+        self.validator: t.Optional[str] = None
+        self.headers: t.Mapping[str, str] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def filename(self) -> t.Optional[str]:
+        """The filename given by the server, if any"""
+        x = self.headers.get("Content-Disposition")
+        if x and "filename=" in x:
+            # 'attachment; filename="datapane-test_test_dp_1588192318-1588192318-py3-none-any.whl"'
+            return x.split("filename=", maxsplit=1)[1].split(";")[0].strip('"')
+        return None
+
+    @property
+    def num_chunks(self) -> int:
+        return -(-(self.size or 0) // self.chunk_size)
+
+    def probe(self) -> "RangedDownload":
+        """Fetch the size of the file, and whether it can be downloaded in ranges"""
+        with self._request(headers={"Range": "bytes=0-0", "Accept-Encoding": "identity"}, stream=True) as r:
+            if r.status_code == 416:
+                # only an empty file has no satisfiable ranges
+                self.size = 0
+            else:
+                r.raise_for_status()
+                content_range = r.headers.get("Content-Range", "")
+                if r.status_code == 206 and content_range.startswith("bytes 0-0/") and "*" not in content_range:
+                    self.size = int(content_range.split("/")[1])
+                    self.ranges = True
+                elif r.headers.get("Content-Length") and "Content-Encoding" not in r.headers:
+                    self.size = int(r.headers["Content-Length"])
+            self.headers = r.headers
+            # weak ETags can't be used with If-Range, as servers never match them
+            etag = r.headers.get("ETag")
+            self.validator = etag if etag and not etag.startswith("W/") else r.headers.get("Last-Modified")
+
+        for digest in self.headers.get("Digest", "").split(","):
+            (algorithm, _, value) = digest.strip().partition("=")
+            name = DIGEST_ALGORITHMS.get(algorithm.lower())
+            if name and value and name not in self.checksums:
+                self.checksums[name] = base64.b64decode(value).hex()
+        log.debug(
+            f"Downloading {self.size} bytes from {self.url} {'in ranges' if self.ranges else 'in one request'}, "
+            f"verifying {', '.join(self.checksums) or 'size only'}"
+        )
+        return self
+
+    def run(self, dest: Path) -> Path:
+        """Download the file to `dest`, returning it"""
+        if not self.headers:
+            self.probe()
+        part = dest.with_name(f"{dest.name}.part")
+        state_file = dest.with_name(f"{dest.name}.part.json")
+
+        if self.ranges:
+            state = dict(size=self.size, validator=self.validator, chunk_size=self.chunk_size)
+            received = self._resume(part, state_file, state)
+            missing = [i for i in range(self.num_chunks) if i not in received]
+            log.debug(f"{len(missing)}/{self.num_chunks} chunks to download to {dest}")
+            if self.on_progress:
+                self.on_progress(sum(self._chunk_len(i) for i in received))
+
+            def save(i: int):
+                with self._lock:
+                    received.add(i)
+                    state_file.write_text(json.dumps(dict(state, received=sorted(received))))
+
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dp-download") as executor:
+                list(executor.map(partial(self._get_chunk, part, save), missing))
+        else:
+            self._get_all(part)
+
+        self._verify(part, state_file)
+        os.replace(part, dest)
+        if state_file.exists():
+            state_file.unlink()
+        return dest
+
+    def _resume(self, part: Path, state_file: Path, state: t.Dict[str, t.Any]) -> t.Set[int]:
+        """The chunks already received by a previous download of the same file, preparing the part file if none"""
+        try:
+            prev = json.loads(state_file.read_text())
+            if part.stat().st_size == self.size and all(prev[k] == v for (k, v) in state.items()):
+                log.debug(f"Resuming download of {self.url} to {part}")
+                return set(prev["received"])
+        except (OSError, ValueError, KeyError):
+            pass
+        # allocate the whole file, so that chunks can be written in place in any order
+        with part.open("wb") as f:
+            f.truncate(self.size)
+        state_file.write_text(json.dumps(dict(state, received=[])))
+        return set()
+
+    def _chunk_len(self, i: int) -> int:
+        return min(self.chunk_size, self.size - i * self.chunk_size)
+
+    def _get_chunk(self, part: Path, save: t.Callable[[int], None], i: int) -> None:
+        (start, length) = (i * self.chunk_size, self._chunk_len(i))
+        headers = {"Range": f"bytes={start}-{start + length - 1}", "Accept-Encoding": "identity"}
+        if self.validator:
+            headers["If-Range"] = self.validator
+        with self._request(headers=headers, stream=True) as r:
+            r.raise_for_status()
+            content_range = f"bytes {start}-{start + length - 1}/{self.size}"
+            if r.status_code != 206 or r.headers.get("Content-Range") != content_range:
+                raise DownloadError(f"{self.url} changed while downloading, please try again")
+            data = r.content
+        if len(data) != length:
+            raise DownloadError(f"Received {len(data)} bytes for chunk {i} of {self.url}, expected {length}")
+
+        with part.open("r+b") as f:
+            f.seek(start)
+            f.write(data)
+        save(i)
+        if self.on_progress:
+            with self._lock:
+                self.on_progress(length)
+
+    def _get_all(self, part: Path) -> None:
+        with self._request(stream=True) as r:
+            r.raise_for_status()
+            with part.open("wb") as f:
+                for chunk in r.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+                    if self.on_progress:
+                        self.on_progress(len(chunk))
+
+    def _verify(self, part: Path, state_file: Path) -> None:
+        size = part.stat().st_size
+        hashes = {name: hashlib.new(name) for name in self.checksums}
+        if hashes:
+            with part.open("rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    for h in hashes.values():
+                        h.update(chunk)
+
+        error = None
+        if self.size is not None and size != self.size:
+            error = f"Downloaded {size} bytes from {self.url}, expected {self.size}"
+        elif any(h.hexdigest() != self.checksums[name] for (name, h) in hashes.items()):
+            error = f"Checksum of the file downloaded from {self.url} doesn't match"
+        if error:
+            # start again next time
+            part.unlink()
+            if state_file.exists():
+                state_file.unlink()
+            raise DownloadError(error)
+
+    def _request(self, **kwargs: t.Any) -> requests.Response:
+        return retry_request(
+            self.session, "GET", self.url, self.max_retries, self.backoff, timeout=self.timeout, **kwargs
+        )
@@ -9,12 +9,17 @@ import json
 import os
 import pprint
 import typing as t
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import suppress
+from itertools import islice
 from pathlib import Path
 from typing import Optional, Type, cast
 from urllib import parse as up
 
 import pandas as pd
 import validators as v
+from furl import furl
 from munch import Munch
 from requests import HTTPError
 
@@ -24,11 +29,13 @@ from datapane.common import JSON, URL, ArrowFormat, SDict
 from datapane.common.df_processor import to_df
 
 from . import Resource
-from .common import DPTmpFile, FileList
+from .asset_cache import cached_write
+from .common import Client, DPTmpFile, FileList, get_client
 
 __all__ = ["DPObjectRef"]
 
 U = t.TypeVar("U", bound="DPObjectRef")
+V = t.TypeVar("V")
 
 
 class DPObjectRef:
@@ -39,6 +46,8 @@ class DPObjectRef:
 
     _url: URL = URL("<local resource>")
     _dto: t.Optional[Munch] = None
+    # the client used to access the object, else the default client
+    _client: t.Optional[Client] = None
 
     list_fields: t.List[str] = ["name", "web_url", "project"]
 
@@ -79,23 +88,25 @@ class DPObjectRef:
             _id = str(id_or_url)
 
         rel_obj_url = up.urljoin(self.endpoint, f"{_id}/")
-        self.res = Resource(endpoint=rel_obj_url)
+        self.res = Resource(endpoint=rel_obj_url, client=self._client)
         self._url = URL(self.res.url)
 
-    def __init__(self, dto: Optional[Munch] = None):
+    def __init__(self, dto: Optional[Munch] = None, client: t.Optional[Client] = None):
+        self._client = client
         # Save a server-round trip if we already have the DTO
         if dto:
             self.dto = dto
             self.url = dto.id
 
     @classmethod
-    def get(cls: Type[U], name: str, project: Optional[str] = None) -> U:
+    def get(cls: Type[U], name: str, project: Optional[str] = None, client: t.Optional[Client] = None) -> U:
         """
         Lookup and retrieve an object from the Datapane Server by its name
 
         Args:
             name: The name of the object, e.g. 'my-file-3` or `project1/my-file-3`
             project: The project of the object, e.g. `project1` (can be provided with the name as shown above)
+            client: The client to access the object with (default: the client for the global config)
 
         Returns:
             The object if found
@@ -104,47 +115,56 @@ class DPObjectRef:
         if len(lookup_value) == 2:
             project, name = lookup_value
         try:
-            res = Resource(f"{cls.endpoint}lookup/").get(name=name, project=project)
+            r = Resource(f"{cls.endpoint}lookup/", client=client)
+            res = r.get(max_age=r.client.dto_cache_ttl, name=name, project=project)
         except HTTPError as e:
             lookup_str = f"{project}/{name}" if project else name
             log.error(
                 f"Couldn't find '{lookup_str}', are you sure it exists? If error occurs within a app please try updating the code to include the app's project in name - e.g. 'project1/{name}'."
             )
             raise e
-        return cls(dto=res)
+        return cls(dto=res, client=client)
 
     @classmethod
-    def by_id(cls: Type[U], id_or_url: str) -> U:
+    def by_id(cls: Type[U], id_or_url: str, client: t.Optional[Client] = None) -> U:
         """
         Lookup and retrieve an object from the Datapane Server by its id
 
         Args:
             id_or_url: The `id`, or full URL that represents the object
+            client: The client to access the object with (default: the client for the global config)
 
         Returns:
             The object if found
         """
-        x = cls()
+        x = cls(client=client)
         x.url = URL(id_or_url)
-        x.refresh()
+        x.refresh(max_age=x.res.client.dto_cache_ttl)
         return x
 
     @classmethod
     def post_with_files(
-        cls: Type[U], files: FileList = None, file: t.Optional[Path] = None, overwrite: bool = False, **data: JSON
+        cls: Type[U],
+        files: FileList = None,
+        file: t.Optional[Path] = None,
+        overwrite: bool = False,
+        client: t.Optional[Client] = None,
+        **data: JSON,
     ) -> U:
         # TODO - move into UploadedFileMixin ?
         if file:
             # wrap up a single file into a FileList
             files = dict(uploaded_file=[file])
 
-        res = Resource(cls.endpoint).post_files(files=files, overwrite=overwrite, **data)
-        return cls(dto=res)
+        res = Resource(cls.endpoint, client=client).post_files(
+            files=files, overwrite=overwrite, compress_fields=(), **data
+        )
+        return cls(dto=res, client=client)
 
     @classmethod
-    def post(cls: Type[U], overwrite: bool = False, **data: JSON) -> U:
-        res = Resource(cls.endpoint).post(params=None, overwrite=overwrite, **data)
-        return cls(dto=res)
+    def post(cls: Type[U], overwrite: bool = False, client: t.Optional[Client] = None, **data: JSON) -> U:
+        res = Resource(cls.endpoint, client=client).post(params=None, overwrite=overwrite, **data)
+        return cls(dto=res, client=client)
 
     def __getattr__(self, attr):  # noqa: ANN001
         if self.has_dto and not attr.startswith("__"):
@@ -175,11 +195,12 @@ class DPObjectRef:
             p.text(f"Local {name}")
 
     # user-facing helper functions
-    def refresh(self):
+    def refresh(self, max_age: float = 0):
         """Refresh the object with the latest data from the Datapane Server
         - override to pull updated fields from dto to top-level
+        - uses the client's cached copy if fetched within `max_age` seconds, else revalidates it with the server
         """
-        self.dto = self.res.get()
+        self.dto = self.res.get(max_age=max_age)
         log.debug(f"Refreshed {self.url}")
 
     def delete(self):
@@ -195,24 +216,138 @@ class DPObjectRef:
         log.debug(f"Updated object {self.url}")
 
     @classmethod
-    def list(cls) -> t.Iterable[SDict]:
+    def list(
+        cls,
+        client: t.Optional[Client] = None,
+        page_size: t.Optional[int] = None,
+        prefetch: int = 4,
+        format_fields: bool = True,
+    ) -> t.Generator[SDict, None, None]:
         """
-        Returns: A list of the Datapane objects of this type that are owned by the user
+        Args:
+            client: The client to list the objects with (default: the client for the global config)
+            page_size: The number of objects to fetch per request (default: the server's page size)
+            prefetch: The number of pages to fetch ahead while the current page is processed, in parallel where possible
+            format_fields: Convert dict fields to JSON strings, e.g. for display in a table (default: True)
+
+        Returns: The Datapane objects of this type that are owned by the user, streamed as each page is received
         """
-        endpoint: t.Optional[str] = cls.endpoint
 
-        def process_field(v: t.Union[t.Dict, str]) -> str:
-            if isinstance(v, dict):
+        def process_field(v: t.Union[t.Dict, str]) -> t.Union[t.Dict, str]:
+            if isinstance(v, dict) and format_fields:
                 return json.dumps(v, indent=True)
             return v
 
-        while endpoint:
-            r = Resource(endpoint=endpoint)
-            items = r.get()
-            # filter the items, ordering as needed
-            for x in items.results:
-                yield {k: process_field(x[k]) for k in cls.list_fields if k in x}
-            endpoint = items.next if items.next else None
+        pages = cls._list_pages(client, page_size, prefetch)
+        try:
+            for items in pages:
+                # filter the items, ordering as needed
+                for x in items.results:
+                    yield {k: process_field(x[k]) for k in cls.list_fields if k in x}
+        finally:
+            # stop fetching pages if the caller stops early
+            pages.close()
+
+    @classmethod
+    def _list_pages(
+        cls, client: t.Optional[Client], page_size: t.Optional[int], prefetch: int
+    ) -> t.Generator[Munch, None, None]:
+        # only request the fields that are listed, where supported by the server
+        params: t.Dict[str, t.Any] = dict(fields=",".join(cls.list_fields))
+        if page_size:
+            params.update(page_size=page_size)
+        r = Resource(endpoint=cls.endpoint, client=client)
+        items = r.get(**params)
+        yield items
+        if not items.next:
+            return
+
+        # the links to the next pages include the params
+        def get_page(url: str) -> Munch:
+            return Resource(endpoint=url, client=r.client).get()
+
+        next_url = furl(items.next)
+        if items.get("count") and "page" in next_url.args and items.results:
+            # numbered pages, so fetch the rest in parallel
+            n_pages = -(-items.count // len(items.results))
+            urls = (str(next_url.copy().set(args=dict(next_url.args, page=i))) for i in range(2, n_pages + 1))
+            yield from _prefetch(get_page, urls, prefetch)
+        else:
+            # otherwise follow the links, fetching each page while the previous is processed
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dp-list")
+            future: t.Optional[Future] = executor.submit(get_page, items.next)
+            try:
+                while future:
+                    items = future.result()
+                    future = executor.submit(get_page, items.next) if items.next else None
+                    yield items
+            finally:
+                # without waiting for any page being fetched, e.g. if the caller stops early
+                if future:
+                    future.cancel()
+                executor.shutdown(wait=False)
+
+    # async versions, run via the client, e.g. to fetch many objects concurrently with `asyncio.gather`
+    @classmethod
+    async def aget(cls: Type[U], name: str, project: Optional[str] = None, client: t.Optional[Client] = None) -> U:
+        """Async version of `get`"""
+        return await (client or get_client()).arun(cls.get, name, project, client)
+
+    @classmethod
+    async def aby_id(cls: Type[U], id_or_url: str, client: t.Optional[Client] = None) -> U:
+        """Async version of `by_id`"""
+        return await (client or get_client()).arun(cls.by_id, id_or_url, client)
+
+    @classmethod
+    async def alist(
+        cls,
+        client: t.Optional[Client] = None,
+        page_size: t.Optional[int] = None,
+        prefetch: int = 4,
+        format_fields: bool = True,
+    ) -> t.AsyncIterator[SDict]:
+        """Async version of `list`, fetching each page of results without blocking the event loop"""
+        items = cls.list(client, page_size=page_size, prefetch=prefetch, format_fields=format_fields)
+        client = client or get_client()
+        done = object()
+        try:
+            while True:
+                x = await client.arun(next, items, done)
+                if x is done:
+                    return
+                yield x
+        finally:
+            # stop fetching pages if the caller stops early, unless still fetching the next item, e.g. when cancelled
+            with suppress(ValueError):
+                items.close()
+
+    async def arefresh(self, max_age: float = 0):
+        """Async version of `refresh`"""
+        await self.res.client.arun(self.refresh, max_age)
+
+    async def adelete(self):
+        """Async version of `delete`"""
+        await self.res.client.arun(self.delete)
+
+    async def aupdate(self, **data: JSON):
+        """Async version of `update`"""
+        await self.res.client.arun(self.update, **data)
+
+
+def _prefetch(f: t.Callable[[str], V], xs: t.Iterator[str], n: int) -> t.Iterator[V]:
+    """Map `f` over `xs` in order, running up to `n` calls ahead in parallel, cancelling any left if closed early"""
+    n = max(n, 1)
+    executor = ThreadPoolExecutor(max_workers=n, thread_name_prefix="dp-list")
+    futures = deque(executor.submit(f, x) for x in islice(xs, n))
+    try:
+        while futures:
+            res = futures.popleft().result()
+            futures.extend(executor.submit(f, x) for x in islice(xs, 1))
+            yield res
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
 
 
 # NOTE - this has been inlined into Files for now
@@ -222,6 +357,10 @@ class DPObjectRef:
 
 def save_df(df: pd.DataFrame) -> DPTmpFile:
     """Export a df for uploading"""
+    return cached_write(df, _save_df, writer=ArrowFormat, ext=ArrowFormat.ext)
+
+
+def _save_df(df: pd.DataFrame) -> DPTmpFile:
     fn = DPTmpFile(ArrowFormat.ext)
 
     # create a copy of the df to process
@@ -14,6 +14,7 @@ from pandas.io.formats.style import Styler
 from datapane.common import log
 
 from .. import DPError
+from .asset_cache import cached_write
 from .common import DPTmpFile
 from .files_optional import Axes, BFigure, BLayout, Figure, Map, PFigure, Visualisation
 from .report.blocks import Attachment, DataBlock, DataTable, Plot, Table, Text
@@ -34,6 +35,8 @@ class BaseAsset(Generic[T], abc.ABC):
     block_type: Type[DataBlock]
     ext: str
     file_mode: str = "w"
+    # whether the writer can run on a background thread, e.g. within a `parallel_build` context
+    thread_safe: bool = True
 
     def write(self, x: T) -> DPTmpFile:
         fn = DPTmpFile(self.ext)
@@ -157,6 +160,8 @@ class PlotAsset(BaseAsset):
 class MatplotBasePlot(PlotAsset):
     ext = ".svg"
     mimetype = "image/svg+xml"
+    # pyplot's global state isn't thread-safe, so always save figures on the calling thread
+    thread_safe = False
 
     def _write_figure(self, x: Figure) -> DPTmpFile:
         """Creates an SVG from figure"""
@@ -289,7 +294,8 @@ for p in plots:
 
 # Entry Points
 def save(obj: Any) -> DPTmpFile:
-    fn = get_wrapper(obj, error_msg=None).write(obj)
+    wrapper = get_wrapper(obj, error_msg=None)
+    fn = cached_write(obj, wrapper.write, writer=type(wrapper), ext=getattr(wrapper, "ext", ""))
     log.debug(f"Saved object to {fn} ({os.path.getsize(fn.file)} bytes)")
     return fn
 
@@ -6,13 +6,18 @@ Describes the collection of `Block` objects that can be combined together to mak
 
 import dataclasses as dc
 import enum
+import os
 import re
 import typing as t
 from abc import ABC, abstractmethod
-from base64 import b64encode
 from collections import deque
-from functools import reduce
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from copy import deepcopy
+from itertools import count
 from pathlib import Path
+from uuid import uuid4
 
 import pandas as pd
 from dominate.dom_tag import dom_tag
@@ -22,8 +27,9 @@ from lxml.builder import ElementMaker
 from pandas.io.formats.style import Styler
 
 from datapane.client import DPError
-from datapane.common import MIME, PKL_MIMETYPE, NPath, SSDict, guess_type, log, utf_read_text
-from datapane.common.report import get_embed_url, is_valid_id, mk_attribs
+from datapane.common import MIME, NPath, SSDict, guess_type, log, utf_read_text
+from datapane.common.report import get_embed_url, is_valid_id, mk_attribs, validate_element
+from datapane.common.utils import b64_encode_file, content_addressed_name
 
 from ..common import DPTmpFile
 from ..dp_object import save_df
@@ -54,6 +60,8 @@ __all__ = [
     "Media",
     "Formula",
     "Media",
+    "parallel_build",
+    "lazy_build",
 ]
 
 __pdoc__ = {
@@ -66,30 +74,277 @@ __pdoc__ = {
 }
 
 
+# lxml elements support the same list operations for their children
+Elements = t.Union[t.List[etree.Element], etree._Element]
+
+
 @dc.dataclass
 class BuilderState:
     """Hold state whilst building the Report XML document"""
 
     embedded: bool = False
     served: bool = False
+    # set when embedded assets are streamed into the output rather than inlined in the document,
+    # used to generate unique placeholders that are replaced with the asset contents on writing
+    stream_id: t.Optional[str] = None
     attachment_count: int = 0
-    # NOTE - store as single element or a list?
-    # element: t.Optional[etree.Element] = None  # Empty Group Element?
-    elements: t.List[etree.Element] = dc.field(default_factory=list)
+    # validate each element against the schema as it's added
+    validate: bool = False
+    # elements from the previous build of the App, reused for any unchanged blocks
+    cache: t.Optional["BuildCache"] = None
+    # the elements being added to, i.e. the top-level list, or the element of the layout block being built
+    elements: "Elements" = dc.field(default_factory=list)
     attachments: t.List[Path] = dc.field(default_factory=list)
 
     def add_element(self, block: "BaseElement", e: etree.Element, f: t.Optional[Path] = None) -> "BuilderState":
         if block.name:
             e.set("name", block.name)
+        if self.validate:
+            validate_element(e, n_children=len(block.blocks) if isinstance(block, LayoutBlock) else None)
 
         self.elements.append(e)
-        if f and not self.embedded:
+        if f and (self.stream_id or not self.embedded):
             self.attachments.append(f)
             self.attachment_count += 1
             assert len(self.attachments) == self.attachment_count
 
         return self
 
+    def streamed_asset_ref(self) -> str:
+        """Placeholder for the next attachment, replaced by its base64-encoded contents when streamed"""
+        return f"dp-streamed-asset-{self.stream_id}-{self.attachment_count}"
+
+
+def streamed_asset_pattern(stream_id: str) -> t.Pattern[str]:
+    """Regex matching the placeholders generated by `BuilderState.streamed_asset_ref`"""
+    return re.compile(rf"dp-streamed-asset-{stream_id}-(\d+)")
+
+
+@dc.dataclass(frozen=True)
+class CachedBuild:
+    # the attachment count when built, as attachment references are numbered in document order
+    offset: int
+    element: etree.Element
+    attachments: t.List[Path]
+
+
+@dc.dataclass
+class BuildCache:
+    """
+    Holds the elements built for each layout block in the previous build of an App,
+    so that unchanged subtrees are copied rather than rebuilt on the next build, e.g. when previewing.
+    Blocks are matched on a fingerprint of their contents rather than identity, as blocks may be mutated between builds
+    """
+
+    # stable across builds so that streamed asset placeholders, and hence cached elements, match
+    stream_id: str = dc.field(default_factory=lambda: uuid4().hex)
+    builds: int = 0
+    hits: int = 0
+    misses: int = 0
+    # the key and result of the previous full document build, reused as-is if the App is unchanged
+    doc: t.Optional[t.Tuple[t.Hashable, etree._ElementTree, t.List[Path]]] = None
+    _prev: t.Dict[t.Hashable, CachedBuild] = dc.field(default_factory=dict)
+    _next: t.Dict[t.Hashable, CachedBuild] = dc.field(default_factory=dict)
+    # layout fingerprints are interned as ints, so they refer to their children's fingerprints rather than nest them
+    _fp_ids: t.Dict[t.Hashable, int] = dc.field(default_factory=dict)
+    _next_fp_ids: t.Dict[t.Hashable, int] = dc.field(default_factory=dict)
+    _fp_counter: t.Iterator[int] = dc.field(default_factory=count)
+    # block id -> fingerprint, for the current build
+    _fingerprints: t.Dict[int, t.Hashable] = dc.field(default_factory=dict)
+
+    def finish(self):
+        """Keep only the entries used in the latest build"""
+        self._prev = self._next
+        self._fp_ids = self._next_fp_ids
+        self.reset()
+
+    def reset(self):
+        """Clear any state from the current build, e.g. on failure"""
+        self._next = dict()
+        self._next_fp_ids = dict()
+        self._fingerprints = dict()
+
+    def _intern(self, fp: t.Hashable) -> int:
+        fp_id = self._fp_ids.get(fp)
+        if fp_id is None:
+            fp_id = self._fp_ids[fp] = next(self._fp_counter)
+        self._next_fp_ids[fp] = fp_id
+        return fp_id
+
+    def fingerprint(self, b: "BaseElement") -> t.Hashable:
+        """A fingerprint of the block and all its children, memoised for the current build"""
+        fps = self._fingerprints
+        # calculate iteratively, children first
+        stack: t.List[t.Tuple[BaseElement, bool]] = [(b, False)]
+        while stack:
+            (x, children_done) = stack.pop()
+            if id(x) in fps:
+                continue
+
+            fp = x._cached_fingerprint()
+            if isinstance(x, LayoutBlock):
+                if not children_done:
+                    stack.append((x, True))
+                    stack.extend((y, False) for y in x.blocks)
+                    continue
+                fp = self._intern((fp, tuple(fps[id(y)] for y in x.blocks)))
+            elif isinstance(x, AssetBlock):
+                # include the file stats to pick up any changes to the file itself
+                stat = os.stat(x.file)
+                fp = (fp, stat.st_size, stat.st_mtime_ns)
+            fps[id(x)] = fp
+
+        return fps[id(b)]
+
+    def key(self, b: "BaseElement", s: BuilderState) -> t.Hashable:
+        return (s.embedded, s.served, s.stream_id, s.validate, self.fingerprint(b))
+
+    def reuse(self, key: t.Hashable, s: BuilderState) -> bool:
+        """Add copies of the elements cached under the key to the document, if present"""
+        entry = self._prev.get(key) or self._next.get(key)
+        if entry and (not entry.attachments or entry.offset == s.attachment_count):
+            self.hits += 1
+            s.elements.append(deepcopy(entry.element))
+            s.attachments.extend(entry.attachments)
+            s.attachment_count += len(entry.attachments)
+            self._next[key] = entry
+            return True
+
+        self.misses += 1
+        return False
+
+    def add(self, key: t.Hashable, entry: CachedBuild):
+        self._next[key] = entry
+
+
+@dc.dataclass(frozen=True)
+class _LayoutFrame:
+    """A layout block whose children are being built into its element"""
+
+    parent_elements: "Elements"
+    key: t.Hashable
+    offset: int
+    n_attachments: int
+
+
+def build_blocks(blocks: t.Iterable["BaseElement"], s: BuilderState) -> BuilderState:
+    """
+    Build the elements for the blocks, adding them to `s.elements` in document order.
+    This works iteratively rather than recursively, creating each layout block's element first
+    and building its children directly into it, so deeply nested documents don't hit the recursion limit
+    NOTE - unchanged blocks are copied from the previous build if `s.cache` is set
+    """
+    cache = s.cache
+    key: t.Hashable = None
+    stack: t.List[t.Tuple[t.Iterator[BaseElement], t.Optional[_LayoutFrame]]] = [(iter(blocks), None)]
+
+    while stack:
+        (children, frame) = stack[-1]
+        b = next(children, None)
+
+        if b is None:
+            # finished the children of a layout block
+            stack.pop()
+            if frame:
+                e = s.elements
+                s.elements = frame.parent_elements
+                if cache:
+                    cache.add(frame.key, CachedBuild(frame.offset, e, s.attachments[frame.n_attachments :]))
+            continue
+
+        if isinstance(b, LayoutBlock):
+            # only layout blocks are cached, as leaf blocks are as fast to rebuild as to copy
+            if cache:
+                key = cache.key(b, s)
+                if cache.reuse(key, s):
+                    continue
+
+            e = getattr(E, b._tag)(**b._attributes)
+            stack.append((iter(b.blocks), _LayoutFrame(s.elements, key, s.attachment_count, len(s.attachments))))
+            s.add_element(b, e)
+            s.elements = e
+        else:
+            b._to_xml(s)
+
+    return s
+
+
+################################################################################
+# Asset serialisation
+@dc.dataclass(frozen=True)
+class LazyAsset:
+    """An asset that is serialised on first use, holding a reference to the source object until then"""
+
+    f: t.Callable[..., DPTmpFile]
+    args: t.Tuple[t.Any, ...]
+    threaded: bool = True
+
+    def __call__(self) -> Path:
+        return self.f(*self.args).file
+
+
+AssetFile = t.Union[Path, "Future[Path]", LazyAsset]
+_build_executor: ContextVar[t.Optional[ThreadPoolExecutor]] = ContextVar("build_executor", default=None)
+_lazy_build: ContextVar[bool] = ContextVar("lazy_build", default=False)
+
+
+@contextmanager
+def parallel_build(max_workers: t.Optional[int] = None) -> t.Iterator[None]:
+    """
+    Serialise the assets for any blocks created within this context, e.g. Plots, Tables and DataTables,
+    concurrently using a pool of threads, rather than one at a time as each block is created.
+
+    Any errors are raised together when the App is built, e.g. on saving or uploading,
+    reporting each block that failed.
+
+    Args:
+        max_workers: The maximum number of threads to use (optional, defaults to the number of CPUs + 4)
+
+    ..note:: objects are serialised in the background, so should not be modified after being passed to a block.
+      Only writers that release the GIL, e.g. for DataFrames (via Arrow) and copying files, run truly in parallel,
+      and matplotlib figures are always saved on the calling thread, as pyplot isn't thread-safe
+
+    ..tip:: Use as `with dp.parallel_build(): ...`, around the code that creates your blocks
+    """
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dp-build") as executor:
+        token = _build_executor.set(executor)
+        try:
+            yield
+        finally:
+            _build_executor.reset(token)
+
+
+@contextmanager
+def lazy_build() -> t.Iterator[None]:
+    """
+    Defer serialising the assets for any blocks created within this context, e.g. Plots, Tables and DataTables,
+    until the App is built, e.g. on saving or uploading. Blocks that are discarded are never serialised.
+
+    Assets are serialised concurrently if the App is built within a `parallel_build` context.
+
+    ..note:: blocks keep a reference to their source objects, so these should not be modified before the App is built
+
+    ..tip:: Use as `with dp.lazy_build(): ...`, around the code that creates your blocks
+    """
+    token = _lazy_build.set(True)
+    try:
+        yield
+    finally:
+        _lazy_build.reset(token)
+
+
+def serialize_asset(f: t.Callable[..., DPTmpFile], *args: t.Any, threaded: bool = True) -> AssetFile:
+    """
+    Run the serialiser for an asset, deferring it if within a `lazy_build` context,
+    or in the background if within a `parallel_build` context and the serialiser is `threaded`
+    """
+    if _lazy_build.get():
+        return LazyAsset(f, args, threaded)
+    executor = _build_executor.get()
+    if executor and threaded:
+        return executor.submit(lambda: f(*args).file)
+    return f(*args).file
+
 
 class BaseElement(ABC):
     """Base Block class - subclassed by all Block types
@@ -134,6 +389,7 @@ class BaseElement(ABC):
 
     def _add_attributes(self, **kwargs):
         self._attributes.update(mk_attribs(**kwargs))
+        self.__dict__.pop("_fp", None)
 
     def _ipython_display_(self):
         """Display the block as a side effect within a Jupyter notebook"""
@@ -147,6 +403,21 @@ class BaseElement(ABC):
     def _to_xml(self, s: BuilderState) -> BuilderState:
         pass
 
+    def __setattr__(self, name: str, value: t.Any):
+        # any change to the block invalidates its fingerprint
+        self.__dict__.pop("_fp", None)
+        super().__setattr__(name, value)
+
+    def _fingerprint(self) -> t.Hashable:
+        """The contents of the block used to build its element, excluding any child blocks"""
+        return (type(self), tuple(self._attributes.items()))
+
+    def _cached_fingerprint(self) -> t.Hashable:
+        fp = self.__dict__.get("_fp")
+        if fp is None:
+            fp = self.__dict__["_fp"] = self._fingerprint()
+        return fp
+
 
 Block = t.Union["Group", "Select", "DataBlock", "Empty"]
 BlockOrPrimitive = t.Union[Block, t.Any]  # TODO - expand
@@ -170,6 +441,40 @@ def wrap_block(b: BlockOrPrimitive) -> Block:
     return t.cast(Block, b)
 
 
+def iter_blocks(blocks: t.Iterable[BaseElement]) -> t.Iterator[BaseElement]:
+    """Iterate over a tree of blocks in document order"""
+    stack = list(reversed(list(blocks)))
+    while stack:
+        b = stack.pop()
+        yield b
+        if isinstance(b, LayoutBlock):
+            stack.extend(reversed(b.blocks))
+
+
+def wait_for_assets(blocks: t.Iterable[BaseElement]) -> None:
+    """Wait on any assets being serialised in the background, raising a single error listing all failed blocks"""
+    errors: t.List[str] = []
+    asset_blocks = [b for b in iter_blocks(blocks) if isinstance(b, AssetBlock)]
+
+    # start serialising any deferred assets, concurrently if within a `parallel_build` context
+    executor = _build_executor.get()
+    if executor:
+        for b in asset_blocks:
+            if isinstance(b._file, LazyAsset) and b._file.threaded:
+                b._file = executor.submit(b._file)
+
+    for (i, b) in enumerate(asset_blocks, start=1):
+        try:
+            b.file
+        except Exception as e:
+            block_name = f" '{b.name}'" if b.name else ""
+            errors.append(f"  - {b._tag}{block_name} (asset block {i}): {e!r}")
+
+    if errors:
+        msg = "\n".join(errors)
+        raise DPError(f"Failed to serialise {len(errors)} block(s):\n{msg}")
+
+
 class LayoutBlock(BaseElement):
     """
     Abstract Block that supports nested blocks
@@ -189,20 +494,10 @@ class LayoutBlock(BaseElement):
 
     def _to_xml(self, s: BuilderState) -> BuilderState:
         """
-        Recurse into the elements and pull them out
-        NOTE - this works depth-first to create all sub-elements before the current,
-        resulting in simpler implementation
-        NOTE - this results in a document-order created list of attachments for AssetBlocks,
-        as they are leaf nodes
+        Build the element, with the elements for all nested blocks, in a single pass
+        NOTE - this results in a document-order created list of attachments for AssetBlocks
         """
-        _s1: BuilderState = dc.replace(s, elements=[])
-        _s2: BuilderState = reduce(lambda _s, x: x._to_xml(_s), self.blocks, _s1)
-        _s3: BuilderState = dc.replace(_s2, elements=s.elements)
-
-        # build the element
-        _E = getattr(E, self._tag)
-        _s3.add_element(self, _E(*_s2.elements, **self._attributes))
-        return _s3
+        return build_blocks([self], s)
 
 
 class Page(LayoutBlock):
@@ -392,6 +687,9 @@ class EmbeddedTextBlock(DataBlock):
         super().__init__(name, **kwargs)
         self.content = content.strip()
 
+    def _fingerprint(self) -> t.Hashable:
+        return (super()._fingerprint(), self.content)
+
     def _to_xml(self, s: BuilderState) -> BuilderState:
         # NOTE - do we use etree.CDATA wrapper?
         _E = getattr(E, self._tag)
@@ -609,28 +907,47 @@ class AssetBlock(DataBlock):
     AssetBlock objects form basis of all File-related blocks (abstract class, not exported)
     """
 
-    file: Path = None
+    _file: AssetFile = None
     file_attribs: SSDict = None
     caption: t.Optional[str] = None
 
-    def __init__(self, file: Path, caption: str = None, name: str = None, label: str = None, **kwargs):
+    def __init__(self, file: AssetFile, caption: str = None, name: str = None, label: str = None, **kwargs):
         # storing objects for delayed upload
         super().__init__(name=name, label=label, **kwargs)
-        self.file = Path(file)
+        self._file = file if isinstance(file, (Future, LazyAsset)) else Path(file)
         self.caption = caption or ""
 
+    @property
+    def file(self) -> Path:
+        """The asset file, serialising it if deferred, or waiting on it to be written if serialised in the background"""
+        if isinstance(self._file, LazyAsset):
+            self._file = self._file()
+        elif isinstance(self._file, Future):
+            self._file = self._file.result()
+        return self._file
+
+    @property
+    def is_serialized(self) -> bool:
+        return isinstance(self._file, Path)
+
+    def _fingerprint(self) -> t.Hashable:
+        return (super()._fingerprint(), self.file, self.caption, tuple(self.get_file_attribs().items()))
+
     def get_file_attribs(self) -> t.Dict[str, str]:
         """per-file-type attributes, override if needed"""
         return self.file_attribs or dict()
 
+    def _element_attributes(self) -> SSDict:
+        """The block's attributes for its element, override to add any computed when built"""
+        return self._attributes
+
     def _b64_encode_src(self, content_type: MIME) -> str:
         """
         load the file and embed into a data-uri
-        NOTE - currently we read entire file into memory first prior to b64 encoding,
-        to consider using base64io-python to stream and encode in 1-pass
+        NOTE - the file is encoded in chunks, however the resulting data-uri is still held in memory,
+        use a streamed BuilderState to write large assets directly to the output instead
         """
-        content = b64encode(self.file.read_bytes()).decode("ascii")
-        return f"data:{content_type};base64,{content}"
+        return b64_encode_file(self.file, prefix=f"data:{content_type};base64,")
 
     def _to_xml(self, s: BuilderState) -> BuilderState:
         _E = getattr(E, self._tag)
@@ -639,19 +956,25 @@ class AssetBlock(DataBlock):
         if s.embedded or s.served:
             content_type = guess_type(self.file)
             file_size = str(self.file.stat().st_size)
-            src = self._b64_encode_src(content_type) if s.embedded else f"/data/{self.file.name}"
+            if not s.embedded:
+                # content-addressed, so the served asset can be cached indefinitely
+                src = f"/data/{content_addressed_name(self.file)}"
+            elif s.stream_id:
+                src = f"data:{content_type};base64,{s.streamed_asset_ref()}"
+            else:
+                src = self._b64_encode_src(content_type)
 
             e = _E(
                 type=content_type,
                 size=file_size,
                 uploaded_filename=self.file.name,
-                **self._attributes,
+                **self._element_attributes(),
                 **self.get_file_attribs(),
                 src=src,
             )
         else:
             e = _E(
-                **self._attributes,
+                **self._element_attributes(),
                 src=f"attachment://{s.attachment_count}",
             )
 
@@ -659,11 +982,11 @@ class AssetBlock(DataBlock):
             e.set("caption", self.caption)
         return s.add_element(self, e, self.file)
 
-    def _save_obj(cls, data: t.Any) -> DPTmpFile:
+    def _save_obj(cls, data: t.Any) -> AssetFile:
         # import here as a very slow module due to nested imports
-        from ..files import save
+        from ..files import get_wrapper, save
 
-        return save(data)
+        return serialize_asset(save, data, threaded=get_wrapper(data, error_msg=None).thread_safe)
 
 
 class Media(AssetBlock):
@@ -724,13 +1047,12 @@ class Attachment(AssetBlock):
 
         ..note:: either `data` or `file` must be provided
         """
-        if file:
-            file = Path(file).expanduser()
-        else:
-            out_fn = self._save_obj(data)
-            file = out_fn.file
+        _file = Path(file).expanduser() if file else self._save_obj(data)
+        super().__init__(file=_file, filename=filename, name=name, caption=caption, label=label)
 
-        super().__init__(file=file, filename=filename or file.name, name=name, caption=caption, label=label)
+    def _element_attributes(self) -> SSDict:
+        # default to the name of the (possibly background-serialised) file, without changing the block when built
+        return self._attributes if "filename" in self._attributes else dict(self._attributes, filename=self.file.name)
 
 
 class Plot(AssetBlock):
@@ -759,11 +1081,14 @@ class Plot(AssetBlock):
             name: A unique name for the block to reference when adding text or embedding (optional)
             label: A label used when displaying the block (optional)
         """
-        out_fn = self._save_obj(data)
-        if out_fn.mime == PKL_MIMETYPE:
+        # import here as a very slow module due to nested imports
+        from ..files import BasePickleWriter, get_wrapper
+
+        if isinstance(get_wrapper(data, error_msg=None), BasePickleWriter):
             raise DPError("Can't embed object as a plot")
 
-        super().__init__(file=out_fn.file, caption=caption, responsive=responsive, scale=scale, name=name, label=label)
+        file = self._save_obj(data)
+        super().__init__(file=file, caption=caption, responsive=responsive, scale=scale, name=name, label=label)
 
 
 class Table(AssetBlock):
@@ -786,8 +1111,8 @@ class Table(AssetBlock):
             name: A unique name for the block to reference when adding text or embedding (optional)
             label: A label used when displaying the block (optional)
         """
-        out_fn = self._save_obj(data)
-        super().__init__(file=out_fn.file, caption=caption, name=name, label=label)
+        file = self._save_obj(data)
+        super().__init__(file=file, caption=caption, name=name, label=label)
 
 
 class DataTable(AssetBlock):
@@ -816,11 +1141,11 @@ class DataTable(AssetBlock):
             name: A unique name for the block to reference when adding text or embedding (optional)
             label: A label used when displaying the block (optional)
         """
-        fn = save_df(df)
+        file = serialize_asset(save_df, df)
         (rows, columns) = df.shape
         # TODO - support pyarrow schema for local reports
         self.file_attribs = mk_attribs(rows=rows, columns=columns, schema="[]")
-        super().__init__(file=fn.file, caption=caption, name=name, label=label)
+        super().__init__(file=file, caption=caption, name=name, label=label)
 
 
 class Divider(EmbeddedTextBlock):
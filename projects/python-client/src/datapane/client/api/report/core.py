@@ -18,7 +18,7 @@ from datapane.client.api.common import DPTmpFile
 from datapane.client.api.dp_object import DPObjectRef
 from datapane.client.utils import DPError
 
-from .blocks import BlockOrPrimitive, Page, PageOrPrimitive
+from .blocks import BlockOrPrimitive, BuildCache, Page, PageOrPrimitive
 
 CDN_BASE: str = os.getenv("DATAPANE_CDN_BASE", f"https://datapane-cdn.com/v{dp_version}")
 
@@ -104,6 +104,7 @@ class App(DPObjectRef):
 
     _tmp_report: t.Optional[Path] = None  # Temp local report
     _preview_file = DPTmpFile(f"{uuid4().hex}.html")
+    _build_cache: t.Optional[BuildCache] = None  # Elements from the previous build
     list_fields: t.List[str] = ["name", "web_url", "project"]
 
     endpoint: str = "/reports/"
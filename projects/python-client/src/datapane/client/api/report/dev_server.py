@@ -0,0 +1,267 @@
+"""
+Datapane live-reload dev server
+
+Re-runs a report script within the current, warm, interpreter whenever it or any of its inputs change,
+rebuilds the app incrementally and tells any open browser tabs to reload via server-sent events
+"""
+import os
+import runpy
+import site
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import typing as t
+import webbrowser
+from pathlib import Path
+from uuid import uuid4
+
+from datapane.client import config as c
+from datapane.client.api.asset_cache import AssetCache, using_asset_cache
+from datapane.client.api.runtime import _reset_runtime
+from datapane.client.utils import display_msg, failure_msg
+from datapane.common import NPath, SDict, log
+
+from .blocks import BuildCache
+from .core import App
+from .processors import SERVED_REPORT_ASSETS_DIR, Server, capture_apps
+from .server import AppHTTPHandler, make_server
+
+__all__ = ["DevServer"]
+
+EVENTS_PATH = "/_dp/events"
+RELOAD_SCRIPT = f'<script>new EventSource("{EVENTS_PATH}").onmessage = () => location.reload();</script>'
+POLL_INTERVAL = 0.5
+KEEPALIVE_INTERVAL = 15.0
+
+# files opened by the running script, tracked via an audit hook, as the hook can't be removed once added
+_opened_files: t.Optional[t.Set[str]] = None
+_audit_hook_lock = threading.Lock()
+_audit_hook_installed = False
+
+
+def _audit_hook(event: str, args: t.Tuple[t.Any, ...]) -> None:
+    if _opened_files is not None and event == "open" and isinstance(args[0], (str, bytes, os.PathLike)):
+        mode = args[1] if len(args) > 1 and isinstance(args[1], str) else "r"
+        if "r" in mode or "+" in mode:
+            _opened_files.add(os.fsdecode(args[0]))
+
+
+def _install_audit_hook() -> None:
+    """Install the audit hook on first use, i.e. only in processes running the dev server"""
+    global _audit_hook_installed
+    with _audit_hook_lock:
+        if not _audit_hook_installed and hasattr(sys, "addaudithook"):
+            sys.addaudithook(_audit_hook)
+            _audit_hook_installed = True
+
+
+class ReloadEvents:
+    """A version counter that clients can wait on to be notified of each new build"""
+
+    def __init__(self):
+        self.version = 0
+        self._cond = threading.Condition()
+
+    def notify(self) -> None:
+        with self._cond:
+            self.version += 1
+            self._cond.notify_all()
+
+    def wait(self, version: int, timeout: t.Optional[float] = None) -> int:
+        """Wait until a build newer than `version`, returning the latest version, or `version` on timeout"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version > version, timeout=timeout)
+            return self.version
+
+
+class DevHTTPHandler(AppHTTPHandler):
+    """Serves the app along with a server-sent event stream, sending a reload event on each new build"""
+
+    events: ReloadEvents
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != EVENTS_PATH:
+            return super().do_GET()
+
+        # only send the builds after connecting
+        version = self.events.version
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            while True:
+                latest = self.events.wait(version, timeout=KEEPALIVE_INTERVAL)
+                # send a comment to detect closed connections, otherwise the reload event
+                self.wfile.write(b"data: reload\n\n" if latest > version else b": keepalive\n\n")
+                self.wfile.flush()
+                version = latest
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class DevServer:
+    """
+    Runs a report script and serves the app it builds, re-running and rebuilding whenever the script,
+    any local modules it imports, or any files it reads change.
+
+    The apps saved, built, served or uploaded by the script are captured rather than processed, with the last one served.
+    Blocks are cached across runs, and their assets within the asset cache whilst running the script,
+    so only the blocks that change are rebuilt.
+    Files read by the script are watched if `watch_reads` is set, via an audit hook installed on the first run
+    """
+
+    def __init__(
+        self,
+        script: NPath,
+        params: t.Optional[SDict] = None,
+        name: str = "app",
+        watch_reads: bool = True,
+        asset_cache: bool = True,
+    ):
+        self.script = Path(script).absolute()
+        self.params = params or {}
+        self.name = name
+        self.watch_reads = watch_reads
+        # cache the assets of unchanged blocks on disk, as each run recreates them
+        self.asset_cache = AssetCache() if asset_cache else None
+        self.events = ReloadEvents()
+        # the app is always rebuilt, so cache the blocks from the first build onwards
+        self.build_cache = BuildCache(builds=1)
+        self.dest = Path(tempfile.mkdtemp(prefix="dp-dev-"))
+        self.path = self.dest / name
+        self._watched: t.Dict[str, t.Optional[int]] = {}
+        root = self.script.parent
+        # files under these are libraries, or written by datapane itself, rather than inputs of the script
+        excluded: t.List[NPath] = [*site.getsitepackages(), site.getusersitepackages(), sys.prefix]
+        excluded.extend([tempfile.gettempdir(), c.APP_DIR])
+        self._root = root
+        self._excluded = [os.path.abspath(x) for x in excluded if not str(root).startswith(os.path.abspath(x))]
+
+    def _is_local(self, mod: t.Any) -> bool:
+        """Whether the module is part of the script's project, rather than a library"""
+        f = getattr(mod, "__file__", None)
+        if not f:
+            return False
+        f = os.path.abspath(f)
+        return f.startswith(str(self._root)) and not any(f.startswith(x) for x in self._excluded)
+
+    def run(self) -> bool:
+        """Run the script and rebuild the app it creates, returning whether it succeeded"""
+        global _opened_files
+        start = time.perf_counter()
+        _reset_runtime(self.params)
+        # reimport any local modules, so that changes to them are picked up
+        for (mod_name, mod) in list(sys.modules.items()):
+            if self._is_local(mod):
+                del sys.modules[mod_name]
+
+        (argv, sys_path) = (sys.argv, list(sys.path))
+        sys.argv = [str(self.script)]
+        sys.path.insert(0, str(self._root))
+        opened: t.Set[str] = set()
+        if self.watch_reads:
+            _install_audit_hook()
+            _opened_files = opened
+        try:
+            with using_asset_cache(self.asset_cache):
+                scope: SDict = {}
+                with capture_apps() as apps:
+                    try:
+                        scope = runpy.run_path(str(self.script), run_name="__main__")
+                    except SystemExit as e:
+                        # a successful exit still creates the apps captured
+                        if e.code not in (None, 0):
+                            raise
+                # only track the files read by the script itself, rather than when building
+                _opened_files = None
+                app = (
+                    apps[-1] if apps else next((x for x in reversed(list(scope.values())) if isinstance(x, App)), None)
+                )
+                if app is None:
+                    failure_msg(f"No app was created by {self.script.name}")
+                    return False
+                self._build(app)
+        except (Exception, SystemExit):
+            failure_msg(f"Error running {self.script.name}, keeping the previous build\n{traceback.format_exc()}")
+            return False
+        finally:
+            self._update_watched(opened)
+            _opened_files = None
+            sys.argv = argv
+            sys.path[:] = sys_path
+
+        display_msg(f"Rebuilt app in {time.perf_counter() - start:.2f}s")
+        self.events.notify()
+        return True
+
+    def _build(self, app: App) -> None:
+        # share the cached blocks across runs, as each run creates a new App
+        app._build_cache = self.build_cache
+        Server(app).build(name=self.name, dest=self.dest, overwrite=True)
+        # add the reload listener to the document, atomically as it may be being served
+        index = self.path / "index.html"
+        html = index.read_text(encoding="utf-8").replace("</body>", f"{RELOAD_SCRIPT}</body>", 1)
+        tmp_index = self.path / f".{uuid4().hex}.html"
+        tmp_index.write_text(html, encoding="utf-8")
+        os.replace(tmp_index, index)
+
+    def _update_watched(self, opened: t.Set[str]) -> None:
+        files = {str(self.script)}
+        files.update(os.path.abspath(m.__file__) for m in list(sys.modules.values()) if self._is_local(m))
+        files.update(
+            f
+            for f in map(os.path.abspath, opened)
+            if os.path.isfile(f) and not any(f.startswith(x) for x in self._excluded)
+        )
+        self._watched = {f: self._mtime(f) for f in files}
+
+    @staticmethod
+    def _mtime(f: str) -> t.Optional[int]:
+        try:
+            return os.stat(f).st_mtime_ns
+        except OSError:
+            return None
+
+    def changed(self) -> t.List[str]:
+        """The watched files that have changed since the last run"""
+        return [f for (f, mtime) in self._watched.items() if self._mtime(f) != mtime]
+
+    def watch(self, stop: t.Optional[threading.Event] = None) -> None:
+        """Poll the watched files, re-running the script on any changes"""
+        stop = stop or threading.Event()
+        while not stop.wait(POLL_INTERVAL):
+            changed = self.changed()
+            if changed:
+                log.info(f"Detected changes in {', '.join(changed)}")
+                self.run()
+
+    def go(self, host: str = "localhost", port: int = 8000, open: bool = True) -> None:
+        if not self.run():
+            display_msg("Waiting for changes to the script to build the app")
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        server = make_server(
+            self.path,
+            host,
+            port,
+            immutable_prefix=f"/{SERVED_REPORT_ASSETS_DIR}/",
+            handler=DevHTTPHandler,
+            events=self.events,
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        display_msg(f"Dev server started at http://{host}:{port}, watching {self.script.name} for changes")
+        if open:
+            webbrowser.open_new_tab(f"http://{host}:{port}")
+
+        try:
+            self.watch()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
+            server.server_close()
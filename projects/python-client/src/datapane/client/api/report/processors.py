@@ -4,39 +4,55 @@ Datapane Processors
 Describes an API for serializing a Report object, rendering it locally and publishing to a remote server
 """
 
+import codecs
+import hashlib
+import json
 import os
 import threading
 import typing as t
 import webbrowser
 from abc import ABC
 from base64 import b64encode
-from functools import reduce
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+from copy import deepcopy
+from functools import partial
 from os import path as osp
 from pathlib import Path
-from shutil import copy, copytree, rmtree
+from shutil import copy, rmtree
 from time import sleep
 from uuid import uuid4
 
 import importlib_resources as ir
-from jinja2 import Environment, FileSystemLoader, Template, pass_context
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
 from lxml import etree
 from lxml.etree import Element, _Element
 from markupsafe import Markup  # used by Jinja
 
+from datapane import __version__
 from datapane.client import config as c
 from datapane.client.analytics import _NO_ANALYTICS, capture, capture_event
 from datapane.client.api.common import Resource
 from datapane.client.api.runtime import _report
 from datapane.client.utils import DPError, InvalidReportError, display_msg
-from datapane.common import NPath, SDict, dict_drop_empty, log, timestamp
-from datapane.common.report import local_report_def, validate_report_doc
-from datapane.common.utils import compress_file
-
-from .blocks import BuilderState, E
+from datapane.common import NPath, SDict, dict_drop_empty, log
+from datapane.common import report as dp_report
+from datapane.common import timestamp
+from datapane.common.compression import (
+    DEFAULT_POLICY,
+    CompressionStats,
+    available_encodings,
+    compress_to,
+    variant_path,
+)
+from datapane.common.report import validate_doc_structure, validate_names, validate_report_doc
+from datapane.common.utils import content_addressed_name, iter_b64_file, link_or_copy, paused_gc
+
+from .blocks import BuildCache, BuilderState, E, build_blocks, streamed_asset_pattern, wait_for_assets
 from .core import CDN_BASE, App, AppFormatting, AppWidth
+from .server import MEMORY_CACHE_SIZE, MemoryCache, make_host_server, make_server
 
-__all__ = ["upload", "save_report", "stringify_report", "serve", "build"]
+__all__ = ["upload", "save_report", "stringify_report", "serve", "build", "serve_apps"]
 
 
 # TODO - Refactor to share dp_tags.widths
@@ -47,34 +63,146 @@ report_width_classes = {
 }
 
 
-local_post_xslt = etree.parse(str(local_report_def / "local_post_process.xslt"))
-local_post_transform = etree.XSLT(local_post_xslt)
-
 VUE_ESM_FILE = "vue.esm-browser.prod.js"
 SERVED_REPORT_BUNDLE_DIR = "static"
 SERVED_REPORT_ASSETS_DIR = "data"
+SERVED_ASSET_STORE_DIR = "served-assets"
+BUILD_MANIFEST_FILE = ".dp-manifest.json"
+# cache the compiled templates on disk, to speed up rendering in new processes
+TEMPLATE_BYTECODE_CACHE: bool = bool(os.environ.get("DATAPANE_TEMPLATE_CACHE", ""))
+
+
+def _text_element(tag: str, x: t.Optional[str], cdata: bool = False) -> Element:
+    # whitespace-only text is dropped from the document
+    e = etree.Element(tag)
+    if x and not x.isspace():
+        e.text = etree.CDATA(x) if cdata else x
+    return e
+
+
+def _escape_json_str(x: str) -> str:
+    """Escape a string fragment as per Jinja's `tojson` filter, without the surrounding quotes"""
+    return (
+        json.dumps(x)[1:-1]
+        .replace("<", "\\u003c")
+        .replace(">", "\\u003e")
+        .replace("&", "\\u0026")
+        .replace("'", "\\u0027")
+    )
 
 
-class CompressedAssetsHTTPHandler(SimpleHTTPRequestHandler):
+class StreamingDocWriter:
     """
-    Python HTTP server for served local apps,
-    with correct encoding header set on compressed assets
+    File-like sink that lxml serialises the report document into,
+    writing it to the output as a JSON string as it goes (matching the `tojson` template filter),
+    and replacing any streamed asset placeholders with the asset's base64-encoded contents.
+    This means the full document, including embedded assets, is never held in memory as a single string
     """
 
-    def end_headers(self):
-        if self.path.startswith(f"/{SERVED_REPORT_ASSETS_DIR}") and not self.path.endswith(VUE_ESM_FILE):
-            self.send_header("Content-Encoding", "gzip")
-        super().end_headers()
+    def __init__(self, out: t.TextIO, assets: t.Sequence[Path] = (), stream_id: t.Optional[str] = None):
+        self.out = out
+        self.assets = assets
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._placeholder = streamed_asset_pattern(stream_id) if stream_id else None
+        # the longest placeholder (with a generous index) that may be split across writes
+        self._max_placeholder_len = len(f"dp-streamed-asset-{stream_id}-") + 20
+
+    def write_doc(self, report_doc: etree._ElementTree) -> None:
+        self.out.write('"')
+        report_doc.write(self, encoding="utf-8")
+        self._buf += self._decoder.decode(b"", final=True)
+        self._flush(final=True)
+        self.out.write('"')
+
+    def write(self, data: bytes) -> None:
+        """Called by lxml during serialisation"""
+        self._buf += self._decoder.decode(data)
+        self._flush()
+
+    def _flush(self, final: bool = False) -> None:
+        if self._placeholder:
+            m = self._placeholder.search(self._buf)
+            while m:
+                self.out.write(_escape_json_str(self._buf[: m.start()]))
+                self._write_asset(self.assets[int(m.group(1))])
+                self._buf = self._buf[m.end() :]
+                m = self._placeholder.search(self._buf)
+            # hold back anything that may be the start of a placeholder split across writes
+            keep = 0 if final else min(len(self._buf), self._max_placeholder_len)
+        else:
+            keep = 0
+
+        split = len(self._buf) - keep
+        self.out.write(_escape_json_str(self._buf[:split]))
+        self._buf = self._buf[split:]
+
+    def _write_asset(self, f: Path) -> None:
+        # base64 output is JSON-safe so doesn't need escaping
+        for chunk in iter_b64_file(f):
+            self.out.write(chunk.decode("ascii"))
 
 
-@pass_context
-def include_raw(ctx, name) -> Markup:  # noqa: ANN001
-    """Normal jinja2 {% include %} doesn't escape {{...}} which appear in React's source code"""
-    env = ctx.environment
-    # Escape </script> to prevent 3rd party JS terminating the local app bundle.
-    # Note there's an extra "\" because it needs to be escaped at both the python and JS level
-    src = env.loader.get_source(env, name)[0].replace("</script>", r"<\\/script>")
-    return Markup(src)
+class RenderEngine:
+    """
+    A process-wide Jinja environment for rendering the local app templates, shared across processors,
+    that caches the compiled templates and the static fragments they include, i.e. the logo and JS bundle
+    """
+
+    def __init__(self, assets: Path):
+        self.assets = assets
+        self._lock = threading.Lock()
+        # cached by filename and mtime, so updated bundles are reloaded
+        self._fragments: t.Dict[t.Tuple[str, int], Markup] = {}
+        self._logo: t.Optional[str] = None
+
+        bytecode_cache = None
+        if TEMPLATE_BYTECODE_CACHE:
+            cache_dir = c.APP_DIR / "template-cache"
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(str(cache_dir))
+        self.env = Environment(loader=FileSystemLoader(assets), bytecode_cache=bytecode_cache)
+        self.env.globals["include_raw"] = self.include_raw
+
+    @property
+    def logo(self) -> str:
+        if self._logo is None:
+            logo_img = (self.assets / "datapane-logo-dark.png").read_bytes()
+            self._logo = f"data:image/png;base64,{b64encode(logo_img).decode('ascii')}"
+        return self._logo
+
+    def get_template(self, name: str) -> Template:
+        # NOTE - the environment caches compiled templates, reloading them if changed on disk
+        return self.env.get_template(name)
+
+    def include_raw(self, name: str) -> Markup:
+        """Normal jinja2 {% include %} doesn't escape {{...}} which appear in React's source code"""
+        f = self.assets / name
+        key = (name, f.stat().st_mtime_ns)
+        src = self._fragments.get(key)
+        if src is None:
+            with self._lock:
+                # Escape </script> to prevent 3rd party JS terminating the local app bundle.
+                # Note there's an extra "\" because it needs to be escaped at both the python and JS level
+                src = Markup(f.read_text(encoding="utf-8").replace("</script>", r"<\\/script>"))
+                # only keep the latest version of each fragment
+                self._fragments = {k: v for (k, v) in self._fragments.items() if k[0] != name}
+                self._fragments[key] = src
+        return src
+
+
+_render_engines: t.Dict[str, RenderEngine] = {}
+_render_engines_lock = threading.Lock()
+
+
+def get_render_engine(assets: Path) -> RenderEngine:
+    """Get the shared render engine for the templates within the given assets dir"""
+    key = str(assets)
+    engine = _render_engines.get(key)
+    if engine is None:
+        with _render_engines_lock:
+            engine = _render_engines.setdefault(key, RenderEngine(assets))
+    return engine
 
 
 class Processor:
@@ -86,6 +214,13 @@ class Processor:
 
     def __init__(self, app: App):
         self.app = app
+        # keep the results of each build on the App, so unchanged blocks are reused when rebuilt
+        if self.app._build_cache is None:
+            self.app._build_cache = BuildCache()
+
+    @property
+    def build_cache(self) -> BuildCache:
+        return self.app._build_cache
 
     def _to_xml(
         self,
@@ -94,14 +229,38 @@ class Processor:
         title: str = "Title",
         description: str = "Description",
         author: str = "Anonymous",
+        stream_id: t.Optional[str] = None,
+        validate: bool = False,
     ) -> t.Tuple[Element, t.List[Path]]:
-        """Build XML report document"""
-        # convert Pages to XML
-        s = BuilderState(embedded, served)
-        _s = reduce(lambda _s, p: p._to_xml(_s), self.app.pages, s)
+        """Build XML report document, optionally validating each element as it's built"""
+        wait_for_assets(self.app.pages)
+
+        # convert Pages to XML, building directly into the Pages element
+        # NOTE - blocks are only cached once an App is rebuilt, so one-off builds don't pay for fingerprinting,
+        #  and never when assets are inlined, to avoid keeping their base64-encoded contents in memory
+        cache = self.build_cache
+        cacheable = self._cacheable(embedded, stream_id)
+        use_cache = cacheable and cache.builds > 0
+        pages: _Element = E.Pages()
+        s = BuilderState(
+            embedded,
+            served,
+            stream_id=stream_id,
+            validate=validate,
+            cache=cache if use_cache else None,
+            elements=pages,
+        )
+        try:
+            with paused_gc():
+                _s = build_blocks(self.app.pages, s)
+        except Exception:
+            cache.reset()
+            raise
+        if cacheable:
+            cache.builds += 1
+        if use_cache:
+            cache.finish()
 
-        # create the pages
-        pages: _Element = E.Pages(*_s.elements)
         if self.app.page_layout:
             pages.set("layout", self.app.page_layout.value)
 
@@ -115,10 +274,11 @@ class Processor:
         # add optional Meta
         if embedded or served:
             meta = E.Meta(
-                E.Author(author or ""),
+                _text_element("Author", author),
                 E.CreatedOn(timestamp()),
-                E.Title(title),
-                E.Description(description),
+                _text_element("Title", title),
+                # NOTE - Description is the only Meta text written as CDATA, as with the Text blocks
+                _text_element("Description", description, cdata=True),
             )
             report_doc.insert(0, meta)
         return report_doc, _s.attachments
@@ -133,24 +293,80 @@ class Processor:
         validate: bool = True,
     ) -> t.Tuple[str, t.List[Path]]:
         """Generate a report for saving/uploading"""
-        report_doc, attachments = self._to_xml(embedded, served, title, description, author)
+        processed_report_doc, attachments = self._gen_report_doc(embedded, served, title, description, author, validate)
+
+        # convert to string
+        report_str = etree.tounicode(processed_report_doc)
+        log.debug("Successfully Built App")
+        # log.debug(report_str)
+        return report_str, attachments
 
+    def _gen_report_doc(
+        self,
+        embedded: bool,
+        served: bool,
+        title: str = "Title",
+        description: str = "Description",
+        author: str = "Anonymous",
+        validate: bool = True,
+        stream_id: t.Optional[str] = None,
+    ) -> t.Tuple[etree._ElementTree, t.List[Path]]:
+        """Generate the processed report document, prior to conversion to a string"""
         if embedded and served:
             raise DPError("App can't be both embedded and served")
 
-        # post_process and validate
-        processed_report_doc = local_post_transform(
-            report_doc, embedded="true()" if embedded else "false()", served="true()" if served else "false()"
+        # reuse the previous document if nothing has changed, skipping post-processing and validation
+        cache = self.build_cache
+        doc_key: t.Optional[t.Hashable] = None
+        if cache.builds and self._cacheable(embedded, stream_id):
+            wait_for_assets(self.app.pages)
+            with paused_gc():
+                pages_fp = tuple(cache.fingerprint(p) for p in self.app.pages)
+            doc_key = (
+                embedded,
+                served,
+                validate,
+                stream_id,
+                title,
+                description,
+                author,
+                self.app.page_layout,
+                pages_fp,
+            )
+            if cache.doc and cache.doc[0] == doc_key:
+                cache.reset()
+                (_, processed_report_doc, attachments) = cache.doc
+                if embedded or served:
+                    processed_report_doc.find("Meta/CreatedOn").text = timestamp()
+                log.debug("Reusing unchanged App document")
+                return processed_report_doc, attachments
+
+        # validate each distinct element as it's built, rather than the whole document, unless in strict mode
+        strict = validate and dp_report.STRICT_VALIDATION
+        report_doc, attachments = self._to_xml(
+            embedded, served, title, description, author, stream_id, validate=validate and not strict
         )
-        if validate:
+
+        # NOTE - the builder generates the final document directly, i.e. without comments or whitespace-only text,
+        # so no post-processing copy of the tree is needed
+        processed_report_doc = etree.ElementTree(report_doc)
+        if strict:
             validate_report_doc(xml_doc=processed_report_doc)
+        elif validate:
+            root = processed_report_doc.getroot()
+            validate_doc_structure(root)
+            validate_names(root)
+        if validate:
             self._report_status_checks(processed_report_doc, embedded)
 
-        # convert to string
-        report_str = etree.tounicode(processed_report_doc)
-        log.debug("Successfully Built App")
-        # log.debug(report_str)
-        return report_str, attachments
+        if doc_key is not None:
+            cache.doc = (doc_key, processed_report_doc, attachments)
+        return processed_report_doc, attachments
+
+    @staticmethod
+    def _cacheable(embedded: bool, stream_id: t.Optional[str]) -> bool:
+        """Whether documents can be cached, i.e. assets are referenced, or streamed, rather than inlined"""
+        return not embedded or stream_id is not None
 
     def _report_status_checks(self, processed_report_doc: etree._ElementTree, embedded: bool):
         # check for any unsupported local features, e.g. DataTable
@@ -160,8 +376,8 @@ class Processor:
 
         # App checks
         # TODO - validate at least a single element
-        asset_blocks = processed_report_doc.xpath("count(/Report/Pages/Page/*)")
-        if asset_blocks == 0:
+        pages = processed_report_doc.find("Pages")
+        if not any(len(p) for p in pages.iterchildren("Page")):
             raise InvalidReportError("Empty app - must contain at least one asset/block")
 
 
@@ -181,36 +397,46 @@ class LocalProcessor(Processor, ABC):
 
     def _setup_template(self):
         self.assert_bundle_exists()
-
-        # load the logo
-        logo_img = (self.assets / "datapane-logo-dark.png").read_bytes()
-        self.logo = f"data:image/png;base64,{b64encode(logo_img).decode('ascii')}"
-
-        template_loader = FileSystemLoader(self.assets)
-        template_env = Environment(loader=template_loader)
-        template_env.globals["include_raw"] = include_raw
-        self.template = template_env.get_template(self.template_name)
+        engine = get_render_engine(self.assets)
+        self.logo = engine.logo
+        self.template = engine.get_template(self.template_name)
 
     def write(
         self,
-        report_doc: str,
+        report_doc: etree._ElementTree,
         path: str,
         name: str,
         cdn_base: str = CDN_BASE,
         standalone: bool = False,
         author: t.Optional[str] = None,
         formatting: AppFormatting = None,
+        assets: t.Sequence[Path] = (),
+        stream_id: t.Optional[str] = None,
     ) -> str:
-        report_id, r = self.render(
-            report_doc,
-            name,
-            cdn_base,
-            standalone,
-            author,
-            formatting,
-        )
-
-        Path(path).write_text(r, encoding="utf-8")
+        """
+        Render the template and report document directly to the file at `path`,
+        streaming the document (and any streamed assets) in pieces rather than building the output in memory
+        """
+        report_id, context = self._template_context(name, cdn_base, standalone, author, formatting)
+
+        # render the template around a marker, which we replace with the streamed document
+        marker = f"dp-report-doc-{report_id}"
+        json_marker = json.dumps(marker)
+        doc_written = False
+
+        with open(path, "w", encoding="utf-8") as f:
+            for chunk in self.template.generate(report_doc=marker, **context):
+                if not doc_written and json_marker in chunk:
+                    pre, _, post = chunk.partition(json_marker)
+                    f.write(pre)
+                    StreamingDocWriter(f, assets, stream_id).write_doc(report_doc)
+                    f.write(post)
+                    doc_written = True
+                else:
+                    f.write(chunk)
+
+        if not doc_written:
+            raise DPError(f"Template {self.template_name} doesn't include the report document")
 
         return report_id
 
@@ -223,6 +449,18 @@ class LocalProcessor(Processor, ABC):
         author: t.Optional[str] = None,
         formatting: AppFormatting = None,
     ) -> t.Tuple[str, str]:
+        report_id, context = self._template_context(name, cdn_base, standalone, author, formatting)
+        r = self.template.render(report_doc=report_doc, **context)
+        return report_id, r
+
+    def _template_context(
+        self,
+        name: str,
+        cdn_base: str = CDN_BASE,
+        standalone: bool = False,
+        author: t.Optional[str] = None,
+        formatting: AppFormatting = None,
+    ) -> t.Tuple[str, SDict]:
         if formatting is None:
             formatting = AppFormatting()
 
@@ -231,8 +469,7 @@ class LocalProcessor(Processor, ABC):
             self._setup_template()
 
         report_id: str = uuid4().hex
-        r = self.template.render(
-            report_doc=report_doc,
+        context = dict(
             report_width_class=report_width_classes.get(formatting.width),
             report_name=name,
             report_author=author,
@@ -247,7 +484,7 @@ class LocalProcessor(Processor, ABC):
             cdn_base=cdn_base,
         )
 
-        return report_id, r
+        return report_id, context
 
     def assert_bundle_exists(self):
         resource_to_check = "report" if self.served else "local-report-base.css"
@@ -344,7 +581,9 @@ class Uploader(Processor):
         report_str, attachments = self._gen_report(embedded=False, served=False, title=name, description=description)
         files = dict(attachments=attachments)
 
-        res = Resource(self.app.endpoint).post_files(files, overwrite=overwrite, document=report_str, **kwargs)
+        res = Resource(self.app.endpoint, client=self.app._client).post_files(
+            files, overwrite=overwrite, compress_fields=["document"], document=report_str, **kwargs
+        )
 
         # Set dto based on new URL
         self.app.url = res.url
@@ -407,7 +646,9 @@ class Saver(LocalProcessor):
         if not name:
             name = Path(path).stem[:127]
 
-        local_doc, _ = self._gen_report(embedded=True, served=False, title=name)
+        # stream embedded assets directly into the output file, rather than inlining within the document
+        stream_id = self.build_cache.stream_id
+        local_doc, assets = self._gen_report_doc(embedded=True, served=False, title=name, stream_id=stream_id)
         report_id = self.write(
             local_doc,
             path,
@@ -415,6 +656,8 @@ class Saver(LocalProcessor):
             cdn_base=cdn_base,
             standalone=standalone,
             formatting=formatting,
+            assets=assets,
+            stream_id=stream_id,
         )
 
         display_msg(f"App saved to ./{path}")
@@ -426,6 +669,233 @@ class Saver(LocalProcessor):
         return report_id
 
 
+def _walk_files(path: Path) -> t.Iterator[t.Tuple[Path, Path]]:
+    """Walk all files within the dir, following symlinks, returning their path and path relative to the dir"""
+    for (root, _, files) in os.walk(path, followlinks=True):
+        for f in files:
+            src = Path(root) / f
+            yield (src, src.relative_to(path))
+
+
+# the blocks numbered in their captions by the frontend, by counter
+FIGURE_COUNTERS: t.Dict[str, t.Tuple[str, ...]] = {
+    "plots": ("Plot",),
+    "tables": ("Table", "DataTable"),
+    "formulas": ("Formula",),
+    "codeBlocks": ("Code",),
+}
+
+
+def split_pages(report_doc: etree._ElementTree, page_src: t.Callable[[bytes], str]) -> etree._ElementTree:
+    """
+    Copy the document with each page after the first replaced by a placeholder, referencing the page serialised
+    separately via `page_src`, so that large multi-page apps only load each page when it's shown.
+    Placeholders include the figure counts of the pages before them, so figures are numbered as if loaded upfront
+    NOTE - the document itself is left unchanged, as it may be reused by the next build
+    """
+    root = report_doc.getroot()
+    doc = etree.Element(root.tag, root.attrib)
+    for x in root:
+        if x.tag != "Pages":
+            doc.append(deepcopy(x))
+            continue
+        pages = etree.SubElement(doc, "Pages", x.attrib)
+        (first, *rest) = x
+        pages.append(deepcopy(first))
+        counts = dict.fromkeys(FIGURE_COUNTERS, 0)
+        for (prev, page) in zip(x, rest):
+            for (counter, tags) in FIGURE_COUNTERS.items():
+                counts[counter] += sum(1 for _ in prev.iter(*tags))
+            src = page_src(etree.tostring(page, encoding="utf-8", with_tail=False))
+            etree.SubElement(pages, "Page", dict(page.attrib, src=src, counts=json.dumps(counts)))
+    return etree.ElementTree(doc)
+
+
+class AssetStore:
+    """
+    A content-addressed store of the assets of all the apps built, within the datapane config directory,
+    hardlinked (or copied, if not possible) into each app, so unchanged assets are shared across rebuilds and apps,
+    rather than being stored (and compressed) again.
+    The apps using the store are registered with it, and assets kept whilst listed in the manifest of any of them
+    """
+
+    def __init__(self, path: t.Optional[Path] = None):
+        self.path = path or c.APP_DIR / SERVED_ASSET_STORE_DIR
+        self.apps_dir = self.path / ".apps"
+
+    def register(self, app_path: Path) -> None:
+        """Register the app, so that its assets are kept until removed from its manifest"""
+        app_path = app_path.resolve()
+        self.apps_dir.mkdir(parents=True, exist_ok=True)
+        (self.apps_dir / hashlib.sha256(str(app_path).encode()).hexdigest()[:32]).write_text(str(app_path))
+
+    def link(self, name: str, write: t.Callable[[Path], t.Any], dest: Path) -> t.Any:
+        """Link the asset into `dest`, calling `write` to add it to the store first if missing"""
+        entry = self.path / name
+        res = None
+        if not entry.exists():
+            self.path.mkdir(parents=True, exist_ok=True)
+            tmp_f = self.path / f".{uuid4().hex}{entry.suffix}"
+            res = write(tmp_f)
+            os.replace(tmp_f, entry)
+        try:
+            link_or_copy(entry, dest)
+        except FileNotFoundError:
+            # removed concurrently, e.g. by another build
+            res = write(dest)
+        return res
+
+    def add_bytes(self, data: bytes, ext: str) -> Path:
+        """Add the data to the store if missing, named by its contents, returning its path in the store"""
+        entry = self.path / f"{hashlib.sha256(data).hexdigest()[:32]}{ext}"
+        if not entry.exists():
+            self.path.mkdir(parents=True, exist_ok=True)
+            tmp_f = self.path / f".{uuid4().hex}{ext}"
+            tmp_f.write_bytes(data)
+            os.replace(tmp_f, entry)
+        return entry
+
+    def used(self) -> t.Set[str]:
+        """The names of the assets used by the registered apps, unregistering any apps since removed"""
+        names: t.Set[str] = set()
+        if not self.apps_dir.is_dir():
+            return names
+        for ref in self.apps_dir.iterdir():
+            manifest = BuildManifest.load(Path(ref.read_text()))
+            if manifest is None:
+                ref.unlink()
+                continue
+            names.update(Path(f).name for f in manifest.files if f.startswith(f"{SERVED_REPORT_ASSETS_DIR}/"))
+        return names
+
+    def gc(self) -> None:
+        """Remove any assets that are no longer used by an app"""
+        if not self.path.is_dir():
+            return
+        used = self.used()
+        for f in self.path.iterdir():
+            # NOTE - skip hidden files, i.e. assets being written
+            if f.is_file() and not f.name.startswith(".") and f.name not in used:
+                with suppress(FileNotFoundError):
+                    f.unlink()
+
+
+class BuildManifest:
+    """
+    Tracks the files written by `Server.build`, each with a signature of its source, e.g. a content hash,
+    and the stat of the written file, so that rebuilding an app reuses any unchanged files from the previous build
+    """
+
+    def __init__(self, path: Path, prev: t.Optional["BuildManifest"] = None):
+        self.path = path
+        # relative file path -> (source signature, [size, mtime_ns])
+        self.files: t.Dict[str, t.Tuple[str, t.List[int]]] = {}
+        self.prev = prev
+        self._pending: t.List[t.Tuple[str, str, t.Callable[[Path], t.Any]]] = []
+        self._prev_by_sig: t.Dict[str, t.List[str]] = {}
+        if prev:
+            for (name, (sig, _)) in prev.files.items():
+                self._prev_by_sig.setdefault(sig, []).append(name)
+
+    @classmethod
+    def load(cls, path: Path) -> t.Optional["BuildManifest"]:
+        try:
+            x = json.loads((path / BUILD_MANIFEST_FILE).read_text())
+        except (OSError, ValueError):
+            return None
+        if x.get("version") != __version__:
+            return None
+        manifest = cls(path)
+        manifest.files = {k: tuple(v) for (k, v) in x["files"].items()}
+        return manifest
+
+    def save(self) -> None:
+        """Save the manifest, removing any files from the previous build that are no longer used"""
+        assert not self._pending, "Manifest must be flushed before saving"
+        if self.prev:
+            for name in self.prev.files.keys() - self.files.keys():
+                with suppress(FileNotFoundError):
+                    (self.path / name).unlink()
+        tmp_f = self.path / f".{uuid4().hex}.json"
+        tmp_f.write_text(json.dumps(dict(version=__version__, files=self.files)))
+        os.replace(tmp_f, self.path / BUILD_MANIFEST_FILE)
+
+    def _is_current(self, name: str) -> bool:
+        # check the file hasn't been changed since written
+        try:
+            st = (self.path / name).stat()
+        except FileNotFoundError:
+            return False
+        return [st.st_size, st.st_mtime_ns] == list(self.prev.files[name][1])
+
+    def _find_prev(self, name: str, sig: str) -> t.Optional[str]:
+        """Find an unused file with the same source in the previous build, preferring one with the same name"""
+        names = self._prev_by_sig.get(sig, [])
+        for n in sorted(names, key=lambda x: x != name):
+            if n not in self.files and self._is_current(n):
+                return n
+        return None
+
+    def add(self, rel_path: Path, sig: str, write: t.Callable[[Path], t.Any]) -> None:
+        """
+        Add the file at `rel_path`, calling `write` to write it on `flush` if it's new or changed.
+        Files unchanged from the previous build are kept, or moved if only their name has changed
+        """
+        name = rel_path.as_posix()
+        prev_name = self._find_prev(name, sig)
+        if prev_name == name:
+            self.files[name] = self.prev.files[name]
+            return
+
+        dest = self.path / rel_path
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if prev_name:
+            # the same contents under a new name, e.g. an attachment
+            os.replace(self.path / prev_name, dest)
+            self._prev_by_sig[sig].remove(prev_name)
+            self._record(name, sig)
+        else:
+            self._pending.append((name, sig, write))
+
+    def flush(self, max_workers: t.Optional[int] = None) -> t.List[t.Any]:
+        """Write the added files concurrently, returning the results of their `write` functions"""
+
+        def _write(x: t.Tuple[str, str, t.Callable[[Path], t.Any]]) -> t.Any:
+            (name, sig, write) = x
+            # write atomically, e.g. whilst the app is being served
+            dest = self.path / name
+            tmp_f = dest.with_name(f".{uuid4().hex}{dest.suffix}")
+            res = write(tmp_f)
+            os.replace(tmp_f, dest)
+            self._record(name, sig)
+            return res
+
+        pending, self._pending = self._pending, []
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dp-build") as executor:
+            return list(executor.map(_write, pending))
+
+    def _record(self, name: str, sig: str) -> None:
+        st = (self.path / name).stat()
+        self.files[name] = (sig, [st.st_size, st.st_mtime_ns])
+
+    @staticmethod
+    def _sig(src: Path) -> str:
+        st = src.stat()
+        return f"{src}:{st.st_size}:{st.st_mtime_ns}"
+
+    def add_copy(self, rel_path: Path, src: Path) -> None:
+        """Add a copy of the source file, e.g. from the app bundle, signed by the source's path and stat"""
+        # NOTE - the bundle is copied rather than hardlinked, so that editing the built app can't modify the package
+        src = src.resolve()
+        self.add(rel_path, self._sig(src), partial(copy, src))
+
+    def add_compressed(self, rel_path: Path, src: Path, encoding: str, level: int) -> None:
+        """Add the precompressed variant of the source file for `rel_path`"""
+        src = src.resolve()
+        sig = f"{self._sig(src)}:{encoding}:{level}"
+        self.add(variant_path(rel_path, encoding), sig, partial(compress_to, src, encoding=encoding, level=level))
+
+
 class Server(LocalProcessor):
     """
     Builds a given App for use in a server environment, or serves the App directly in a local server
@@ -443,11 +913,19 @@ class Server(LocalProcessor):
         formatting: t.Optional[AppFormatting] = None,
         open: bool = True,
         overwrite: bool = False,
+        lazy_pages: bool = False,
     ) -> None:
-        path = self.build(name=name, dest=dest, formatting=formatting, compress_assets=True, overwrite=overwrite)
+        path = self.build(
+            name=name,
+            dest=dest,
+            formatting=formatting,
+            compress_assets=True,
+            overwrite=overwrite,
+            lazy_pages=lazy_pages,
+        )
 
-        os.chdir(path)  # Run the server in the specified path
-        server = HTTPServer((host, port), CompressedAssetsHTTPHandler)
+        # serve concurrently, sending the precompressed asset variants to clients that accept them
+        server = make_server(path, host, port, immutable_prefix=f"/{SERVED_REPORT_ASSETS_DIR}/")
         display_msg(f"Server started at {host}:{port}")
 
         if open:
@@ -469,52 +947,100 @@ class Server(LocalProcessor):
         formatting: t.Optional[AppFormatting] = None,
         compress_assets: bool = False,
         overwrite: bool = False,
+        bundle: bool = True,
+        lazy_pages: bool = False,
     ) -> Path:
         path: Path = Path(dest or os.getcwd()) / name
         app_exists = path.is_dir()
 
-        if app_exists and overwrite:
-            rmtree(path)
-        elif app_exists and not overwrite:
+        if app_exists and not overwrite:
             raise DPError(f"App exists at given path {str(path)} -- set `overwrite=True` to allow overwrite")
 
-        bundle_path = path / SERVED_REPORT_BUNDLE_DIR
-        assets_path = path / SERVED_REPORT_ASSETS_DIR
-
-        bundle_path.mkdir(parents=True)
-        assets_path.mkdir(parents=True)
-
         self.assert_bundle_exists()
 
-        # Copy across symlinked app bundle.
-        # Ignore `call-arg` as CI errors on `dirs_exist_ok`
-        copytree(self.assets / "report", bundle_path / "app", dirs_exist_ok=True)  # type: ignore[call-arg]
-
-        # Copy across symlinked Vue module
-        copy(self.assets / VUE_ESM_FILE, bundle_path / VUE_ESM_FILE)
-
-        local_doc, attachments = self._gen_report(embedded=False, served=True, title=name)
-
-        # Copy across attachments
-        for a in attachments:
-            destination_path = assets_path / a.name
-            if compress_assets:
-                with compress_file(a) as a_gz:
-                    copy(a_gz, destination_path)
-            else:
-                copy(a, destination_path)
+        # rebuild over a previous build incrementally, only writing the files that have changed
+        prev_manifest = BuildManifest.load(path) if app_exists else None
+        if app_exists and prev_manifest is None:
+            rmtree(path)
+        manifest = BuildManifest(path, prev_manifest)
+
+        # Copy across symlinked app bundle and Vue module, unless hosted alongside other apps sharing a single bundle,
+        # and any precompressed variants
+        encodings = available_encodings() if compress_assets else []
+        if bundle:
+            for (rel_path, src) in self.shared_bundle().items():
+                for (f, f_rel_path) in _walk_files(src) if src.is_dir() else [(src, Path())]:
+                    manifest.add_copy(rel_path / f_rel_path, f)
+                    levels = DEFAULT_POLICY.file_levels(f) if encodings else None
+                    if levels:
+                        for encoding in encodings:
+                            manifest.add_compressed(rel_path / f_rel_path, f, encoding, levels[encoding])
+
+        local_doc, attachments = self._gen_report_doc(embedded=False, served=True, title=name)
+
+        # Link across attachments, named by their contents, from the store shared by all apps,
+        # along with precompressed variants of each, for the server to pick from
+        store = AssetStore()
+        store.register(path)
+        if lazy_pages and len(self.app.pages) > 1:
+            # serve each later page as an asset, so the first page is shown without loading the rest
+            pages: t.List[Path] = []
+
+            def page_src(x: bytes) -> str:
+                pages.append(store.add_bytes(x, ".xml"))
+                return f"/{SERVED_REPORT_ASSETS_DIR}/{pages[-1].name}"
+
+            local_doc = split_pages(local_doc, page_src)
+            attachments = attachments + pages
+        with ThreadPoolExecutor(thread_name_prefix="dp-build") as executor:
+            names = list(executor.map(content_addressed_name, attachments))
+        # NOTE - identical assets are only added once
+        for (a_name, a) in dict(zip(names, attachments)).items():
+            rel_path = Path(SERVED_REPORT_ASSETS_DIR) / a_name
+            manifest.add(rel_path, a_name, partial(store.link, a_name, partial(copy, a)))
+            # compressed by the policy for the asset, e.g. not at all if already compressed
+            levels = DEFAULT_POLICY.file_levels(a) if encodings else None
+            if levels:
+                for encoding in encodings:
+                    v_name = variant_path(rel_path, encoding).name
+                    compress = partial(compress_to, a, encoding=encoding, level=levels[encoding])
+                    manifest.add(variant_path(rel_path, encoding), v_name, partial(store.link, v_name, compress))
+
+        # compress and write any changed files in parallel
+        stats = [x for x in manifest.flush() if isinstance(x, CompressionStats)]
+        for x in stats:
+            log.info(
+                f"Compressed {x.file.name} ({x.encoding}): {x.size} -> {x.compressed_size} bytes, "
+                f"saving {x.saved} bytes in {x.duration:.2f}s"
+            )
+        if stats:
+            display_msg(
+                f"Compressed {len(stats)} asset variants, saving {sum(x.saved for x in stats) / 1e6:.1f}MB "
+                f"in {sum(x.duration for x in stats):.1f}s"
+            )
 
+        # write the document in place atomically, e.g. whilst the app is being served
+        tmp_index = path / f".{uuid4().hex}.html"
         self.write(
             local_doc,
-            str(path / "index.html"),
+            str(tmp_index),
             name=name,
             formatting=formatting,
         )
+        os.replace(tmp_index, path / "index.html")
+        manifest.save()
+        store.gc()
 
         display_msg(f"Successfully built app in {path}")
 
         return path
 
+    @classmethod
+    def shared_bundle(cls) -> t.Dict[Path, Path]:
+        """The path of each part of the frontend bundle within a served app -> its source within the package"""
+        bundle_path = Path(SERVED_REPORT_BUNDLE_DIR)
+        return {bundle_path / "app": cls.assets / "report", bundle_path / VUE_ESM_FILE: cls.assets / VUE_ESM_FILE}
+
     @staticmethod
     def _open_server(host: str, port: int) -> None:
         """Opens localserver endpoint, should be called in its own thread"""
@@ -571,6 +1097,28 @@ class Stringify(LocalProcessor):
         return report_id, view_html_string
 
 
+# apps passed to the functions below are captured rather than saved / served / uploaded when set, e.g. by the dev server
+_captured_apps: t.Optional[t.List[App]] = None
+
+
+@contextmanager
+def capture_apps() -> t.Iterator[t.List[App]]:
+    """Capture the apps saved, built, served or uploaded within the context, rather than processing them"""
+    global _captured_apps
+    prev, _captured_apps = _captured_apps, []
+    try:
+        yield _captured_apps
+    finally:
+        _captured_apps = prev
+
+
+def _capture(app: App) -> bool:
+    if _captured_apps is None:
+        return False
+    _captured_apps.append(app)
+    return True
+
+
 def serve(
     app: App,
     name: str = "app",
@@ -580,6 +1128,7 @@ def serve(
     formatting: t.Optional[AppFormatting] = None,
     open: bool = True,
     overwrite: bool = False,
+    lazy_pages: bool = False,
 ):
     """Serve the app from a local http server
     Args:
@@ -591,8 +1140,20 @@ def serve(
         host: The host used to serve the app (default: localhost)
         formatting: Sets the basic app styling; note that this is ignored if a app exists at the specified path
         overwrite: Replace existing app with the same name and destination if already exists (default: False)
+        lazy_pages: Load each page of a multi-page app when it's first shown, rather than all upfront (default: False)
     """
-    Server(app).go(name=name, dest=dest, port=port, host=host, formatting=formatting, open=open, overwrite=overwrite)
+    if _capture(app):
+        return
+    Server(app).go(
+        name=name,
+        dest=dest,
+        port=port,
+        host=host,
+        formatting=formatting,
+        open=open,
+        overwrite=overwrite,
+        lazy_pages=lazy_pages,
+    )
 
 
 def build(
@@ -602,17 +1163,74 @@ def build(
     formatting: t.Optional[AppFormatting] = None,
     compress_assets: bool = False,
     overwrite: bool = False,
+    bundle: bool = True,
+    lazy_pages: bool = False,
 ) -> None:
     """Build an app with a directory structure, which can be served by a local http server
     Args:
         app: The `App` object
         name: The name of the app directory to be created
         dest: File path to store the app directory
-        compress_assets: Compress user assets during app generation (default: True)
+        compress_assets: Also write precompressed gzip (and brotli / zstd if installed) variants of user assets (default: False)
         formatting: Sets the basic app styling
         overwrite: Replace existing app with the same name and destination if already exists (default: False)
+        bundle: Include a copy of the frontend bundle, not needed for apps hosted by `serve_apps` (default: True)
+        lazy_pages: Load each page of a multi-page app when it's first shown, rather than all upfront (default: False)
     """
-    Server(app).build(name=name, dest=dest, formatting=formatting, compress_assets=compress_assets, overwrite=overwrite)
+    if _capture(app):
+        return
+    Server(app).build(
+        name=name,
+        dest=dest,
+        formatting=formatting,
+        compress_assets=compress_assets,
+        overwrite=overwrite,
+        bundle=bundle,
+        lazy_pages=lazy_pages,
+    )
+
+
+def serve_apps(
+    apps: t.Union[NPath, t.Mapping[str, NPath]],
+    port: int = 8000,
+    host: str = "localhost",
+    memory_cache_size: int = MEMORY_CACHE_SIZE,
+    open: bool = False,
+) -> None:
+    """Host many built apps from a single local server, each under its own path, sharing a single frontend bundle
+    Args:
+        apps: The directory the apps were built into, i.e. the `dest` passed to `build`, hosting each app under its name,
+          or a mapping of path prefixes to app directories
+        port: The port used to serve the apps (default: 8000)
+        host: The host used to serve the apps (default: localhost)
+        memory_cache_size: The maximum size in bytes of the in-memory cache of frequently served files (default: 128MB)
+        open: Open the index of the apps in your browser (default: False)
+    """
+    if isinstance(apps, t.Mapping):
+        mounts = {prefix: Path(p) for (prefix, p) in apps.items()}
+    else:
+        mounts = {p.name: p for p in sorted(Path(apps).iterdir()) if (p / "index.html").is_file()}
+    if not mounts:
+        raise DPError(f"No built apps found in {apps}")
+
+    server = make_host_server(
+        mounts,
+        shared={str(rel_path): src for (rel_path, src) in Server.shared_bundle().items()},
+        host=host,
+        port=port,
+        immutable_prefix=f"/{SERVED_REPORT_ASSETS_DIR}/",
+        memory_cache=MemoryCache(max_size=memory_cache_size) if memory_cache_size else None,
+    )
+    display_msg(f"Server started at {host}:{port}, hosting {len(mounts)} apps")
+    if open:
+        threading.Thread(target=Server._open_server, args=(host, port), daemon=True).start()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    server.server_close()
 
 
 def save_report(
@@ -636,6 +1254,8 @@ def save_report(
         formatting: Sets the basic app styling
         cdn_base: The base url to use for standalone apps (default: https://datapane-cdn.com/{version})
     """
+    if _capture(app):
+        return
     Saver(app).go(
         path=path, open=open, standalone=standalone, name=name, author=author, formatting=formatting, cdn_base=cdn_base
     )
@@ -697,6 +1317,8 @@ def upload(
         formatting: Set the basic styling for your app
         overwrite: Overwrite the app
     """
+    if _capture(app):
+        return
     Uploader(app).go(
         name=name,
         description=description,
@@ -0,0 +1,368 @@
+"""
+Datapane local app server
+
+A concurrent HTTP server for served local apps, supporting conditional GETs, byte ranges,
+and negotiating the encoding of the precompressed app assets with the client.
+Many apps can be hosted by a single server, mounted under path prefixes and sharing a single frontend bundle
+"""
+import html
+import io
+import os
+import posixpath
+import re
+import threading
+import typing as t
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from functools import partial
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import quote, unquote
+
+from datapane.common import NPath, log
+from datapane.common.compression import ENCODING_EXTS, variant_path
+
+__all__ = ["AppHTTPHandler", "HostHTTPHandler", "MemoryCache", "make_server", "make_host_server"]
+
+COPY_BUFSIZE = 64 * 1024
+# defaults for the in-memory cache of served files
+MEMORY_CACHE_SIZE = 128 * 1024 * 1024
+MEMORY_CACHE_MAX_FILE_SIZE = 8 * 1024 * 1024
+# the app document must always be revalidated, the bundle can be cached for a while,
+# and content-addressed assets indefinitely
+HTML_CACHE_CONTROL = "no-cache"
+ASSET_CACHE_CONTROL = "public, max-age=3600"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_range_re = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def accepts_encoding(accept_encoding: t.Optional[str], encoding: str) -> bool:
+    """Whether the Accept-Encoding header allows the given encoding, i.e. it's listed, or via *, with q > 0"""
+    if not accept_encoding:
+        return False
+    qs: t.Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, *params = [x.strip() for x in part.split(";")]
+        q = 1.0
+        for p in params:
+            k, _, v = p.partition("=")
+            if k.strip() == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        qs[name.lower()] = q
+    return qs.get(encoding, qs.get("*", 0.0)) > 0
+
+
+def parse_range(range_header: str, size: int) -> t.Optional[t.Tuple[int, int]]:
+    """
+    Parse a single byte-range header into an inclusive (start, end) range of the given size,
+    returns None if the header should be ignored (e.g. multiple ranges), throws ValueError if unsatisfiable
+    """
+    m = _range_re.match(range_header.strip())
+    if not m or not any(m.groups()):
+        return None
+    (start, end) = m.groups()
+    if not start:
+        # suffix range, i.e. the last n bytes
+        n = int(end)
+        if n == 0:
+            raise ValueError("Empty suffix range")
+        return (max(size - n, 0), size - 1)
+    (start, end) = (int(start), int(end) if end else size - 1)
+    if start >= size:
+        raise ValueError("Range start beyond end of file")
+    if start > end:
+        return None
+    return (start, min(end, size - 1))
+
+
+class MemoryCache:
+    """
+    A thread-safe LRU cache of the contents of frequently served files, bounded by their total size,
+    with entries revalidated against the file's stat on each use
+    """
+
+    def __init__(self, max_size: int = MEMORY_CACHE_SIZE, max_file_size: int = MEMORY_CACHE_MAX_FILE_SIZE):
+        self.max_size = max_size
+        self.max_file_size = max_file_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, t.Tuple[bytes, os.stat_result]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: Path) -> t.Optional[t.Tuple[bytes, os.stat_result]]:
+        """The contents and stat of the file, read into the cache if not present, or None if too large to cache"""
+        st = os.stat(path)
+        if st.st_size > self.max_file_size:
+            return None
+        key = str(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and (entry[1].st_size, entry[1].st_mtime_ns) == (st.st_size, st.st_mtime_ns):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        # read outside the lock, using the stat of the file actually read, as it may be replaced meanwhile
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            if st.st_size > self.max_file_size:
+                return None
+            entry = (f.read(), st)
+
+        with self._lock:
+            self.misses += 1
+            prev = self._entries.pop(key, None)
+            if prev:
+                self.size -= len(prev[0])
+            self._entries[key] = entry
+            self.size += len(entry[0])
+            while self.size > self.max_size:
+                (_, (data, _)) = self._entries.popitem(last=False)
+                self.size -= len(data)
+        return entry
+
+
+class AppHTTPHandler(SimpleHTTPRequestHandler):
+    """
+    Request handler for served local apps, with
+    - ETag / Last-Modified validators and Cache-Control headers, responding with 304s to conditional requests
+    - single byte-range requests, e.g. for seeking within large media
+    - any precompressed variants of a file, e.g. `<file>.br` written by `Server.build`, sent to clients that accept
+      their encoding
+    """
+
+    protocol_version = "HTTP/1.1"
+    # paths of the content-addressed assets, which never change
+    immutable_prefix: t.Optional[str] = None
+    # serve small files from memory, if set
+    memory_cache: t.Optional[MemoryCache] = None
+
+    def log_message(self, format: str, *args: t.Any) -> None:
+        log.debug(f"{self.address_string()} - {format % args}")
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _serve(self, send_body: bool):
+        path = Path(self.translate_path(self.path))
+        if path.is_dir():
+            if not self.path.split("?", 1)[0].endswith("/"):
+                # use the default redirect and directory listing handling
+                return super().do_GET() if send_body else super().do_HEAD()
+            path = path / "index.html"
+            if not path.is_file():
+                return super().do_GET() if send_body else super().do_HEAD()
+
+        # send the preferred precompressed variant the client accepts, if any
+        (encoding, has_variants) = self._select_encoding(path)
+        content_type = self.guess_type(str(path))
+        try:
+            (f, st) = self._open(variant_path(path, encoding) if encoding else path)
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return
+
+        with f:
+            # each variant is a distinct representation, so has a distinct etag
+            etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}{f"-{encoding}" if encoding else ""}"'
+            last_modified = formatdate(st.st_mtime, usegmt=True)
+
+            def send_common_headers():
+                self.send_header("Content-Type", content_type)
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", last_modified)
+                self.send_header("Cache-Control", self._cache_control(path))
+                if has_variants:
+                    self.send_header("Vary", "Accept-Encoding")
+                if encoding:
+                    self.send_header("Content-Encoding", encoding)
+
+            if self._not_modified(etag, st.st_mtime):
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                send_common_headers()
+                self.end_headers()
+                return
+
+            byte_range: t.Optional[t.Tuple[int, int]] = None
+            range_header = self.headers.get("Range")
+            if range_header and self._if_range_matches(etag, last_modified):
+                try:
+                    byte_range = parse_range(range_header, st.st_size)
+                except ValueError:
+                    self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                    self.send_header("Content-Range", f"bytes */{st.st_size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+            if byte_range:
+                (start, end) = byte_range
+                self.send_response(HTTPStatus.PARTIAL_CONTENT)
+                send_common_headers()
+                self.send_header("Content-Range", f"bytes {start}-{end}/{st.st_size}")
+            else:
+                (start, end) = (0, st.st_size - 1)
+                self.send_response(HTTPStatus.OK)
+                send_common_headers()
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+
+            if send_body:
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = f.read(min(COPY_BUFSIZE, remaining))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+
+    def _open(self, path: Path) -> t.Tuple[t.BinaryIO, os.stat_result]:
+        entry = self.memory_cache.get(path) if self.memory_cache else None
+        if entry:
+            return (io.BytesIO(entry[0]), entry[1])
+        f = open(path, "rb")
+        return (f, os.fstat(f.fileno()))
+
+    def _cache_control(self, path: Path) -> str:
+        if path.suffix == ".html":
+            return HTML_CACHE_CONTROL
+        elif self.immutable_prefix and self.path.startswith(self.immutable_prefix):
+            return IMMUTABLE_CACHE_CONTROL
+        return ASSET_CACHE_CONTROL
+
+    def _select_encoding(self, path: Path) -> t.Tuple[t.Optional[str], bool]:
+        """The encoding of the preferred variant of the file that the client accepts, and whether there are any"""
+        variants = [e for e in ENCODING_EXTS if variant_path(path, e).is_file()]
+        accept_encoding = self.headers.get("Accept-Encoding")
+        encoding = next((e for e in variants if accepts_encoding(accept_encoding, e)), None)
+        return (encoding, bool(variants))
+
+    def _not_modified(self, etag: str, mtime: float) -> bool:
+        # If-None-Match takes precedence over If-Modified-Since
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match:
+            tags = [x.strip() for x in if_none_match.split(",")]
+            return "*" in tags or etag in tags or f"W/{etag}" in tags
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+            return since is not None and int(mtime) <= since.timestamp()
+        return False
+
+    def _if_range_matches(self, etag: str, last_modified: str) -> bool:
+        # only send the range if the client's copy is still current
+        if_range = self.headers.get("If-Range")
+        return not if_range or if_range.strip() in (etag, last_modified)
+
+
+class HostHTTPHandler(AppHTTPHandler):
+    """
+    Hosts many built apps, each mounted under a path prefix, with
+    - the files shared by all apps, i.e. the frontend bundle, served from a single location rather than each app's copy
+    - content-addressed assets, which are referenced from the server root, served from any app that contains them
+    - an index of the hosted apps at the root
+    """
+
+    # path prefix, e.g. `/sales`, -> directory of the built app
+    mounts: t.Dict[str, Path] = {}
+    # path within each app, e.g. `static/app`, -> shared file or directory to serve it from
+    shared: t.Dict[str, Path] = {}
+
+    def translate_path(self, path: str) -> str:
+        url_path = unquote(path.split("?", 1)[0].split("#", 1)[0])
+        for (prefix, app_dir) in sorted(self.mounts.items(), key=lambda x: -len(x[0])):
+            if url_path == prefix or url_path.startswith(f"{prefix}/"):
+                rel_path = url_path[len(prefix) :]
+                for (shared_path, shared_f) in self.shared.items():
+                    name = rel_path.lstrip("/")
+                    if name == shared_path or name.startswith(f"{shared_path}/"):
+                        return self._join(shared_f, name[len(shared_path) :])
+                return self._join(app_dir, rel_path)
+
+        if self.immutable_prefix and url_path.startswith(self.immutable_prefix):
+            # assets are content-addressed, so are the same in any app that has them
+            for app_dir in self.mounts.values():
+                f = self._join(app_dir, url_path)
+                if os.path.isfile(f):
+                    return f
+        # not found
+        return ""
+
+    @staticmethod
+    def _join(base: Path, rel_path: str) -> str:
+        """Join the url path onto the base directory, dropping any components that would escape it"""
+        words = [w for w in posixpath.normpath(rel_path).split("/") if w and w not in (os.curdir, os.pardir)]
+        f = os.path.join(base, *words)
+        return f"{f}/" if rel_path.endswith("/") else f
+
+    def _serve(self, send_body: bool):
+        if self.path.split("?", 1)[0] == "/" and "" not in self.mounts:
+            return self._serve_index(send_body)
+        if not self.translate_path(self.path):
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return
+        super()._serve(send_body)
+
+    def _serve_index(self, send_body: bool):
+        links = "".join(
+            f'<li><a href="{quote(prefix)}/">{html.escape(prefix.lstrip("/"))}</a></li>'
+            for prefix in sorted(self.mounts)
+        )
+        body = f"<!DOCTYPE html><html><head><title>Apps</title></head><body><ul>{links}</ul></body></html>".encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Cache-Control", HTML_CACHE_CONTROL)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+
+def make_server(
+    path: NPath,
+    host: str = "localhost",
+    port: int = 8000,
+    immutable_prefix: t.Optional[str] = None,
+    handler: t.Type[AppHTTPHandler] = AppHTTPHandler,
+    **handler_attrs: t.Any,
+) -> ThreadingHTTPServer:
+    """Create a concurrent server for the app built at `path`, serving each request in its own thread"""
+    handler_cls = type(handler.__name__, (handler,), dict(immutable_prefix=immutable_prefix, **handler_attrs))
+    server = ThreadingHTTPServer((host, port), partial(handler_cls, directory=str(path)))
+    server.daemon_threads = True
+    return server
+
+
+def make_host_server(
+    mounts: t.Mapping[str, NPath],
+    shared: t.Optional[t.Mapping[str, NPath]] = None,
+    host: str = "localhost",
+    port: int = 8000,
+    immutable_prefix: t.Optional[str] = None,
+    memory_cache: t.Optional[MemoryCache] = None,
+) -> ThreadingHTTPServer:
+    """
+    Create a concurrent server hosting each of the built apps under its path prefix,
+    serving the `shared` paths within each app from a single location
+    """
+    mounts = {f"/{prefix.strip('/')}" if prefix.strip("/") else "": Path(p) for (prefix, p) in mounts.items()}
+    shared = {k.strip("/"): Path(v) for (k, v) in (shared or {}).items()}
+    attrs = dict(immutable_prefix=immutable_prefix, memory_cache=memory_cache, mounts=mounts, shared=shared)
+    handler_cls = type(HostHTTPHandler.__name__, (HostHTTPHandler,), attrs)
+    server = ThreadingHTTPServer((host, port), handler_cls)
+    server.daemon_threads = True
+    return server
@@ -0,0 +1,314 @@
+"""
+Streaming and chunked uploads
+
+Generates multipart/form-data request bodies as they're sent, compressing each part on the fly,
+so uploads only hold a chunk of each file in memory at a time when sent with chunked transfer-encoding,
+for servers that accept it. Otherwise the length of the body is found beforehand, to send with a `Content-Length`,
+by compressing each part once and keeping the output to send, in memory if small or spooled to a temp file if not.
+
+Large files can instead be uploaded via the chunked upload protocol of the `uploads` endpoint, where supported,
+- `POST uploads/` with the file's name, size, sha256 and chunk size, returning the `url` of the new upload
+- `PUT <url>chunks/<n>/` with the bytes of each chunk, in parallel and retried individually on failure
+- `POST <url>complete/` once all chunks are received, returning the `id` of the upload to reference in requests
+- `GET <url>` returns the chunks `received` so far, so an interrupted upload of the same file is resumed
+
+..note:: This module is not used directly
+"""
+import dataclasses as dc
+import hashlib
+import json
+import threading
+import time
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+from urllib import parse as up
+from uuid import uuid4
+
+import requests
+
+from datapane.common import MIME, log
+from datapane.common.compression import compressor
+from datapane.common.utils import hash_file
+
+CHUNK_SIZE = 1024 * 1024
+# compressed parts up to this size are kept in memory when the length of the body is needed beforehand
+MAX_SPOOL_SIZE = 16 * CHUNK_SIZE
+# responses to chunk uploads that are retried, along with connection errors and timeouts
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+MAX_BACKOFF = 30.0
+
+
+@dc.dataclass(frozen=True)
+class Part:
+    """A form field, sent from either a file or in-memory data"""
+
+    name: str
+    source: t.Union[Path, bytes]
+    filename: t.Optional[str] = None
+    content_type: t.Optional[MIME] = None
+    # the content-encoding and level to compress the content with as it's sent, if any
+    encoding: t.Optional[str] = None
+    level: t.Optional[int] = None
+
+    @property
+    def size(self) -> int:
+        """The size of the uncompressed content"""
+        return self.source.stat().st_size if isinstance(self.source, Path) else len(self.source)
+
+    def headers(self) -> bytes:
+        disposition = f'form-data; name="{_quote(self.name)}"'
+        if self.filename is not None:
+            disposition += f'; filename="{_quote(self.filename)}"'
+        headers = [f"Content-Disposition: {disposition}"]
+        if self.content_type:
+            headers.append(f"Content-Type: {self.content_type}")
+        if self.encoding:
+            headers.append(f"Content-Encoding: {self.encoding}")
+        return "".join(f"{h}\r\n" for h in headers).encode()
+
+    def chunks(self) -> t.Iterator[bytes]:
+        """The raw content, in chunks"""
+        if isinstance(self.source, bytes):
+            for i in range(0, len(self.source), CHUNK_SIZE):
+                yield self.source[i : i + CHUNK_SIZE]
+        else:
+            with self.source.open("rb") as f:
+                yield from iter(lambda: f.read(CHUNK_SIZE), b"")
+
+
+def _quote(x: str) -> str:
+    # as browsers do for form-data field and file names
+    return x.replace("\\", "\\\\").replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+
+
+class MultipartStream:
+    """
+    A multipart/form-data request body, generated and compressed as it's iterated over, e.g. by `requests`.
+    Its `len` is that of the encoded body, computed on first use by compressing the parts and keeping the output to send,
+    so that `requests` sends it with a `Content-Length`, whereas `iter(stream)` is sent with chunked transfer-encoding.
+    `bytes_read` and `bytes_sent` track the raw content read and the encoded body generated so far,
+    and `on_progress` is called with each after every chunk, e.g. to update a progress bar or abort the upload
+    """
+
+    def __init__(
+        self,
+        parts: t.Sequence[Part],
+        on_progress: t.Optional[t.Callable[["MultipartStream"], None]] = None,
+    ):
+        self.parts = parts
+        self.on_progress = on_progress
+        self.boundary = uuid4().hex
+        self.bytes_read = 0
+        self.bytes_sent = 0
+        self._len: t.Optional[int] = None
+        # the compressed output of each part, by index, once the length is found
+        self._encoded: t.Dict[int, t.IO[bytes]] = {}
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    @property
+    def size(self) -> int:
+        """The total size of the uncompressed content of all parts"""
+        return sum(p.size for p in self.parts)
+
+    def __len__(self) -> int:
+        if self._len is None:
+            self._len = len(self._trailer()) + sum(
+                len(self._header(p)) + self._encoded_size(i, p) + len(b"\r\n") for (i, p) in enumerate(self.parts)
+            )
+        return self._len
+
+    def _encoded_size(self, i: int, p: Part) -> int:
+        if not p.encoding:
+            return p.size
+        f = self._encoded[i] = t.cast(t.IO[bytes], SpooledTemporaryFile(max_size=MAX_SPOOL_SIZE))
+        self._compress(p, f.write)
+        return f.tell()
+
+    @staticmethod
+    def _compress(p: Part, write: t.Callable[[bytes], t.Any]) -> None:
+        c = compressor(p.encoding, p.level)
+        for chunk in p.chunks():
+            write(c.compress(chunk))
+        write(c.flush())
+
+    def _header(self, p: Part) -> bytes:
+        return f"--{self.boundary}\r\n".encode() + p.headers() + b"\r\n"
+
+    def _trailer(self) -> bytes:
+        return f"--{self.boundary}--\r\n".encode()
+
+    def __iter__(self) -> t.Iterator[bytes]:
+        for (i, p) in enumerate(self.parts):
+            yield self._emit(self._header(p))
+            if i in self._encoded:
+                yield from self._iter_encoded(p, self._encoded[i])
+                continue
+            c = compressor(p.encoding, p.level) if p.encoding else None
+            for chunk in p.chunks():
+                self.bytes_read += len(chunk)
+                out = c.compress(chunk) if c else chunk
+                if out:
+                    yield self._emit(out)
+            tail = c.flush() if c else b""
+            yield self._emit(tail + b"\r\n")
+        yield self._emit(self._trailer())
+
+    def _iter_encoded(self, p: Part, f: t.IO[bytes]) -> t.Iterator[bytes]:
+        """Send the kept output of a compressed part, tracking the raw content read in proportion"""
+        total = f.seek(0, 2) or 1
+        (start, sent) = (self.bytes_read, 0)
+        f.seek(0)
+        for out in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sent += len(out)
+            self.bytes_read = start + p.size * sent // total
+            yield self._emit(out)
+        self.bytes_read = start + p.size
+        yield self._emit(b"\r\n")
+
+    def _emit(self, x: bytes) -> bytes:
+        self.bytes_sent += len(x)
+        if self.on_progress:
+            self.on_progress(self)
+        return x
+
+
+class ChunkedUpload:
+    """
+    Uploads a file in chunks via the chunked upload protocol, uploading chunks in parallel and retrying each on failure.
+    The upload's url is saved in `state_dir` until complete, so that re-uploading the file to the same server
+    after an interruption, e.g. in a new process, only uploads the chunks the server hasn't yet received
+    """
+
+    backoff: float = 1.0
+
+    def __init__(
+        self,
+        session: requests.Session,
+        uploads_url: str,
+        file: Path,
+        state_dir: Path,
+        content_type: t.Optional[MIME] = None,
+        chunk_size: int = 8 * 1024 * 1024,
+        max_workers: int = 4,
+        max_retries: int = 5,
+        timeout: t.Any = None,
+        on_progress: t.Optional[t.Callable[[int], None]] = None,
+    ):
+        self.session = session
+        self.uploads_url = uploads_url
+        self.file = file
+        self.content_type = content_type
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.on_progress = on_progress
+        self.size = file.stat().st_size
+        self.num_chunks = -(-self.size // chunk_size)
+        self.sha256 = hash_file(file)
+        # keyed by the server too, so an upload is only resumed against, and sends the token to, the one it started on
+        key = hashlib.sha256(f"{uploads_url}\n{self.sha256}\n{chunk_size}".encode()).hexdigest()
+        self.state_file = state_dir / f"{key[:32]}.json"
+        self._lock = threading.Lock()
+
+    def run(self) -> str:
+        """Upload the file, returning the id of the completed upload"""
+        resumed = self._resume()
+        (url, received) = resumed or self._create()
+        missing = [i for i in range(self.num_chunks) if i not in received]
+        log.debug(
+            f"{'Resuming' if resumed else 'Starting'} chunked upload of {self.file.name}, "
+            f"{len(missing)}/{self.num_chunks} chunks to upload"
+        )
+        if self.on_progress:
+            self.on_progress(sum(self._chunk_len(i) for i in received))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dp-upload") as executor:
+            list(executor.map(partial(self._put_chunk, url), missing))
+
+        r = self._request("POST", up.urljoin(url, "complete/"))
+        self.state_file.unlink()
+        return r.json()["id"]
+
+    def _resume(self) -> t.Optional[t.Tuple[str, t.Set[int]]]:
+        try:
+            state = json.loads(self.state_file.read_text())
+            (url, uploads_url) = (state["url"], state["uploads_url"])
+        except (OSError, ValueError, KeyError):
+            return None
+        if uploads_url != self.uploads_url:
+            return None
+        try:
+            r = self._request("GET", url)
+        except requests.HTTPError as e:
+            # expired or otherwise unknown, so start again
+            log.debug(f"Can't resume upload {url} - {e}")
+            return None
+        return (url, set(r.json()["received"]))
+
+    def _create(self) -> t.Tuple[str, t.Set[int]]:
+        r = self._request(
+            "POST",
+            self.uploads_url,
+            json=dict(
+                filename=self.file.name,
+                size=self.size,
+                sha256=self.sha256,
+                chunk_size=self.chunk_size,
+                content_type=self.content_type,
+            ),
+        )
+        res = r.json()
+        url = up.urljoin(self.uploads_url, res["url"])
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        self.state_file.write_text(json.dumps(dict(url=url, uploads_url=self.uploads_url, file=str(self.file))))
+        return (url, set(res.get("received", [])))
+
+    def _chunk_len(self, i: int) -> int:
+        return min(self.chunk_size, self.size - i * self.chunk_size)
+
+    def _put_chunk(self, url: str, i: int) -> None:
+        start = i * self.chunk_size
+        with self.file.open("rb") as f:
+            f.seek(start)
+            data = f.read(self.chunk_size)
+        headers = {
+            "Content-Type": "application/octet-stream",
+            "Content-Range": f"bytes {start}-{start + len(data) - 1}/{self.size}",
+        }
+        self._request("PUT", up.urljoin(url, f"chunks/{i}/"), data=data, headers=headers)
+        if self.on_progress:
+            with self._lock:
+                self.on_progress(len(data))
+
+    def _request(self, method: str, url: str, **kwargs: t.Any) -> requests.Response:
+        r = retry_request(self.session, method, url, self.max_retries, self.backoff, timeout=self.timeout, **kwargs)
+        r.raise_for_status()
+        return r
+
+
+def retry_request(
+    session: requests.Session, method: str, url: str, max_retries: int, backoff: float, **kwargs: t.Any
+) -> requests.Response:
+    """Make the request, retrying with exponential backoff on connection errors and transient failures"""
+    attempt = 0
+    while True:
+        try:
+            r = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= max_retries:
+                raise
+            log.debug(f"Retrying {method} {url} after error - {e}")
+        else:
+            if r.status_code not in RETRY_STATUSES or attempt >= max_retries:
+                return r
+            r.close()
+            log.debug(f"Retrying {method} {url} after status {r.status_code}")
+        time.sleep(min(backoff * 2**attempt, MAX_BACKOFF))
+        attempt += 1
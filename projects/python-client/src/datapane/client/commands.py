@@ -1,4 +1,5 @@
 import dataclasses as dc
+import json
 import tarfile
 import time
 import typing as t
@@ -67,6 +68,26 @@ def print_table(xs: t.Iterable[SDict], obj_name: str, showindex: bool = True) ->
     print(tabulate(xs, headers="keys", showindex=showindex))
 
 
+def list_options(f: t.Callable) -> t.Callable:
+    """Options for the list commands"""
+    f = click.option(
+        "--format",
+        "fmt",
+        type=click.Choice(["table", "jsonl"]),
+        default="table",
+        help="Print a table once all objects are fetched, or stream JSON lines as each page is received",
+    )(f)
+    return click.option("--page-size", type=int, help="Number of objects to fetch per request")(f)
+
+
+def print_list(obj_type: t.Type[api.DPObjectRef], obj_name: str, fmt: str, page_size: Optional[int]) -> None:
+    if fmt == "jsonl":
+        for x in obj_type.list(page_size=page_size, format_fields=False):
+            print(json.dumps(x), flush=True)
+    else:
+        print_table(obj_type.list(page_size=page_size), obj_name)
+
+
 class GlobalCommandHandler(click.Group):
     def __call__(self, *args, **kwargs):
         try:
@@ -200,9 +221,10 @@ def delete(name: str, project: str):
 
 
 @file.command("list")
-def file_list():
+@list_options
+def file_list(fmt: str, page_size: Optional[int]):
     """List files"""
-    print_table(api.File.list(), "Files")
+    print_list(api.File, "Files", fmt, page_size)
 
 
 ###############################################################################
@@ -308,9 +330,10 @@ def delete(name: str, project: str):
 
 
 @app.command("list")
-def app_list():
+@list_options
+def app_list(fmt: str, page_size: Optional[int]):
     """List Apps"""
-    print_table(api.LegacyApp.list(), "Apps")
+    print_list(api.LegacyApp, "Apps", fmt, page_size)
 
 
 @app.command()
@@ -396,6 +419,30 @@ def report_init(name: str, format: str):
     success_msg("Created sample report `dp_report`, edit as needed and run")
 
 
+@report.command()
+@click.argument("script", type=click.Path(exists=True, dir_okay=False))
+@click.option("--parameter", "-p", multiple=True)
+@click.option("--host", default="localhost")
+@click.option("--port", default=8000, type=int)
+@click.option("--open/--no-open", default=True, help="Open the app in the browser")
+def dev(script: str, parameter: Tuple[str], host: str, port: int, open: bool):
+    """Serve the app built by SCRIPT, rebuilding it and reloading the browser whenever SCRIPT or its inputs change"""
+    from .api.report.dev_server import DevServer
+
+    params = process_cmd_param_vals(parameter)
+    DevServer(script, params=params).go(host=host, port=port, open=open)
+
+
+@report.command()
+@click.argument("dest", type=click.Path(exists=True, file_okay=False))
+@click.option("--host", default="localhost")
+@click.option("--port", default=8000, type=int)
+@click.option("--memory-cache-size", default=128, type=int, help="Size of the in-memory asset cache in MB")
+def host(dest: str, host: str, port: int, memory_cache_size: int):
+    """Host all the apps built within DEST from a single server, each under its own name"""
+    api.serve_apps(dest, port=port, host=host, memory_cache_size=memory_cache_size * 1024 * 1024)
+
+
 @report.command()  # type: ignore[no-redef]
 @click.argument("name")
 @click.option("--project")
@@ -406,9 +453,10 @@ def delete(name: str, project: str):
 
 
 @report.command("list")
-def report_list():
+@list_options
+def report_list(fmt: str, page_size: Optional[int]):
     """List Reports"""
-    print_table(api.Report.list(), "Reports")
+    print_list(api.Report, "Reports", fmt, page_size)
 
 
 # NOTE - NYI - disabled
@@ -37,6 +37,10 @@ class InvalidReportError(DPError):
     pass
 
 
+class DownloadError(DPError):
+    pass
+
+
 class MissingCloudPackagesError(DPError):
     def __init__(self, *a, **kw):
         # quick hack until we setup a conda meta-package for cloud
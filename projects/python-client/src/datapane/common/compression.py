@@ -0,0 +1,214 @@
+"""
+Compression of assets into precompressed, content-encoded variants, i.e. `<file>.gz`, `<file>.br` and `<file>.zst`,
+for serving directly to clients that accept them, and of uploads as they're sent.
+
+How, and whether, each file is compressed is chosen by a `CompressionPolicy`, from its type, size,
+and the entropy of a sample of its contents.
+
+Brotli and Zstandard are only used if the `brotli` and `zstandard` packages are installed
+"""
+import dataclasses as dc
+import math
+import time
+import typing as t
+import zlib
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+
+from .dp_types import NPath
+from .utils import guess_type
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_SIZE = 1024 * 1024
+
+# content-encoding -> file extension of the variant, in order of preference when serving
+ENCODING_EXTS: t.Dict[str, str] = {"br": ".br", "zstd": ".zst", "gzip": ".gz"}
+# defaults balancing compression ratio and speed
+ENCODING_LEVELS: t.Dict[str, int] = {"br": 9, "zstd": 10, "gzip": 6}
+# for large or hard to compress files, where the time taken matters more than the ratio
+FAST_ENCODING_LEVELS: t.Dict[str, int] = {"br": 4, "zstd": 3, "gzip": 1}
+# for small, highly compressible files, e.g. code and text, that are compressed once and served many times
+STRONG_ENCODING_LEVELS: t.Dict[str, int] = {"br": 11, "zstd": 19, "gzip": 9}
+
+# mimetypes that are already compressed, and so aren't worth compressing again
+INCOMPRESSIBLE_MIME_PREFIXES = ("image/", "video/", "audio/", "font/woff")
+COMPRESSIBLE_IMAGES = ("image/svg+xml", "image/bmp", "image/x-ms-bmp", "image/tiff")
+INCOMPRESSIBLE_MIMES = {
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-tgz",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/zstd",
+    "application/x-pywheel+zip",
+    "application/pdf",
+}
+
+
+@dc.dataclass(frozen=True)
+class CompressionStats:
+    file: Path
+    encoding: str
+    size: int
+    compressed_size: int
+    duration: float
+
+    @property
+    def saved(self) -> int:
+        return self.size - self.compressed_size
+
+
+def available_encodings() -> t.List[str]:
+    """The content-encodings that assets can be compressed with, in order of preference"""
+    installed = {"br": brotli is not None, "zstd": zstandard is not None, "gzip": True}
+    return [e for e in ENCODING_EXTS if installed[e]]
+
+
+def is_compressible(f_name: Path) -> bool:
+    """Whether the file is worth compressing, i.e. isn't an already-compressed format"""
+    mime = guess_type(f_name)
+    if mime in INCOMPRESSIBLE_MIMES:
+        return False
+    return mime in COMPRESSIBLE_IMAGES or not mime.startswith(INCOMPRESSIBLE_MIME_PREFIXES)
+
+
+def variant_path(f_name: Path, encoding: str) -> Path:
+    return f_name.with_name(f"{f_name.name}{ENCODING_EXTS[encoding]}")
+
+
+def entropy(data: bytes) -> float:
+    """The Shannon entropy of the data in bits per byte, from 0 (constant) to 8 (random)"""
+    if not data:
+        return 0.0
+    n = len(data)
+    return -sum(c / n * math.log2(c / n) for c in Counter(data).values())
+
+
+def sample_entropy(f_name: NPath, sample_size: int = 16 * 1024, samples: int = 4) -> float:
+    """The entropy of the file, estimated from samples spread evenly through it"""
+    size = Path(f_name).stat().st_size
+    with open(f_name, "rb") as f:
+        if size <= sample_size * samples:
+            return entropy(f.read())
+        sample = bytearray()
+        for i in range(samples):
+            f.seek((size - sample_size) * i // (samples - 1))
+            sample += f.read(sample_size)
+    return entropy(bytes(sample))
+
+
+@lru_cache(maxsize=4096)
+def _sample_entropy_cached(f_name: str, size: int, mtime_ns: int) -> float:
+    return sample_entropy(f_name)
+
+
+@dc.dataclass(frozen=True)
+class CompressionPolicy:
+    """
+    Chooses the compression level for a file, or whether to compress it at all,
+    - files that are tiny, an already-compressed format, or have near-random contents aren't compressed
+    - small files with low entropy, e.g. code, text and JSON, are compressed strongly, and larger ones at the defaults
+    - otherwise files are compressed quickly, as the gain from stronger levels doesn't pay for their time
+    """
+
+    min_size: int = 512
+    # bits per byte, above which data is effectively incompressible
+    max_entropy: float = 7.5
+    strong_max_entropy: float = 6.0
+    # the strongest levels compress at well under 1MB/s, so are kept to small files
+    strong_max_size: int = 256 * 1024
+
+    def levels(self, size: int, entropy: float) -> t.Optional[t.Dict[str, int]]:
+        """The level to compress data of the given size and entropy at for each encoding, or None if not worth it"""
+        if size < self.min_size or entropy > self.max_entropy:
+            return None
+        elif entropy > self.strong_max_entropy:
+            return FAST_ENCODING_LEVELS
+        return STRONG_ENCODING_LEVELS if size <= self.strong_max_size else ENCODING_LEVELS
+
+    def file_levels(self, f_name: Path) -> t.Optional[t.Dict[str, int]]:
+        """The levels to compress the file at, sampling its entropy once until the file changes"""
+        if not is_compressible(f_name):
+            return None
+        st = f_name.stat()
+        if st.st_size < self.min_size:
+            return None
+        return self.levels(st.st_size, _sample_entropy_cached(str(f_name), st.st_size, st.st_mtime_ns))
+
+    def choose(self, levels: t.Optional[t.Dict[str, int]], encodings: t.Sequence[str]) -> t.Optional[t.Tuple[str, int]]:
+        """The preferred encoding the receiver accepts, out of those installed, and its level"""
+        if levels is None:
+            return None
+        available = available_encodings()
+        encoding = next((e for e in encodings if e in available), None)
+        return (encoding, levels[encoding]) if encoding else None
+
+    def choose_file(self, f_name: Path, encodings: t.Sequence[str]) -> t.Optional[t.Tuple[str, int]]:
+        """How to compress the file for a receiver accepting the given encodings, in order of preference"""
+        return self.choose(self.file_levels(f_name), encodings)
+
+    def choose_data(self, data: bytes, encodings: t.Sequence[str]) -> t.Optional[t.Tuple[str, int]]:
+        """How to compress the data for a receiver accepting the given encodings, in order of preference"""
+        return self.choose(self.levels(len(data), entropy(data[: 64 * 1024])), encodings)
+
+
+DEFAULT_POLICY = CompressionPolicy()
+
+
+# a streaming compressor, with `compress(data) -> bytes` and `flush() -> bytes` methods, as per `zlib.compressobj`
+Compressor = t.Any
+
+
+class _BrotliCompressor:
+    def __init__(self, level: int):
+        self._c = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data)
+
+    def flush(self) -> bytes:
+        return self._c.finish()
+
+
+def compressor(encoding: str, level: t.Optional[int] = None) -> Compressor:
+    """A streaming compressor for the content-encoding"""
+    level = ENCODING_LEVELS[encoding] if level is None else level
+    if encoding == "gzip":
+        # gzip format, with a zeroed mtime so output is reproducible
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+    elif encoding == "br":
+        return _BrotliCompressor(level)
+    elif encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    raise ValueError(f"Unknown encoding {encoding}")
+
+
+def compress_to(src: NPath, dest: NPath, encoding: str, level: t.Optional[int] = None) -> CompressionStats:
+    """Compress the file at `src` into `dest` using the given content-encoding, streaming in chunks"""
+    start = time.perf_counter()
+    c = compressor(encoding, level)
+    with open(src, "rb") as f_in, open(dest, "wb") as f_out:
+        for chunk in iter(lambda: f_in.read(CHUNK_SIZE), b""):
+            f_out.write(c.compress(chunk))
+        f_out.write(c.flush())
+
+    return CompressionStats(
+        file=Path(src),
+        encoding=encoding,
+        size=Path(src).stat().st_size,
+        compressed_size=Path(dest).stat().st_size,
+        duration=time.perf_counter() - start,
+    )
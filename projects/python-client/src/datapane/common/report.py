@@ -1,6 +1,9 @@
 import dataclasses as dc
+import os
 import re
 import typing as t
+from collections import Counter
+from copy import deepcopy
 
 import importlib_resources as ir
 from lxml import etree
@@ -18,6 +21,9 @@ rng_validator = etree.RelaxNG(file=str(local_report_def / "full_schema.rng"))
 
 dp_namespace: str = "https://datapane.com/schemas/report/1/"
 
+# validate documents built via the blocks API against the full schema, rather than per-element, e.g. when debugging
+STRICT_VALIDATION: bool = bool(os.environ.get("DATAPANE_STRICT_VALIDATION", ""))
+
 
 def load_doc(x: str) -> etree._Element:
     parser = etree.XMLParser(strip_cdata=False, recover=True, remove_blank_text=True, remove_comments=True)
@@ -47,6 +53,110 @@ def validate_report_doc(
         raise
 
 
+################################################################################
+# Per-element validation
+# Each element is validated within a minimal document, with the result cached by its tag, attributes and shape,
+# so each distinct element is only validated once. Layout elements are validated with placeholder children,
+# as their children are validated separately
+_validated_elements: t.Set[t.Hashable] = set()
+MAX_VALIDATED_ELEMENTS = 100_000
+
+
+def _placeholders(n: int) -> t.List[etree._Element]:
+    return [etree.Element("Empty", name=f"_dp_placeholder_{i}") for i in range(n)]
+
+
+def _text_shape(x: t.Optional[str]) -> t.Optional[str]:
+    # whitespace-only text is stripped on post-processing, so validated as empty
+    return "x" if x and not x.isspace() else None
+
+
+# per-instance attributes, with the max length for strings, that are validated by their shape rather than their value,
+# i.e. whether they're empty or within range, so that e.g. many asset blocks share a single validation
+_STRING_ATTRIBS: t.Dict[str, t.Optional[int]] = dict(
+    label=256, caption=512, filename=127, uploaded_filename=127, schema=None
+)
+_INT_ATTRIBS = {"size", "rows", "columns"}
+
+
+def _attrib_shape(k: str, v: str) -> str:
+    if k == "src":
+        # data-uris can be very large, and along with attachment refs are only validated by their scheme
+        if v.startswith("data:"):
+            return "data:x"
+        if re.fullmatch(r"attachment://[0-9]+", v):
+            return "attachment://0"
+    elif k == "name":
+        return "x" if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_.-]*", v) else v
+    elif k == "cas_ref":
+        return "0" * 64 if re.fullmatch(r"[0-9a-f]{64}", v) else v
+    elif k in _INT_ATTRIBS:
+        return "1" if re.fullmatch(r"[0-9]+", v) and int(v) > 0 else v
+    elif k in _STRING_ATTRIBS:
+        max_len = _STRING_ATTRIBS[k]
+        return "x" if v and (max_len is None or len(v) <= max_len) else v
+    return v
+
+
+def _validate_min_doc(content: etree._Element):
+    page = content if content.tag == "Page" else etree.Element("Page")
+    if page is not content:
+        page.append(content)
+    pages = etree.Element("Pages")
+    pages.append(page)
+    doc = etree.Element("Report", version="1")
+    doc.extend([etree.Element("Internal"), pages])
+    validate_report_doc(xml_doc=doc)
+
+
+def validate_element(e: etree._Element, n_children: t.Optional[int] = None) -> None:
+    """
+    Validate a single block element against the schema, throws an etree.DocumentInvalid if not
+    - `n_children` is given for layout elements, which are validated with that many placeholder children
+    - leaf elements with nested elements are validated in full each time
+    NOTE - unique names are checked across the whole document by `validate_names`
+    """
+    if n_children is None and len(e):
+        _validate_min_doc(deepcopy(e))
+        return
+
+    attribs = tuple((k, _attrib_shape(k, v)) for (k, v) in e.attrib.items())
+    # layouts with 0, 1, 2 or more children are validated differently, e.g. a Select needs at least 2
+    key = (e.tag, attribs, _text_shape(e.text), None if n_children is None else min(n_children, 3))
+    if key in _validated_elements:
+        return
+
+    x = etree.Element(e.tag, dict(attribs))
+    x.text = key[2]
+    x.extend(_placeholders(key[3] or 0))
+    _validate_min_doc(x)
+
+    if len(_validated_elements) >= MAX_VALIDATED_ELEMENTS:
+        _validated_elements.clear()
+    _validated_elements.add(key)
+
+
+def validate_doc_structure(xml_doc: etree._Element) -> None:
+    """Validate the top-level document structure, e.g. the Meta, with placeholder pages"""
+    doc = etree.Element(xml_doc.tag, xml_doc.attrib)
+    for x in xml_doc:
+        if x.tag == "Pages":
+            pages = etree.SubElement(doc, "Pages", x.attrib)
+            etree.SubElement(pages, "Page").extend(_placeholders(1))
+        else:
+            doc.append(deepcopy(x))
+    validate_report_doc(xml_doc=doc)
+
+
+def validate_names(xml_doc: etree._Element) -> None:
+    """Check that all block names are unique, throws an etree.DocumentInvalid if not"""
+    names: t.List[str] = xml_doc.xpath("/Report/Pages//@name")
+    if len(names) != len(set(names)):
+        duplicates = [n for (n, c) in Counter(names).items() if c > 1]
+        log.error(f"Error validating report document, duplicate block names: {duplicates}")
+        raise DocumentInvalid(f"Duplicate block names: {duplicates}")
+
+
 def conv_attrib(v: t.Any) -> t.Optional[str]:
     """
     Convert a value to a str for use as an ElementBuilder attribute
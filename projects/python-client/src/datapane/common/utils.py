@@ -1,17 +1,20 @@
 import datetime
-import gzip
-import io
+import gc
+import hashlib
 import locale
 import logging
 import logging.config
 import mimetypes
+import mmap
 import os
+import re
 import shutil
-import subprocess
 import sys
 import time
 import typing as t
+from base64 import b64encode
 from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
 from tempfile import NamedTemporaryFile, TemporaryDirectory, _TemporaryFileWrapper, mkstemp
 
@@ -158,50 +161,95 @@ def temp_fname(suffix: str, prefix: str = "datapane-temp-", keep: bool = False)
             os.unlink(in_f_name)
 
 
-@contextmanager
-def unix_compress_file(f_name: NPath, level: int = 6) -> t.Generator[str, None, None]:
-    """(UNIX only) Return path to a compressed version of the input filename"""
-    subprocess.run(["gzip", "-kf", f"-{level}", f_name], check=True)
-    f_name_gz = f"{f_name}.gz"
-    try:
-        yield f_name_gz
-    finally:
-        os.unlink(f_name_gz)
+# multiple of 3 so each chunk base64-encodes without padding and chunks can be concatenated
+B64_CHUNK_SIZE: int = 3 * 256 * 1024
 
 
-@contextmanager
-def unix_decompress_file(f_name: NPath) -> t.Generator[str, None, None]:
-    """(UNIX only) Return path to a compressed version of the input filename"""
-    subprocess.run(["gunzip", "-kf", f_name], check=True)
-    f_name_gz = f"{f_name}.gz"
+def b64_encoded_len(n: int) -> int:
+    """Length of the base64 encoding of `n` bytes"""
+    return 4 * ((n + 2) // 3)
+
+
+def iter_b64_file(f_name: NPath, chunk_size: int = B64_CHUNK_SIZE) -> t.Iterator[bytes]:
+    """(x-plat) Memory-map a file and base64-encode it in fixed-size chunks"""
+    assert chunk_size % 3 == 0
+    with open(f_name, "rb") as f:
+        # can't mmap an empty file
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as mv:
+            for i in range(0, len(mv), chunk_size):
+                with mv[i : i + chunk_size] as chunk:
+                    yield b64encode(chunk)
+
+
+def b64_encode_file(f_name: NPath, prefix: str = "") -> str:
+    """
+    (x-plat) Base64-encode a file into a string, with an optional prefix, e.g. for a data-uri,
+    encoding in chunks into a single preallocated buffer rather than reading the entire file first
+    """
+    _prefix = prefix.encode("ascii")
+    buf = bytearray(len(_prefix) + b64_encoded_len(os.path.getsize(f_name)))
+    buf[: len(_prefix)] = _prefix
+    pos = len(_prefix)
+    for chunk in iter_b64_file(f_name):
+        buf[pos : pos + len(chunk)] = chunk
+        pos += len(chunk)
+    return buf.decode("ascii")
+
+
+def hash_file(f_name: NPath, chunk_size: int = 1024 * 1024) -> str:
+    """The sha256 hex digest of a file's contents, read in chunks"""
+    h = hashlib.sha256()
+    with open(f_name, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=4096)
+def _hash_file_cached(f_name: str, size: int, mtime_ns: int) -> str:
+    return hash_file(f_name)
+
+
+def content_addressed_name(f_name: Path) -> str:
+    """
+    A name for the file from a hash of its contents, keeping its extension(s), e.g. for immutable URLs
+    (hashes are memoised by the file's stat, so unchanged files aren't rehashed)
+    """
+    st = f_name.stat()
+    # keep only well-formed extensions, e.g. `.csv` or `.tar.gz`, rather than any text following a dot
+    ext = ""
+    for x in reversed(f_name.suffixes[-2:]):
+        if not re.fullmatch(r"\.[A-Za-z0-9]+", x):
+            break
+        ext = x + ext
+    return f"{_hash_file_cached(str(f_name), st.st_size, st.st_mtime_ns)[:32]}{ext}"
+
+
+def link_or_copy(src: NPath, dest: NPath) -> None:
+    """Hardlink `src` to `dest`, falling back to copying if not possible, e.g. across filesystems"""
     try:
-        yield f_name_gz
-    finally:
-        os.unlink(f_name_gz)
+        os.link(src, dest)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(src, dest)
 
 
 @contextmanager
-def compress_file(f_name: NPath, level: int = 6) -> t.Generator[str, None, None]:
-    """(X-Plat) Return path to a compressed version of the input filename"""
-    f_name_gz = f"{f_name}.gz"
-    with open(f_name, "rb") as f_in, gzip.open(f_name_gz, "wb", compresslevel=level) as f_out:
-        shutil.copyfileobj(f_in, f_out)
+def paused_gc() -> t.Generator[None, None, None]:
+    """
+    Pause the cyclic garbage collector, e.g. whilst allocating many long-lived objects,
+    which would otherwise trigger repeated full collections
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
     try:
-        yield f_name_gz
+        yield
     finally:
-        # NOTE - disable on windows temporarily
-        if not ON_WINDOWS:
-            os.unlink(f_name_gz)
-
-
-def inmemory_compress(content: io.BytesIO) -> io.BytesIO:
-    """(x-plat) Memory-based gzip compression"""
-    content.seek(0)
-    zbuf = io.BytesIO()
-    with gzip.GzipFile(mode="wb", fileobj=zbuf, mtime=0.0) as zfile:
-        zfile.write(content.read())
-    zbuf.seek(0)
-    return zbuf
+        if was_enabled:
+            gc.enable()
 
 
 @contextmanager
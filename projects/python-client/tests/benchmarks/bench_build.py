@@ -0,0 +1,52 @@
+"""
+Benchmark building the XML document for large apps, e.g.
+
+    python tests/benchmarks/bench_build.py --sizes 10000 100000 1000000
+"""
+import argparse
+import gc
+import time
+import typing as t
+
+import datapane as dp
+from datapane.client.api.report.processors import Processor
+
+
+def gen_app(n_blocks: int, group_size: int = 4) -> dp.App:
+    """An app with roughly `n_blocks` blocks, split across 2 pages of groups"""
+    n_groups = max(n_blocks // (group_size + 1), 1)
+    groups = [
+        dp.Group(*(dp.Text(f"Text {i}-{j}") for j in range(group_size - 1)), dp.BigNumber(heading="Value", value=i))
+        for i in range(n_groups)
+    ]
+    half = n_groups // 2
+    return dp.App(dp.Page(blocks=groups[:half], title="Page 1"), dp.Page(blocks=groups[half:], title="Page 2"))
+
+
+def timed(f: t.Callable[[], t.Any]) -> float:
+    gc.collect()
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+
+def run(sizes: t.List[int]):
+    print(f"{'blocks':>10} {'build (s)':>10} {'cached (s)':>11} {'rebuild (s)':>12} {'generate (s)':>13}")
+    for n in sizes:
+        app = gen_app(n)
+        # initial build of the XML document, the first rebuild which populates the build cache,
+        # then a rebuild with all blocks unchanged
+        build = timed(lambda: Processor(app)._to_xml(embedded=False, served=False))
+        cached = timed(lambda: Processor(app)._to_xml(embedded=False, served=False))
+        rebuild = timed(lambda: Processor(app)._to_xml(embedded=False, served=False))
+        # full document generation, including post-processing and validation, on a fresh app
+        app = gen_app(n)
+        generate = timed(lambda: Processor(app)._gen_report(embedded=False, served=False))
+        print(f"{n:>10} {build:>10.2f} {cached:>11.2f} {rebuild:>12.2f} {generate:>13.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark building app documents")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+    run(args.sizes)
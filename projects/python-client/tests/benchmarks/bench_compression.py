@@ -0,0 +1,100 @@
+"""
+Benchmark compressing the assets of a built app, comparing fixed levels of each encoding with the compression policy, e.g.
+
+    python tests/benchmarks/bench_compression.py --rows 10000 100000
+"""
+import argparse
+import tempfile
+import time
+import typing as t
+from pathlib import Path
+
+import altair as alt
+import numpy as np
+import pandas as pd
+
+import datapane as dp
+from datapane.common.compression import (
+    DEFAULT_POLICY,
+    ENCODING_EXTS,
+    ENCODING_LEVELS,
+    FAST_ENCODING_LEVELS,
+    STRONG_ENCODING_LEVELS,
+    available_encodings,
+    compressor,
+)
+
+# a fixed level for all files, or the policy
+Strategy = t.Callable[[Path], t.Optional[t.Tuple[str, int]]]
+
+
+def gen_app(n_rows: int) -> dp.App:
+    """An app with the typical mix of assets, i.e. a table, a plot and an image"""
+    df = pd.DataFrame(
+        {
+            "id": np.arange(n_rows),
+            "value": np.random.rand(n_rows),
+            "category": np.random.choice(["a", "b", "c", "d"], n_rows),
+        }
+    )
+    plot = alt.Chart(df.head(5000)).mark_point().encode(x="id", y="value", color="category")
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as f:
+        f.write(np.random.bytes(256 * 1024))
+    return dp.App(dp.DataTable(df), dp.Plot(plot), dp.Media(file=f.name))
+
+
+def asset_files(n_rows: int, dest: Path) -> t.List[Path]:
+    """The assets and frontend bundle of the built app, without their precompressed variants"""
+    dp.build(gen_app(n_rows), name="app", dest=dest, overwrite=True)
+    return [f for f in sorted((dest / "app").rglob("*")) if f.is_file() and f.suffix not in ENCODING_EXTS.values()]
+
+
+def compress(f: Path, encoding: str, level: int) -> int:
+    c = compressor(encoding, level)
+    with f.open("rb") as f_in:
+        out = sum(len(c.compress(chunk)) for chunk in iter(lambda: f_in.read(1024 * 1024), b""))
+    return out + len(c.flush())
+
+
+def measure(files: t.List[Path], strategy: Strategy) -> t.Tuple[float, float]:
+    """The throughput (MB/s) and compression ratio of the strategy over all files"""
+    (size, compressed_size) = (0, 0)
+    start = time.perf_counter()
+    for f in files:
+        f_size = f.stat().st_size
+        choice = strategy(f)
+        size += f_size
+        compressed_size += compress(f, *choice) if choice else f_size
+    duration = time.perf_counter() - start
+    return (size / duration / 1e6, size / compressed_size)
+
+
+def run(rows: t.List[int]):
+    encodings = available_encodings()
+    strategies: t.Dict[str, Strategy] = {"gzip-6 (fixed)": lambda f: ("gzip", 6)}
+    for e in encodings:
+        for (name, levels) in [
+            ("fast", FAST_ENCODING_LEVELS),
+            ("default", ENCODING_LEVELS),
+            ("strong", STRONG_ENCODING_LEVELS),
+        ]:
+            strategies[f"{e}-{levels[e]} ({name})"] = lambda f, e=e, level=levels[e]: (e, level)
+    for e in encodings:
+        strategies[f"{e} (policy)"] = lambda f, e=e: DEFAULT_POLICY.choose_file(f, [e])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n in rows:
+            files = asset_files(n, Path(tmp_dir))
+            total = sum(f.stat().st_size for f in files) / 1e6
+            print(f"\n{n} rows, {len(files)} files, {total:.1f} MB")
+            print(f"{'strategy':>20} {'MB/s':>10} {'ratio':>8}")
+            for (name, strategy) in strategies.items():
+                (throughput, ratio) = measure(files, strategy)
+                print(f"{name:>20} {throughput:>10.1f} {ratio:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark compressing app assets")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+    run(args.rows)
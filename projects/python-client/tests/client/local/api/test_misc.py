@@ -1,11 +1,38 @@
 """Tests for the API that can run locally (due to design or mocked out)"""
+import asyncio
+import base64
+import gzip
+import hashlib
+import importlib
+import json
+import os
+import threading
+import time
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
+from urllib import parse as up
+from uuid import uuid4
 
 import pytest
+import requests
 from glom import glom
+from munch import Munch
+from requests import HTTPError
+from requests_toolbelt.multipart.decoder import MultipartDecoder
 
 import datapane as dp
 from datapane.client import DPError, api
+from datapane.client import config as c
+from datapane.client.api import common
+from datapane.client.api.common import DTOCache, Resource, do_download_file, get_client
+from datapane.client.api.download import RangedDownload
+from datapane.client.api.dp_object import DPObjectRef
+from datapane.client.api.upload import ChunkedUpload, MultipartStream, Part
+from datapane.client.commands import print_list
+from datapane.client.utils import DownloadError, ReportTooLargeError
+from datapane.common.compression import compressor
 
 from ....client.e2e.common import gen_df, gen_plot
 from .test_reports import element_to_str
@@ -73,3 +100,529 @@ Here's the dataset used...
     assert glom(group, ("blocks", ["_tag"])) == ["Text", "Plot", "Text", "Select", "Text", "Table"]
     assert "file-input" in element_to_str(group)
     assert "file-input" in glom(group, "blocks.0.content")
+
+
+def test_multipart_stream(tmp_path: Path, monkeypatch):
+    """Test that streamed multipart bodies decode to the original, compressed, contents"""
+    data = b"a,b\n1,2\n" * 200_000
+    (tmp_path / "data.csv").write_bytes(data)
+    parts = [
+        Part("attachments", tmp_path / "data.csv", filename='da"ta.csv', content_type="text/csv", encoding="gzip"),
+        Part("document", "<Report/>".encode(), encoding="gzip", level=1),
+        Part("json_data", b'{"name": "x"}'),
+    ]
+    progress = []
+    e = MultipartStream(parts, on_progress=lambda m: progress.append(m.bytes_read))
+    body = b"".join(e)
+    assert e.bytes_sent == len(body) == len(e) < e.size == e.bytes_read
+    assert progress == sorted(progress) and progress[-1] == e.size
+
+    decoded = MultipartDecoder(body, e.content_type).parts
+    assert [gzip.decompress(p.content) for p in decoded[:2]] == [data, b"<Report/>"]
+    assert decoded[2].content == b'{"name": "x"}'
+    assert decoded[0].headers[b"Content-Disposition"] == b'form-data; name="attachments"; filename="da%22ta.csv"'
+    assert decoded[0].headers[b"Content-Encoding"] == b"gzip" and b"Content-Encoding" not in decoded[2].headers
+
+    # finding the length beforehand compresses each part once, keeping the output to send, spooled to disk if large
+    encodings = []
+    # (`datapane.client.api.upload` is shadowed by the `upload` function)
+    upload_module = importlib.import_module(MultipartStream.__module__)
+    monkeypatch.setattr(upload_module, "compressor", lambda *args: encodings.append(args[0]) or compressor(*args))
+    monkeypatch.setattr(upload_module, "MAX_SPOOL_SIZE", 1000)
+    progress = []
+    e = MultipartStream(parts, on_progress=lambda m: progress.append(m.bytes_read))
+    body_len = len(e)
+    body = b"".join(e)
+    assert e.bytes_sent == len(body) == body_len and encodings == ["gzip", "gzip"]
+    assert progress == sorted(progress) and progress[-1] == e.size == e.bytes_read
+    decoded = MultipartDecoder(body, e.content_type).parts
+    assert [gzip.decompress(p.content) for p in decoded[:2]] == [data, b"<Report/>"]
+
+
+class UploadsHandler(BaseHTTPRequestHandler):
+    """A stand-in for the server's chunked upload protocol, if `chunked` is set, failing the chunk uploads in `failures`"""
+
+    uploads: t.Dict[str, t.Dict[str, t.Any]]
+    failures: t.Dict[int, int]
+    puts: t.List[int]
+    posts: t.List[t.Dict[str, t.Any]]
+    post_fields: t.List[t.List[str]]
+    post_streamed: t.List[bool]
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            body = b""
+            while True:
+                n = int(self.rfile.readline().strip(), 16)
+                body += self.rfile.read(n + 2)[:n]
+                if n == 0:
+                    return body
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _send(self, status: int, x: t.Any = None, etag: t.Optional[str] = None):
+        body = json.dumps(x).encode() if status not in (204, 304) else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self._body()
+        parts = self.path.strip("/").split("/")
+        if parts == ["api", "uploads"] and not self.chunked:
+            return self._send(404)
+        elif parts == ["api", "uploads"]:
+            upload_id = uuid4().hex
+            self.uploads[upload_id] = dict(json.loads(body), chunks={})
+            return self._send(201, dict(url=f"/api/uploads/{upload_id}/", received=[]))
+        elif parts[-1] == "complete":
+            upload = self.uploads[parts[2]]
+            data = b"".join(upload["chunks"][i] for i in sorted(upload["chunks"]))
+            if len(data) != upload["size"] or hashlib.sha256(data).hexdigest() != upload["sha256"]:
+                return self._send(400)
+            upload["data"] = data
+            return self._send(200, dict(id=parts[2]))
+        # the final request
+        decoded = MultipartDecoder(body, self.headers["Content-Type"].split("; dp-files")[0])
+        self.posts.append(json.loads(decoded.parts[-1].content))
+        self.post_fields.append([p.headers[b"Content-Disposition"].split(b'"')[1].decode() for p in decoded.parts])
+        self.post_streamed.append(self.headers.get("Transfer-Encoding") == "chunked")
+        return self._send(201, dict(url="x"))
+
+    def do_GET(self):
+        self.gets.append(self.headers["Authorization"])
+        if self.failures.get("GET"):
+            self.failures["GET"] -= 1
+            return self._send(503)
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if parts == ["api", "uploads"]:
+            # a page of uploads, and the link to the next, numbered if supported
+            query = dict(up.parse_qsl(up.urlsplit(self.path).query))
+            self.list_queries.append(query)
+            (page, page_size) = (int(query.get("page", 1)), int(query.get("page_size", 2)))
+            names = sorted(self.uploads)
+            if "cursor" in query:
+                names = [x for x in names if x > query["cursor"]]
+            results = names[(page - 1) * page_size : page * page_size]
+            next_query = dict(query, page=page + 1) if self.numbered else dict(query, cursor=results[-1])
+            res = dict(
+                results=[dict(name=x, id=x, meta=dict(x=1)) for x in results],
+                next=f"/api/uploads/?{up.urlencode(next_query)}" if page * page_size < len(names) else None,
+            )
+            if self.numbered:
+                res.update(count=len(names))
+            return self._send(200, res)
+        upload = self.uploads.get(parts[2])
+        if not upload:
+            return self._send(404)
+        res = dict(received=list(upload["chunks"]))
+        etag = f'"{hashlib.sha256(json.dumps(res).encode()).hexdigest()[:16]}"'
+        return self._send(304 if self.headers.get("If-None-Match") == etag else 200, res, etag=etag)
+
+    def do_DELETE(self):
+        self.uploads.pop(self.path.strip("/").split("/")[2], None)
+        return self._send(204)
+
+    def do_PUT(self):
+        parts = self.path.strip("/").split("/")
+        (upload, i) = (self.uploads[parts[2]], int(parts[4]))
+        body = self._body()
+        self.puts.append(i)
+        if self.failures.get(i):
+            self.failures[i] -= 1
+            return self._send(503)
+        start = i * upload["chunk_size"]
+        assert self.headers["Content-Range"] == f"bytes {start}-{start + len(body) - 1}/{upload['size']}"
+        upload["chunks"][i] = body
+        return self._send(200)
+
+
+def start_uploads_server() -> t.Tuple[t.Type[UploadsHandler], ThreadingHTTPServer]:
+    handler = type(
+        "UploadsHandler",
+        (UploadsHandler,),
+        dict(
+            uploads={},
+            failures={},
+            gets=[],
+            puts=[],
+            posts=[],
+            post_fields=[],
+            post_streamed=[],
+            list_queries=[],
+            numbered=True,
+            chunked=True,
+        ),
+    )
+    server = ThreadingHTTPServer(("localhost", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return (handler, server)
+
+
+@pytest.fixture
+def uploads_server(monkeypatch) -> t.Iterator[t.Type[UploadsHandler]]:
+    (handler, server) = start_uploads_server()
+    c.set_config(c.Config(server=f"http://localhost:{server.server_address[1]}", token="test-token"))
+    monkeypatch.setattr(ChunkedUpload, "backoff", 0.0)
+    monkeypatch.setattr(Resource, "upload_chunk_size", 1000)
+    monkeypatch.setattr(Resource, "chunked_upload_threshold", 5000)
+    yield handler
+    server.shutdown()
+    server.server_close()
+
+
+def test_chunked_upload(tmp_path: Path, uploads_server, monkeypatch):
+    """Test large files are uploaded in parallel chunks, retrying failed chunks and resuming interrupted uploads"""
+    data = os.urandom(10_500)
+    (tmp_path / "big.bin").write_bytes(data)
+    (tmp_path / "small.csv").write_bytes(b"a,b\n1,2\n")
+
+    # chunk 3 fails more than it's retried, leaving the upload incomplete
+    uploads_server.failures[3] = 10
+    with pytest.raises(HTTPError):
+        Resource("/files/").post_files(dict(attachments=[tmp_path / "big.bin", tmp_path / "small.csv"]), name="x")
+    assert uploads_server.puts.count(3) == 6 and not uploads_server.posts
+    assert len(list((c.APP_DIR / "uploads").iterdir())) == 1
+
+    # so it's resumed, only uploading the missing chunk, which is retried until it succeeds
+    uploads_server.failures[3] = 2
+    uploads_server.puts.clear()
+    Resource("/files/").post_files(dict(attachments=[tmp_path / "big.bin", tmp_path / "small.csv"]), name="x")
+    assert uploads_server.puts == [3, 3, 3, 0]
+    (post,) = uploads_server.posts
+    assert post["name"] == "x" and len(post["uploads"]["attachments"]) == 2
+    uploaded = [uploads_server.uploads[x]["data"] for x in post["uploads"]["attachments"]]
+    assert uploaded == [data, b"a,b\n1,2\n"]
+    assert not list((c.APP_DIR / "uploads").iterdir())
+
+    # small uploads are sent within the request
+    Resource("/files/").post_files(dict(attachments=[tmp_path / "small.csv"]), name="y")
+    assert "uploads" not in uploads_server.posts[-1]
+
+    # as are large ones if the server doesn't support chunked uploads
+    uploads_server.chunked = False
+    Resource("/files/").post_files(dict(attachments=[tmp_path / "big.bin"]), name="z")
+    assert uploads_server.posts[-1] == dict(name="z") and uploads_server.post_fields[-1] == ["attachments", "json_data"]
+
+    # and uploads over the max size are rejected beforehand
+    uploads_server.chunked = True
+    monkeypatch.setattr(common, "SIZE_1_MB", 100)
+    with pytest.raises(ReportTooLargeError):
+        Resource("/files/").post_files(dict(attachments=[tmp_path / "big.bin"]), name="x")
+
+
+def test_chunked_upload_servers(tmp_path: Path, uploads_server):
+    """Test interrupted uploads are only resumed against the server they were started on"""
+    (tmp_path / "big.bin").write_bytes(os.urandom(10_500))
+    files = dict(attachments=[tmp_path / "big.bin"])
+    uploads_server.failures[3] = 10
+    with pytest.raises(HTTPError):
+        Resource("/files/").post_files(files, name="x")
+
+    # uploading the same file to another server starts a new upload there, sending nothing to the first
+    (other_handler, other_server) = start_uploads_server()
+    try:
+        other = dp.Client(c.Config(server=f"http://localhost:{other_server.server_address[1]}", token="other-token"))
+        (uploads_server.gets, uploads_server.puts) = ([], [])
+        Resource("/files/", client=other).post_files(files, name="x")
+        assert not uploads_server.gets and not uploads_server.puts
+        assert sorted(other_handler.puts) == list(range(11)) and len(other_handler.posts) == 1
+    finally:
+        other_server.shutdown()
+        other_server.server_close()
+
+    # whilst the upload to the first server can still be resumed
+    uploads_server.failures.clear()
+    Resource("/files/").post_files(files, name="x")
+    assert uploads_server.puts == [3] and len(uploads_server.posts) == 1
+    assert not list((c.APP_DIR / "uploads").iterdir())
+
+
+def test_post_files(tmp_path: Path, uploads_server, monkeypatch):
+    """Test uploads are sent with a Content-Length and fields within json_data, unless the server supports otherwise"""
+    (tmp_path / "data.csv").write_bytes(b"a,b\n1,2\n" * 100)
+    files = dict(attachments=[tmp_path / "data.csv"])
+    Resource("/files/").post_files(files, compress_fields=["document"], document="<Report/>", name="x")
+    assert uploads_server.posts[-1] == dict(document="<Report/>", name="x")
+    assert uploads_server.post_fields[-1] == ["attachments", "json_data"] and not uploads_server.post_streamed[-1]
+
+    monkeypatch.setattr(Resource, "upload_compressed_fields", True)
+    monkeypatch.setattr(Resource, "stream_uploads", True)
+    Resource("/files/").post_files(files, compress_fields=["document"], document="<Report/>" * 100, name="x")
+    assert uploads_server.posts[-1] == dict(name="x")
+    assert uploads_server.post_fields[-1] == ["attachments", "document", "json_data"]
+    assert uploads_server.post_streamed[-1]
+
+    # the size limit applies to the compressed body
+    monkeypatch.setattr(Resource, "stream_uploads", False)
+    monkeypatch.setattr(common, "SIZE_1_MB", 5)
+    Resource("/files/").post_files(files, name="x")
+    (tmp_path / "data.bin").write_bytes(os.urandom(1000))
+    with pytest.raises(ReportTooLargeError):
+        Resource("/files/").post_files(dict(attachments=[tmp_path / "data.bin"]), name="x")
+
+
+def test_client(uploads_server):
+    """Test clients hold their own config and pooled session, retrying idempotent requests on transient failures"""
+    server = c.config.server
+    uploads_server.uploads["x"] = dict(chunks={})
+    client = dp.Client(c.Config(server=server, token="other-token"), pool_maxsize=4, max_retries=2, backoff_factor=0)
+    res = Resource("/uploads/x/", client=client)
+    assert res.url == f"{server}/api/uploads/x/" and res.session is client.session
+
+    # objects using the default client don't change the headers of other clients
+    assert Resource("/uploads/x/").get() == dict(received=[])
+    uploads_server.failures["GET"] = 2
+    assert res.get() == dict(received=[])
+    assert uploads_server.gets == ["Token test-token"] + ["Token other-token"] * 3
+    uploads_server.failures["GET"] = 3
+    with pytest.raises(HTTPError):
+        res.get()
+
+    # the client can be shared across threads
+    uploads_server.gets.clear()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert list(executor.map(lambda _: res.get(), range(16))) == [dict(received=[])] * 16
+    assert uploads_server.gets == ["Token other-token"] * 16
+
+    # the default client follows the global config
+    default = get_client()
+    assert get_client() is default and default.config is c.config
+    c.set_config(c.Config(server=server, token="new-token"))
+    assert get_client() is not default and get_client().config is c.config
+
+
+class Upload(DPObjectRef):
+    endpoint = "/uploads/"
+    list_fields = ["name"]
+
+
+def test_async_client(uploads_server):
+    """Test async requests are made concurrently via the client's thread pool, up to its concurrency limit"""
+
+    for x in ["a", "b", "c", "d", "e"]:
+        uploads_server.uploads[x] = dict(chunks={})
+    client = dp.Client(c.config, max_concurrency=3)
+
+    async def run() -> t.List[t.Any]:
+        async with client:
+            objs = await asyncio.gather(*(Upload.aby_id(x, client=client) for x in ["a", "b", "c", "d", "e"] * 4))
+            await objs[0].arefresh()
+            listed = [x async for x in Upload.alist(client=client, page_size=2, prefetch=1)]
+            dto = await Resource("/uploads/a/").aget()
+            return [objs, listed, dto, len(client.executor._threads)]
+
+    (objs, listed, dto, n_threads) = asyncio.run(run())
+    assert len(objs) == 20 and all(x.received == [] and x.res.client is client for x in objs)
+    assert objs[-1].url.endswith("/api/uploads/e/")
+    assert listed == [dict(name=x) for x in ["a", "b", "c", "d", "e"]]
+    assert all(q["page_size"] == "2" for q in uploads_server.list_queries)
+    assert dto == dict(received=[]) and n_threads == 3
+
+
+@pytest.mark.parametrize("numbered", [True, False])
+def test_list_pages(uploads_server, numbered: bool, capsys):
+    """Test objects are listed page by page, fetching numbered pages in parallel, or else following the links"""
+    uploads_server.numbered = numbered
+    names = [f"u{i:02}" for i in range(25)]
+    for x in names:
+        uploads_server.uploads[x] = dict(chunks={})
+
+    assert list(Upload.list()) == [dict(name=x) for x in names]
+    assert len(uploads_server.list_queries) == 13
+    assert uploads_server.list_queries[0] == dict(fields="name")
+    uploads_server.list_queries.clear()
+    xs = Upload.list(page_size=10, prefetch=1)
+    assert next(xs) == dict(name="u00") and len(uploads_server.list_queries) <= 2
+    assert len(list(xs)) == 24 and len(uploads_server.list_queries) == 3
+    assert all(q["page_size"] == "10" and q["fields"] == "name" for q in uploads_server.list_queries)
+
+    # stopping early cancels the pages not yet fetched, and shuts down the fetching threads
+    uploads_server.list_queries.clear()
+    xs = Upload.list(page_size=2, prefetch=2)
+    assert next(xs) == dict(name="u00")
+    xs.close()
+    deadline = time.monotonic() + 5
+    while any(x.name.startswith("dp-list") for x in threading.enumerate()) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not any(x.name.startswith("dp-list") for x in threading.enumerate())
+    assert len(uploads_server.list_queries) <= 4
+
+    # dict fields are formatted unless streamed
+    Upload.list_fields = ["name", "meta"]
+    try:
+        assert next(Upload.list())["meta"] == json.dumps(dict(x=1), indent=True)
+        print_list(Upload, "Uploads", "jsonl", page_size=20)
+        lines = capsys.readouterr().out.splitlines()
+        assert [json.loads(x) for x in lines] == [dict(name=x, meta=dict(x=1)) for x in names]
+    finally:
+        Upload.list_fields = ["name"]
+
+
+def test_dto_cache(uploads_server):
+    """Test objects are cached by the client while fresh, then revalidated via their ETag, until changed"""
+    uploads_server.uploads["a"] = dict(chunks={})
+    client = dp.Client(c.config, dto_cache_ttl=60)
+    x = Upload.by_id("a", client=client)
+    assert Upload.by_id("a", client=client).received == [] and len(uploads_server.gets) == 1
+    assert (client.dto_cache.hits, client.dto_cache.misses) == (1, 1)
+
+    # refreshing revalidates, only fetching the object again if changed
+    x.refresh()
+    assert len(uploads_server.gets) == 2 and client.dto_cache.revalidated == 1
+    uploads_server.uploads["a"]["chunks"][0] = b""
+    x.refresh()
+    assert x.received == [0] and client.dto_cache.misses == 2
+    # clients without a ttl always revalidate, and don't use the cached objects of others
+    assert Upload.by_id("a").received == [0] and len(uploads_server.gets) == 4
+
+    # changes via the client invalidate the object
+    x.delete()
+    assert len(client.dto_cache) == 0
+    with pytest.raises(HTTPError):
+        Upload.by_id("a", client=client)
+
+    # including when cached under other urls, e.g. lookups by name
+    cache = DTOCache(max_entries=2)
+    cache.put(cache.key("/api/uploads/lookup/", dict(name="x", project=None)), Munch(id="x"), None)
+    cache.put(cache.key("/api/uploads/y/", {}), Munch(id="y"), None)
+    cache.invalidate("/api/uploads/x/")
+    assert list(cache._entries) == ["/api/uploads/y/?"]
+    cache.put("a", Munch(id="a"), None)
+    cache.put("b", Munch(id="b"), None)
+    assert list(cache._entries) == ["a", "b"]
+
+    # the stats are updated consistently across threads
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: cache.count(hits=1), range(10_000)))
+    assert cache.hits == 10_000
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """A stand-in for file storage, serving `data` with support for range requests if `ranges` is set"""
+
+    data: bytes
+    ranges: bool
+    etag: str
+    last_modified: t.Optional[str]
+    # number of times to fail requests for the range starting at the given offset
+    failures: t.Dict[int, int]
+    requests: t.List[t.Optional[str]]
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        range_header = self.headers.get("Range")
+        self.requests.append(range_header)
+        (start, end) = (0, len(self.data) - 1)
+        # only strong ETags, or the modified date, match If-Range
+        if_range = self.headers.get("If-Range")
+        validators = [x for x in [self.etag, self.last_modified] if x and not x.startswith("W/")]
+        partial = self.ranges and range_header and (if_range is None or if_range in validators)
+        if partial:
+            (start, end) = (int(x) for x in range_header.split("=")[1].split("-"))
+            if start >= len(self.data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(self.data)}")
+                self.send_header("Content-Length", "0")
+                return self.end_headers()
+        if self.failures.get(start):
+            self.failures[start] -= 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            return self.end_headers()
+
+        body = self.data[start : end + 1]
+        self.send_response(206 if partial else 200)
+        if partial:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(self.data)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Content-Disposition", 'attachment; filename="data.bin"')
+        self.send_header("ETag", self.etag)
+        if self.last_modified:
+            self.send_header("Last-Modified", self.last_modified)
+        self.send_header("Digest", f"sha-256={base64.b64encode(hashlib.sha256(self.data).digest()).decode()}")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def range_server(monkeypatch) -> t.Iterator[t.Type[RangeHandler]]:
+    handler = type(
+        "RangeHandler",
+        (RangeHandler,),
+        dict(data=os.urandom(10_500), ranges=True, etag='"v1"', last_modified=None, failures={}, requests=[]),
+    )
+    server = ThreadingHTTPServer(("localhost", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(RangedDownload, "backoff", 0.0)
+    handler.url = f"http://localhost:{server.server_address[1]}/data.bin"
+    yield handler
+    server.shutdown()
+    server.server_close()
+
+
+def test_ranged_download(tmp_path: Path, range_server, monkeypatch):
+    """Test files are downloaded in parallel ranges, resuming interrupted downloads and verifying their checksum"""
+    monkeypatch.chdir(tmp_path)
+    data = range_server.data
+    progress = []
+    fn = do_download_file(range_server.url, chunk_size=1000, on_progress=progress.append)
+    assert fn == str(tmp_path / "data.bin") and Path(fn).read_bytes() == data
+    assert range_server.requests[0] == "bytes=0-0" and len(range_server.requests) == 1 + 11 and sum(progress) == 10_500
+    assert list(tmp_path.glob("data.bin*")) == [tmp_path / "data.bin"]
+
+    # the chunk at 3000 fails more than it's retried, leaving the download incomplete
+    range_server.requests.clear()
+    range_server.failures[3000] = 10
+    with pytest.raises(HTTPError):
+        do_download_file(range_server.url, tmp_path / "x.bin", chunk_size=1000)
+    assert range_server.requests.count("bytes=3000-3999") == 6
+    assert (tmp_path / "x.bin.part").exists() and (tmp_path / "x.bin.part.json").exists()
+
+    # so it's resumed, only downloading the missing chunk
+    range_server.requests.clear()
+    range_server.failures[3000] = 1
+    do_download_file(range_server.url, tmp_path / "x.bin", chunk_size=1000)
+    assert range_server.requests == ["bytes=0-0", "bytes=3000-3999", "bytes=3000-3999"]
+    assert (tmp_path / "x.bin").read_bytes() == data and not (tmp_path / "x.bin.part").exists()
+
+    # checksums are verified
+    with pytest.raises(DownloadError):
+        do_download_file(range_server.url, tmp_path / "y.bin", sha256="00" * 32, chunk_size=1000)
+    assert not list(tmp_path.glob("y.bin*"))
+    do_download_file(range_server.url, tmp_path / "y.bin", sha256=hashlib.sha256(data).hexdigest())
+
+    # files changed since, or during, the download aren't mixed with the previous version
+    range_server.failures[3000] = 10
+    with pytest.raises(HTTPError):
+        do_download_file(range_server.url, tmp_path / "z.bin", chunk_size=1000)
+    (range_server.etag, range_server.data) = ('"v2"', os.urandom(10_500))
+    (range_server.failures, range_server.requests) = ({}, [])
+    do_download_file(range_server.url, tmp_path / "z.bin", chunk_size=1000)
+    assert (tmp_path / "z.bin").read_bytes() == range_server.data and len(range_server.requests) == 1 + 11
+    d = RangedDownload(requests.Session(), range_server.url, chunk_size=1000).probe()
+    range_server.etag = '"v3"'
+    with pytest.raises(DownloadError):
+        d.run(tmp_path / "z.bin")
+
+    # weak ETags aren't used as validators, using the modified date if any
+    range_server.etag = 'W/"v4"'
+    for last_modified in [None, "Wed, 21 Oct 2026 07:28:00 GMT"]:
+        range_server.last_modified = last_modified
+        d = RangedDownload(requests.Session(), range_server.url, chunk_size=1000).probe()
+        assert d.validator == last_modified
+        assert Path(d.run(tmp_path / "w.bin")).read_bytes() == range_server.data
+
+    # servers without support for ranges are downloaded in one request
+    range_server.ranges = False
+    range_server.requests.clear()
+    do_download_file(range_server.url, tmp_path / "z.bin", chunk_size=1000)
+    assert (tmp_path / "z.bin").read_bytes() == range_server.data and len(range_server.requests) == 2
@@ -1,18 +1,44 @@
 """Tests for the API that can run locally (due to design or mocked out)"""
+import gzip
+import io
+import json
 import os
+import re
+import shutil
+import sys
+import threading
 import typing as t
 from pathlib import Path
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from uuid import uuid4
 
 import pandas as pd
 import pytest
 from dominate.tags import h2
 from glom import glom
+from jinja2.utils import htmlsafe_json_dumps
 from lxml import etree
 from lxml.etree import DocumentInvalid
 
 import datapane as dp
+from datapane.client import config as c
+from datapane.client.api import asset_cache
+from datapane.client.api.report import processors
 from datapane.client.api.report.blocks import BaseElement, BuilderState
+from datapane.client.api.report.dev_server import DevHTTPHandler, DevServer, ReloadEvents
+from datapane.client.api.report.processors import (
+    SERVED_ASSET_STORE_DIR,
+    Server,
+    StreamingDocWriter,
+    capture_apps,
+    get_render_engine,
+    split_pages,
+)
+from datapane.client.api.report.server import MemoryCache, make_host_server, make_server
 from datapane.client.utils import DPError
+from datapane.common import report as dp_report
+from datapane.common.compression import DEFAULT_POLICY, available_encodings, compress_to
 from datapane.common.report import load_doc, validate_report_doc
 
 from ...e2e.common import gen_df, gen_plot
@@ -242,6 +268,49 @@ def test_gen_failing_reports():
         dp.App(dp.Text("a", name="3-invalid-name"))
 
 
+@pytest.mark.parametrize("strict", [False, True])
+def test_validation_modes(strict: bool, monkeypatch, datadir: Path):
+    monkeypatch.setattr(dp_report, "STRICT_VALIDATION", strict)
+    monkeypatch.setattr(dp_report, "_validated_elements", set())
+    # both modes accept the same valid reports
+    assert_report(gen_report_complex_no_files())
+    report = dp.App(
+        dp.Plot(gen_plot(), caption="Plot Asset"),
+        dp.Media(file=datadir / "datapane-logo.png"),
+        dp.Code(code="print('hello')", language="python"),
+        dp.BigNumber(heading="Tests written", value=1234, change=2, is_upward_change=True),
+        dp.DataTable(gen_df(), name="table-block"),
+    )
+    assert_report(report, 3, 6)
+
+    # and reject invalid elements and documents
+    with pytest.raises(DocumentInvalid):
+        r = dp.App(dp.Group(md_block, md_block, columns=-1))
+        dp.Processor(r)._gen_report(embedded=False, served=False, title="TITLE", description="DESCRIPTION")
+    with pytest.raises(DocumentInvalid):
+        r = dp.App(dp.Group(dp.Text("a", name="my-name"), dp.Text("b", name="my-name")))
+        dp.Processor(r)._gen_report(embedded=False, served=False, title="TITLE", description="DESCRIPTION")
+
+
+def test_validation_cache(monkeypatch, datadir: Path):
+    monkeypatch.setattr(dp_report, "_validated_elements", set())
+    validated: t.List[str] = []
+    validate_min_doc = dp_report._validate_min_doc
+    monkeypatch.setattr(dp_report, "_validate_min_doc", lambda e: validated.append(e.tag) or validate_min_doc(e))
+
+    # distinct asset blocks of the same shape are only validated once
+    media = datadir / "datapane-logo.png"
+    blocks = [dp.Media(file=media, name=f"media-{i}", caption=f"Media {i}") for i in range(5)]
+    blocks += [dp.Attachment(data=list(range(i)), filename=f"data-{i}.pkl", label=f"Data {i}") for i in range(5)]
+    assert_report(dp.App(blocks=blocks), 10)
+    assert validated.count("Media") == 1 and validated.count("Attachment") == 1
+
+    # while invalid values are still caught
+    with pytest.raises(DocumentInvalid):
+        r = dp.App(dp.Media(file=media, caption="x" * 513))
+        dp.Processor(r)._gen_report(embedded=False, served=False)
+
+
 def test_gen_report_nested_blocks():
     s = "# Test markdown block <hello/> \n Test **content**"
     report = dp.App(
@@ -291,6 +360,118 @@ def test_gen_report_with_files(datadir: Path):
     assert_report(report, 5, 23)
 
 
+def test_parallel_build():
+    def gen_report() -> dp.App:
+        return dp.App(
+            dp.Plot(gen_plot()),
+            dp.Table(gen_df()),
+            dp.DataTable(gen_df(100)),
+            dp.Attachment(data=[1, 2, 3]),
+            dp.Group(dp.Plot(gen_plot()), dp.Table(gen_df(5))),
+        )
+
+    _, serial_attachments = assert_report(gen_report(), 6)
+    with dp.parallel_build(max_workers=4):
+        report = gen_report()
+    _, attachments = assert_report(report, 6)
+    # attachments remain in document order
+    assert [a.suffixes for a in attachments] == [a.suffixes for a in serial_attachments]
+    # building doesn't change the blocks, e.g. to default the attachment's filename
+    attachment = report.pages[0].blocks[3]
+    assert "filename" not in attachment._attributes and attachment._fingerprint() == attachment._cached_fingerprint()
+    assert f'filename="{attachment.file.name}"' in element_to_str(attachment)
+
+    # matplotlib figures are saved on the calling thread, as pyplot isn't thread-safe
+    import matplotlib.pyplot as plt
+
+    fig, _ = plt.subplots()
+    with dp.parallel_build():
+        plot = dp.Plot(fig)
+        assert plot.is_serialized
+        with dp.lazy_build():
+            lazy_plot = dp.Plot(fig)
+        assert_report(dp.App(lazy_plot), 1)
+    plt.close(fig)
+
+    # failures are collected and reported per-block when building
+    with dp.parallel_build():
+        report = dp.App(dp.Plot(gen_plot()), dp.Table(gen_df(1000), name="big-table"))
+    with pytest.raises(DPError, match="Table 'big-table'"):
+        assert_report(report)
+
+
+def test_incremental_build():
+    groups = [
+        dp.Group(dp.Text(f"Text {i}"), dp.BigNumber(heading="Value", value=i), dp.Plot(gen_plot())) for i in range(5)
+    ]
+    report = dp.App(blocks=groups)
+
+    def build() -> t.Tuple[str, t.List[Path]]:
+        return dp.Processor(report)._gen_report(embedded=False, served=False)
+
+    first = build()
+    cache = report._build_cache
+    # layout blocks are cached once the app is rebuilt
+    assert build() == first
+    assert (cache.hits, cache.misses) == (0, 6)
+    # unchanged apps reuse the previous document
+    assert build() == first
+    assert (cache.hits, cache.misses) == (0, 6)
+
+    # only changed subtrees are rebuilt, along with any later assets as they're renumbered
+    groups[1].blocks[0] = dp.Text("Changed text")
+    groups[3].blocks.append(dp.Plot(gen_plot()))
+    report_str, attachments = build()
+    assert (cache.hits, cache.misses) == (2, 10)
+
+    # and the output matches a fresh build
+    fresh_str, fresh_attachments = dp.Processor(dp.App(blocks=groups))._gen_report(embedded=False, served=False)
+    assert report_str == fresh_str
+    assert attachments == fresh_attachments
+
+    # documents with inlined assets aren't cached
+    cache.doc = None
+    for _ in range(2):
+        dp.Processor(report)._gen_report(embedded=True, served=False)
+    assert cache.doc is None
+    assert (cache.hits, cache.misses) == (2, 10)
+
+
+def test_deeply_nested_report():
+    # blocks are built iteratively, so aren't limited by the recursion limit
+    depth = sys.getrecursionlimit() * 2
+    block = dp.Text("Nested text")
+    for _ in range(depth):
+        block = dp.Group(block)
+    processor = dp.Processor(dp.App(block))
+
+    # build multiple times to also build via the cache
+    for _ in range(3):
+        report_doc, _ = processor._to_xml(embedded=False, served=False)
+        assert int(report_doc.xpath("count(//Group)")) == depth
+        assert report_doc.xpath("//Text/text()") == ["Nested text"]
+
+
+def test_lazy_build():
+    with dp.lazy_build():
+        plot = dp.Plot(gen_plot())
+        table = dp.Table(gen_df())
+        discarded = dp.DataTable(gen_df(100))
+    assert not any(b.is_serialized for b in (plot, table, discarded))
+
+    # only the blocks used in the app are serialised, on build
+    report = dp.App(dp.Group(plot, table))
+    assert_report(report, 2)
+    assert plot.is_serialized and table.is_serialized
+    assert not discarded.is_serialized
+
+    # deferred assets are serialised concurrently when built within a parallel context
+    with dp.lazy_build():
+        report = dp.App(dp.Plot(gen_plot()), dp.DataTable(gen_df(100)), dp.Attachment(data=[1, 2, 3]))
+    with dp.parallel_build():
+        assert_report(report, 3)
+
+
 ################################################################################
 # Local saving
 @pytest.mark.skipif("CI" in os.environ, reason="Currently depends on building fe-components first")
@@ -305,3 +486,340 @@ def test_local_report_with_files(datadir: Path, monkeypatch):  # noqa: ANN
     monkeypatch.chdir(datadir)
     report = gen_report_complex_with_files(datadir, local_report=True)
     report.save(path="test_out.html", name="Even better report")
+
+
+def test_render_engine(tmp_path: Path):
+    (tmp_path / "datapane-logo-dark.png").write_bytes(b"logo")
+    (tmp_path / "template.html").write_text('<img src="{{ dp_logo }}"/><script>{{ include_raw("app.js") }}</script>')
+    bundle = tmp_path / "app.js"
+    bundle.write_text("let x = '{{ y }}</script>';")
+
+    # engines, templates and static fragments are shared across renders
+    engine = get_render_engine(tmp_path)
+    assert get_render_engine(tmp_path) is engine
+    template = engine.get_template("template.html")
+    assert engine.get_template("template.html") is template
+    out = template.render(dp_logo=engine.logo)
+    assert out == "<img src=\"data:image/png;base64,bG9nbw==\"/><script>let x = '{{ y }}<\\\\/script>';</script>"
+    assert engine.include_raw("app.js") is engine.include_raw("app.js")
+
+    # and reloaded when changed on disk
+    bundle.write_text("let x = 2;")
+    os.utime(bundle, ns=(0, 0))
+    assert template.render(dp_logo="") == '<img src=""/><script>let x = 2;</script>'
+
+
+@pytest.mark.skipif("CI" in os.environ, reason="Currently depends on building fe-components first")
+def test_incremental_server_build(tmp_path: Path, datadir: Path):
+    def build(app: dp.App) -> t.Dict[str, int]:
+        dp.build(app, dest=tmp_path, compress_assets=True, overwrite=True)
+        return {
+            str(f.relative_to(tmp_path / "app")): f.stat().st_ino for f in (tmp_path / "app").rglob("*") if f.is_file()
+        }
+
+    df = gen_df()
+    files_1 = build(dp.App(dp.DataTable(df), dp.Plot(gen_plot()), dp.Media(file=datadir / "datapane-logo.png")))
+    # only assets worth compressing have compressed variants
+    n_variants = len(available_encodings())
+    data_files = [f for f in files_1 if f.startswith("data/")]
+    assets = [f for f in data_files if Path(f).suffix not in (".gz", ".br", ".zst")]
+    compressed = [f for f in assets if DEFAULT_POLICY.file_levels(tmp_path / "app" / f)]
+    assert len(assets) == 3 and any(".arrow" in f for f in compressed) and not any(".png" in f for f in compressed)
+    assert len(data_files) == 3 + len(compressed) * n_variants
+
+    # unchanged files are reused, and the removed plot deleted
+    files_2 = build(dp.App(dp.DataTable(df)))
+    data_1 = {files_1[f] for f in files_1 if f.startswith("data/")}
+    data_2 = {files_2[f] for f in files_2 if f.startswith("data/")}
+    assert len(data_2) == 1 + n_variants and data_2 < data_1
+    static_1 = {f: i for (f, i) in files_1.items() if f.startswith("static/")}
+    assert static_1 and static_1 == {f: i for (f, i) in files_2.items() if f.startswith("static/")}
+    assert files_1["index.html"] != files_2["index.html"]
+
+    # changed files are rewritten
+    (tmp_path / "app" / "static" / "vue.esm-browser.prod.js").write_text("changed")
+    files_3 = build(dp.App(dp.DataTable(gen_df(5))))
+    assert files_3["static/vue.esm-browser.prod.js"] != files_2["static/vue.esm-browser.prod.js"]
+    assert not {files_3[f] for f in files_3 if f.startswith("data/")} & data_2
+
+
+@pytest.mark.skipif("CI" in os.environ, reason="Currently depends on building fe-components first")
+def test_content_addressed_assets(tmp_path: Path):
+    df = gen_df()
+    dp.build(dp.App(dp.DataTable(df), dp.DataTable(df)), name="app_1", dest=tmp_path)
+    dp.build(dp.App(dp.DataTable(df), dp.Plot(gen_plot())), name="app_2", dest=tmp_path)
+
+    # identical assets are named by their contents, and shared across apps
+    (table_1,) = (tmp_path / "app_1" / "data").iterdir()
+    table_2 = tmp_path / "app_2" / "data" / table_1.name
+    assert table_1.stat().st_ino == table_2.stat().st_ino
+    assert f"/data/{table_1.name}" in (tmp_path / "app_1" / "index.html").read_text()
+
+    # and removed from the store once unused, including by removed apps
+    store = c.APP_DIR / SERVED_ASSET_STORE_DIR
+    dp.build(dp.App(dp.Plot(gen_plot())), name="app_2", dest=tmp_path, overwrite=True)
+    shutil.rmtree(tmp_path / "app_1")
+    dp.build(dp.App(dp.Plot(gen_plot())), name="app_1", dest=tmp_path)
+    assert [f.suffix for f in store.iterdir() if f.is_file()] == [".json"]
+
+
+@pytest.mark.skipif("CI" in os.environ, reason="Currently depends on building fe-components first")
+def test_asset_store_copies(tmp_path: Path, monkeypatch):
+    # assets copied into apps, e.g. when the store is on another filesystem, are kept whilst used
+    monkeypatch.setattr(processors, "link_or_copy", shutil.copyfile)
+    dp.build(dp.App(dp.DataTable(gen_df())), name="app", dest=tmp_path)
+    (table,) = (tmp_path / "app" / "data").iterdir()
+    assert (c.APP_DIR / SERVED_ASSET_STORE_DIR / table.name).exists()
+    dp.build(dp.App(dp.Text("No assets")), name="app", dest=tmp_path, overwrite=True)
+    assert not (c.APP_DIR / SERVED_ASSET_STORE_DIR / table.name).exists()
+
+
+def test_lazy_pages(tmp_path: Path):
+    app = dp.App(
+        dp.Page(dp.Text("Page 1 text"), dp.Plot(gen_plot()), title="First"),
+        dp.Page(dp.Text("Page 2 text"), dp.DataTable(gen_df()), title="Second"),
+        dp.Page(dp.Text("Page 3 text"), title="Third"),
+    )
+    processor = Server(app)
+    report_doc, _ = processor._gen_report_doc(embedded=False, served=True)
+    full_doc = etree.tounicode(report_doc)
+    dp.build(app, dest=tmp_path, lazy_pages=True)
+
+    # only the first page is included in the document, with the rest as assets loaded on demand
+    index = (tmp_path / "app" / "index.html").read_text()
+    assert "Page 1 text" in index and "Page 2 text" not in index and "Page 3 text" not in index
+    srcs = re.findall(r'label=\\"(\w+)\\" src=\\"/data/(\w+\.xml)\\"', index)
+    assert [label for (label, _) in srcs] == ["Second", "Third"]
+    pages = [load_doc((tmp_path / "app" / "data" / src).read_text()) for (_, src) in srcs]
+    assert [p.tag for p in pages] == ["Page", "Page"]
+    assert "Page 2 text" in etree.tounicode(pages[0]) and pages[0].find("DataTable") is not None
+    # along with the figure counts of the pages before each, to number their figures
+    placeholders = split_pages(report_doc, lambda x: "").findall("Pages/Page[@src]")
+    assert [json.loads(p.get("counts")) for p in placeholders] == [
+        dict(plots=1, tables=0, formulas=0, codeBlocks=0),
+        dict(plots=1, tables=1, formulas=0, codeBlocks=0),
+    ]
+
+    # the document itself is unchanged, as it may be reused
+    assert etree.tounicode(report_doc) == full_doc
+
+
+def test_streamed_report_doc(datadir: Path):
+    """Streaming the document and its assets must match the JSON-encoded inlined document"""
+    report = dp.App(md_block, dp.Text("Unicode 😀 & <escaped/> 'text'"), dp.Media(file=datadir / "datapane-logo.png"))
+    processor = dp.Processor(report)
+    report_str, _ = processor._gen_report(embedded=True, served=False)
+
+    stream_id = uuid4().hex
+    report_doc, assets = processor._gen_report_doc(embedded=True, served=False, stream_id=stream_id)
+    assert len(assets) == 1
+
+    def strip_timestamp(x: str) -> str:
+        return re.sub(r"<CreatedOn>.*</CreatedOn>", "", x)
+
+    expected = strip_timestamp(htmlsafe_json_dumps(report_str))
+
+    out = io.StringIO()
+    StreamingDocWriter(out, assets, stream_id).write_doc(report_doc)
+    assert strip_timestamp(out.getvalue()) == expected
+
+    # feed byte-by-byte to split placeholders and multi-byte characters across writes
+    out = io.StringIO()
+    writer = StreamingDocWriter(out, assets, stream_id)
+    doc_bytes = etree.tostring(report_doc, encoding="utf-8")
+    for i in range(len(doc_bytes)):
+        writer.write(doc_bytes[i : i + 1])
+    writer._flush(final=True)
+    assert strip_timestamp(f'"{out.getvalue()}"') == expected
+
+
+################################################################################
+# Local serving
+@pytest.fixture
+def app_server(tmp_path: Path) -> t.Iterator[t.Tuple[str, Path]]:
+    (tmp_path / "index.html").write_text("<html></html>")
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "media.bin").write_bytes(bytes(range(256)) * 4)
+    (tmp_path / "data" / "table.csv").write_bytes(b"a,b\n1,2\n")
+    compress_to(tmp_path / "data" / "table.csv", tmp_path / "data" / "table.csv.gz", "gzip")
+
+    server = make_server(tmp_path, port=0, immutable_prefix="/data/")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://localhost:{server.server_address[1]}", tmp_path
+    server.shutdown()
+    server.server_close()
+
+
+def fetch(url: str, **headers: str) -> t.Tuple[int, t.Dict[str, str], bytes]:
+    try:
+        with urlopen(Request(url, headers=headers)) as r:
+            return r.status, dict(r.headers), r.read()
+    except HTTPError as e:
+        return e.code, dict(e.headers), e.read()
+
+
+def test_server_conditional_get(app_server):
+    url, _ = app_server
+    status, headers, body = fetch(f"{url}/")
+    assert status == 200 and body == b"<html></html>"
+    assert headers["Cache-Control"] == "no-cache"
+    assert "immutable" in fetch(f"{url}/data/media.bin")[1]["Cache-Control"]
+
+    assert fetch(f"{url}/", **{"If-None-Match": headers["ETag"]})[0] == 304
+    assert fetch(f"{url}/", **{"If-Modified-Since": headers["Last-Modified"]})[0] == 304
+    assert fetch(f"{url}/", **{"If-None-Match": '"other"'})[0] == 200
+
+
+def test_server_ranges(app_server):
+    url, path = app_server
+    data = (path / "data" / "media.bin").read_bytes()
+    status, headers, body = fetch(f"{url}/data/media.bin", Range="bytes=10-19")
+    assert status == 206 and body == data[10:20]
+    assert headers["Content-Range"] == "bytes 10-19/1024"
+
+    assert fetch(f"{url}/data/media.bin", Range="bytes=-4")[2] == data[-4:]
+    assert fetch(f"{url}/data/media.bin", Range="bytes=1000-")[2] == data[1000:]
+    assert fetch(f"{url}/data/media.bin", Range="bytes=2000-")[0] == 416
+    # multiple or stale ranges return the full file
+    assert fetch(f"{url}/data/media.bin", Range="bytes=0-1,4-5")[2] == data
+    assert fetch(f"{url}/data/media.bin", Range="bytes=0-1", **{"If-Range": '"stale"'})[2] == data
+
+
+def test_server_encoding(app_server):
+    url, path = app_server
+    status, headers, body = fetch(f"{url}/data/table.csv", **{"Accept-Encoding": "gzip, deflate"})
+    assert headers["Content-Encoding"] == "gzip" and headers["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(body) == b"a,b\n1,2\n"
+
+    # sent as-is to clients that don't accept gzip
+    for accept in ("identity", "gzip;q=0", ""):
+        status, headers, body = fetch(f"{url}/data/table.csv", **{"Accept-Encoding": accept})
+        assert status == 200 and "Content-Encoding" not in headers
+        assert body == b"a,b\n1,2\n"
+
+    # files without variants are never encoded
+    assert "Content-Encoding" not in fetch(f"{url}/data/media.bin", **{"Accept-Encoding": "gzip"})[1]
+
+
+def test_capture_apps(tmp_path: Path):
+    app = dp.App(md_block)
+    with capture_apps() as apps:
+        dp.save_report(app, path=str(tmp_path / "app.html"))
+        dp.build(app, dest=tmp_path)
+    assert apps == [app, app]
+    assert not (tmp_path / "app.html").exists() and not (tmp_path / "app").exists()
+
+
+def test_dev_server(tmp_path: Path):
+    (tmp_path / "title.txt").write_text("First")
+    script = tmp_path / "dp_report.py"
+    script.write_text(
+        "from pathlib import Path\n"
+        "import datapane as dp\n"
+        "title = (Path(__file__).parent / 'title.txt').read_text()\n"
+        "dp.save_report(dp.App(dp.Text(f'# {title}'), dp.Group(dp.Text(dp.Params['text']))), path='app.html')\n"
+    )
+    server = DevServer(script, params=dict(text="Hello"))
+    assert server.run() and server.events.version == 1
+    html = (server.path / "index.html").read_text()
+    assert "First" in html and "Hello" in html and "EventSource" in html
+    assert not (tmp_path / "app.html").exists()
+    assert str(tmp_path / "title.txt") in server._watched and not server.changed()
+
+    # changes to the inputs are picked up, reusing the unchanged blocks
+    (tmp_path / "title.txt").write_text("Second")
+    os.utime(tmp_path / "title.txt", ns=(0, 0))
+    assert server.changed() == [str(tmp_path / "title.txt")]
+    assert server.run() and "Second" in (server.path / "index.html").read_text()
+    assert server.build_cache.hits > 0
+
+    # errors keep the previous build, including exiting with an error
+    script.write_text("raise ValueError()")
+    assert not server.run() and server.events.version == 2
+    script.write_text("import sys\nsys.exit(1)")
+    assert not server.run() and server.events.version == 2
+    assert "Second" in (server.path / "index.html").read_text()
+    # whereas exiting successfully builds the app
+    script.write_text(
+        "import sys\nimport pandas as pd\nimport datapane as dp\n"
+        "dp.save_report(dp.App(dp.Text('Third'), dp.DataTable(pd.DataFrame({'x': [1]}))), 'app.html')\nsys.exit()"
+    )
+    assert server.run() and "Third" in (server.path / "index.html").read_text()
+    # the asset cache is only used whilst running the script
+    assert asset_cache._asset_cache is None and server.asset_cache.stats.misses > 0
+
+
+def test_dev_server_events(tmp_path: Path):
+    events = ReloadEvents()
+    server = make_server(tmp_path, port=0, handler=DevHTTPHandler, events=events)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with urlopen(f"http://localhost:{server.server_address[1]}/_dp/events") as r:
+            assert r.headers["Content-Type"] == "text/event-stream"
+            events.notify()
+            assert r.readline() == b"data: reload\n"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_host_server(tmp_path: Path):
+    df = gen_df()
+    dp.build(dp.App(dp.DataTable(df), dp.Text("First")), name="first", dest=tmp_path, bundle=False)
+    dp.build(dp.App(dp.DataTable(df), dp.Text("Second")), name="second", dest=tmp_path)
+    assert not (tmp_path / "first" / "static").exists() and (tmp_path / "second" / "static").exists()
+
+    bundle = {str(k): v for (k, v) in Server.shared_bundle().items()}
+    cache = MemoryCache(max_size=1024 * 1024)
+    server = make_host_server(
+        {"first": tmp_path / "first", "/b/second/": tmp_path / "second"},
+        shared=bundle,
+        port=0,
+        immutable_prefix="/data/",
+        memory_cache=cache,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://localhost:{server.server_address[1]}"
+    try:
+        index = fetch(f"{url}/")[2].decode()
+        assert 'href="/first/"' in index and 'href="/b/second/"' in index
+        assert b"First" in fetch(f"{url}/first/")[2] and b"Second" in fetch(f"{url}/b/second/")[2]
+        assert fetch(f"{url}/first")[0] == 200
+
+        # the bundle is shared, and content-addressed assets served from any app
+        vue = (Server.assets / "vue.esm-browser.prod.js").read_bytes()
+        assert fetch(f"{url}/first/static/vue.esm-browser.prod.js")[2] == vue
+        assert fetch(f"{url}/first/static/app/index.es.js")[0] == 200
+        (asset,) = (tmp_path / "first" / "data").iterdir()
+        status, headers, body = fetch(f"{url}/data/{asset.name}")
+        assert status == 200 and body == asset.read_bytes() and "immutable" in headers["Cache-Control"]
+        assert fetch(f"{url}/other/")[0] == 404 and fetch(f"{url}/first/../second/index.html")[0] == 404
+
+        # repeated requests are served from memory
+        fetch(f"{url}/data/{asset.name}")
+        assert cache.hits > 0 and 0 < cache.size <= cache.max_size
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_memory_cache(tmp_path: Path):
+    cache = MemoryCache(max_size=10, max_file_size=6)
+    for (name, data) in [("a", b"aaaa"), ("b", b"bbbb"), ("c", b"cccc"), ("big", b"x" * 7)]:
+        (tmp_path / name).write_bytes(data)
+    assert cache.get(tmp_path / "a")[0] == b"aaaa" and cache.get(tmp_path / "b")
+    assert cache.get(tmp_path / "big") is None
+    # least recently used files are evicted when full
+    cache.get(tmp_path / "a")
+    cache.get(tmp_path / "c")
+    assert cache.size == 8 and (cache.hits, cache.misses) == (1, 3)
+    cache.get(tmp_path / "b")
+    assert cache.misses == 4
+
+    # changed files are reread
+    (tmp_path / "c").write_bytes(b"changed")
+    os.utime(tmp_path / "c", ns=(0, 0))
+    assert cache.get(tmp_path / "c") is None
+    (tmp_path / "c").write_bytes(b"cc")
+    os.utime(tmp_path / "c", ns=(1, 1))
+    assert cache.get(tmp_path / "c")[0] == b"cc"
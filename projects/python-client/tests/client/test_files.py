@@ -12,6 +12,7 @@ from bokeh.models import ColumnDataSource
 from bokeh.plotting import figure
 from pandas.io.formats.style import Styler
 
+import datapane as dp
 from datapane.client.api.files import save
 
 data = pd.DataFrame({"x": np.random.randn(20), "y": np.random.randn(20)})
@@ -94,3 +95,55 @@ def test_save_table(tmp_path: Path):
     save(data)
     # save styled table
     save(Styler(data))
+
+
+def test_asset_cache(tmp_path: Path, monkeypatch):
+    from datapane.client import config as c
+    from datapane.client.api.asset_cache import lib_versions
+    from datapane.client.api.dp_object import save_df
+    from datapane.common import ArrowFormat
+
+    cache = dp.enable_asset_cache(tmp_path / "cache", max_size=10 * 1024 * 1024)
+    try:
+        df = pd.DataFrame({"x": range(50), "y": [f"v{i}" for i in range(50)]})
+        f1 = save_df(df)
+        f2 = save_df(df.copy())
+        assert f1.file != f2.file and f1.file.read_bytes() == f2.file.read_bytes()
+        # same data, different writer
+        save(df.head())
+        # changed data
+        save_df(df.assign(x=df.x + 1))
+        # uncacheable objects bypass the cache
+        save(folium.Map())
+        assert (cache.stats.hits, cache.stats.misses) == (1, 3)
+        assert len(list(cache.path.iterdir())) == 3
+
+        # least-recently used entries are evicted once over the max size
+        cache.max_size = f1.file.stat().st_size
+        save_df(df.assign(x=df.x + 2))
+        assert cache.stats.evictions > 0
+        assert sum(f.stat().st_size for f in cache.path.iterdir()) <= cache.max_size
+        # outputs are copies, so are unaffected by eviction, and changing them doesn't affect the cache
+        assert f2.file.exists()
+        f3 = save_df(df.assign(x=df.x + 2))
+        data = f3.file.read_bytes()
+        f3.file.write_bytes(b"changed")
+        assert save_df(df.assign(x=df.x + 2)).file.read_bytes() == data
+    finally:
+        dp.disable_asset_cache()
+
+    # the cache is keyed by the versions of the libraries that serialise the assets
+    key = cache.key(df, ArrowFormat)
+    monkeypatch.setattr(pd, "__version__", "0.0.0")
+    lib_versions.cache_clear()
+    try:
+        assert cache.key(df, ArrowFormat) != key
+    finally:
+        monkeypatch.undo()
+        lib_versions.cache_clear()
+
+    # and stored in the config directory, unless overridden
+    assert dp.enable_asset_cache().path == c.APP_DIR / "asset-cache"
+    monkeypatch.setenv("DATAPANE_ASSET_CACHE_DIR", str(tmp_path / "env-cache"))
+    assert dp.enable_asset_cache().path == tmp_path / "env-cache"
+    dp.disable_asset_cache()
@@ -0,0 +1,69 @@
+import gzip
+import os
+from pathlib import Path
+
+from datapane.common import compression
+from datapane.common.compression import (
+    ENCODING_LEVELS,
+    FAST_ENCODING_LEVELS,
+    STRONG_ENCODING_LEVELS,
+    CompressionPolicy,
+    available_encodings,
+    compress_to,
+    compressor,
+    entropy,
+    is_compressible,
+    sample_entropy,
+    variant_path,
+)
+
+
+def test_compression(tmp_path: Path):
+    assert is_compressible(Path("x.arrow")) and is_compressible(Path("x.vl.json")) and is_compressible(Path("x.svg"))
+    assert not is_compressible(Path("x.png")) and not is_compressible(Path("x.mp4"))
+    assert not is_compressible(Path("x.zip"))
+
+    src = tmp_path / "x.csv"
+    src.write_bytes(b"a,b\n" * 1000)
+    for encoding in available_encodings():
+        stats = compress_to(src, variant_path(src, encoding), encoding)
+        assert stats.size == 4000 and 0 < stats.compressed_size < stats.size and stats.saved > 0
+    assert gzip.decompress(variant_path(src, "gzip").read_bytes()) == src.read_bytes()
+
+
+def test_compression_policy(tmp_path: Path):
+    assert entropy(b"") == 0 and entropy(b"a" * 100) == 0 and entropy(os.urandom(64 * 1024)) > 7.9
+    (tmp_path / "random.bin").write_bytes(os.urandom(64 * 1024))
+    (tmp_path / "x.png").write_bytes(b"\0" * 4096)
+    (tmp_path / "tiny.csv").write_text("a,b\n")
+    (tmp_path / "small.csv").write_text("a,b\n1,2\n" * 1000)
+    assert 0 < sample_entropy(tmp_path / "small.csv") < 3
+
+    # incompressible files aren't compressed, small compressible ones are compressed strongly
+    policy = CompressionPolicy()
+    for f in ["random.bin", "x.png", "tiny.csv"]:
+        assert policy.file_levels(tmp_path / f) is None and policy.choose_file(tmp_path / f, ["gzip"]) is None
+    assert policy.file_levels(tmp_path / "small.csv") == STRONG_ENCODING_LEVELS
+    assert policy.choose_file(tmp_path / "small.csv", ["zip", "gzip"]) == ("gzip", STRONG_ENCODING_LEVELS["gzip"])
+    assert policy.choose_file(tmp_path / "small.csv", ["zip"]) is None
+    # and large ones at the defaults, or quickly if they have higher entropy
+    assert CompressionPolicy(strong_max_size=1024).file_levels(tmp_path / "small.csv") == ENCODING_LEVELS
+    assert CompressionPolicy(strong_max_entropy=1).file_levels(tmp_path / "small.csv") == FAST_ENCODING_LEVELS
+    assert policy.choose_data(b"<Report/>" * 100, ["gzip"]) == ("gzip", STRONG_ENCODING_LEVELS["gzip"])
+
+    data = (tmp_path / "small.csv").read_bytes()
+    for encoding in available_encodings():
+        for levels in [FAST_ENCODING_LEVELS, STRONG_ENCODING_LEVELS]:
+            c = compressor(encoding, levels[encoding])
+            compressed = c.compress(data) + c.flush()
+            assert len(compressed) < len(data)
+    c = compressor("gzip", 1)
+    assert gzip.decompress(c.compress(data) + c.flush()) == data
+
+    # the entropy of each file is sampled once, until it changes
+    compression._sample_entropy_cached.cache_clear()
+    for _ in range(2):
+        policy.file_levels(tmp_path / "small.csv")
+    assert compression._sample_entropy_cached.cache_info().misses == 1
+    (tmp_path / "small.csv").write_bytes(os.urandom(4096))
+    assert policy.file_levels(tmp_path / "small.csv") is None
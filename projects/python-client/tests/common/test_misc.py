@@ -1,8 +1,13 @@
+import os
+from base64 import b64encode
+from pathlib import Path
+
 import pytest
 from packaging.version import Version
 
 from datapane.common import config as c
 from datapane.common import versioning as v
+from datapane.common.utils import B64_CHUNK_SIZE, b64_encode_file, content_addressed_name, iter_b64_file
 
 
 def test_encode_decode():
@@ -30,3 +35,37 @@ def test_version():
         v.is_version_compatible(provider_v_in="0.2.0", consumer_v_in="0.1.8")
     with pytest.raises(v.VersionMismatch):
         v.is_version_compatible(provider_v_in="2.1.0", consumer_v_in="1.1.0")
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, B64_CHUNK_SIZE - 1, B64_CHUNK_SIZE, 2 * B64_CHUNK_SIZE + 1])
+def test_b64_encode_file(tmp_path: Path, size: int):
+    """Chunked encoding must match encoding the whole file at once"""
+    fn = tmp_path / "data.bin"
+    data = os.urandom(size)
+    fn.write_bytes(data)
+    expected = b64encode(data).decode("ascii")
+
+    assert b"".join(iter_b64_file(fn)).decode("ascii") == expected
+    assert b"".join(iter_b64_file(fn, chunk_size=3)).decode("ascii") == expected
+    assert b64_encode_file(fn, prefix="data:x;base64,") == f"data:x;base64,{expected}"
+
+
+@pytest.mark.parametrize(
+    "name,ext",
+    [
+        ("data.csv", ".csv"),
+        ("archive.tar.gz", ".tar.gz"),
+        ("plot.vl.json", ".vl.json"),
+        ("q3. final report.csv", ".csv"),
+        ("notes.final draft", ""),
+        ("README", ""),
+    ],
+)
+def test_content_addressed_name(tmp_path: Path, name: str, ext: str):
+    f = tmp_path / name
+    f.write_text("contents")
+    ca_name = content_addressed_name(f)
+    assert ca_name.endswith(ext) and len(ca_name) == 32 + len(ext)
+    # named by contents only
+    (tmp_path / "other").write_text("contents")
+    assert content_addressed_name(tmp_path / "other") == ca_name[:32]
@@ -99,10 +99,21 @@ export class Report {
 export class Page {
     public children: LayoutBlock[];
     public label?: string;
+    /* URL of the serialised page, for pages that are loaded on demand */
+    public src?: string;
+    /* Figure counts of the preceding pages, to number the figures of a page loaded on demand */
+    public counts?: Record<string, number>;
 
-    public constructor(o: { children: LayoutBlock[]; label?: string }) {
+    public constructor(o: {
+        children: LayoutBlock[];
+        label?: string;
+        src?: string;
+        counts?: Record<string, number>;
+    }) {
         this.children = o.children;
         this.label = o.label;
+        this.src = o.src;
+        this.counts = o.counts;
     }
 }
 
@@ -25,11 +25,19 @@ import {
     BigNumberBlock,
     isLayoutBlock,
 } from "./blocks";
+import axios from "axios";
 import convert from "xml-js";
 import * as maps from "./test-maps";
 import { DataTableBlock } from "./datatable/datatable-block";
 import { AppViewMode, ReportProps, ReportStoreState } from "./types";
 
+type FigureCounts = {
+    plots: number;
+    tables: number;
+    formulas: number;
+    codeBlocks: number;
+};
+
 type BlockTest = {
     class_: typeof Block;
     test: (elem: Elem) => boolean;
@@ -98,7 +106,7 @@ export class ReportStore {
     private readonly isLightProse: boolean;
     private readonly isOrg: boolean;
 
-    private counts = {
+    private counts: FigureCounts = {
         plots: 0,
         tables: 0,
         formulas: 0,
@@ -140,6 +148,19 @@ export class ReportStore {
         return this.deserialize(getElementByName(root, "Pages"));
     }
 
+    public async loadPage(page: Page): Promise<void> {
+        /**
+         * Fetch and deserialize the contents of a page that's loaded on demand,
+         * numbering its figures from the counts of the pages before it, as computed when built
+         */
+        if (!page.src) return;
+        const res = await axios.get(page.src, { responseType: "text" });
+        const json: any = convert.xml2js(res.data, { compact: false });
+        if (page.counts) this.counts = { ...(page.counts as FigureCounts) };
+        page.children = this.deserializePage(getElementByName(json, "Page"));
+        page.src = undefined;
+    }
+
     private updateFigureCount(elemName: string): number {
         /**
          * Updates and returns the relevant count to be displayed in block captions
@@ -165,10 +186,14 @@ export class ReportStore {
         const pages: Page[] = [];
         elem.elements &&
             elem.elements.forEach((e) => {
+                const { label, src, counts } = getAttributes(e);
                 pages.push(
                     new Page({
-                        label: getAttributes(e).label,
-                        children: this.deserializePage(e),
+                        label,
+                        // pages with a `src` are placeholders, loaded on demand via `loadPage`
+                        children: src ? [] : this.deserializePage(e),
+                        src,
+                        counts: counts && JSON.parse(counts),
                     })
                 );
             });